@@ -1,15 +1,64 @@
+import time
+from typing import Optional
 
+from cachetools import TTLCache
 from fastapi import HTTPException, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from starlette.requests import Request
 
 from app.auth.exceptions import UserNotFound
 from app.auth.jwt import AccessToken
-from app.auth.service import find_user_by_email
+from app.auth.repository import find_principal_by_email
 from app.auth.schemas import UserReadSchema, TokenData
 from app import messages
+from app.config import get_settings
+from app.custom_fields import PyObjectId
 from app.logger import get_logger
 
+settings = get_settings()
+
+principal_cache = TTLCache(maxsize=settings.PRINCIPAL_CACHE_MAX_SIZE, ttl=max(settings.PRINCIPAL_CACHE_TTL_SECONDS, 1))
+
+
+def get_cached_principal(token: str) -> Optional[UserReadSchema]:
+    """
+    Returns cached user data for token, if token is cached and not expired
+    :param token: JWT token
+    :return: user data or None
+    """
+    cached_principal = principal_cache.get(token)
+    if cached_principal is None:
+        return None
+
+    principal, token_expiration = cached_principal
+    if token_expiration is not None and token_expiration <= time.time():
+        principal_cache.pop(token, None)
+        return None
+    return principal
+
+
+def cache_principal(token: str, principal: UserReadSchema, token_expiration: Optional[float]) -> None:
+    """
+    Caches user data for token. Cached data never outlives token expiration
+    :param token: JWT token
+    :param principal: user data
+    :param token_expiration: token expiration timestamp
+    :return: None
+    """
+    if settings.PRINCIPAL_CACHE_TTL_SECONDS > 0:
+        principal_cache[token] = (principal, token_expiration)
+
+
+def evict_cached_principal(user_id: PyObjectId) -> None:
+    """
+    Removes cached data of user for all its tokens, so changed user is read from database on the next request
+    :param user_id: id of changed user
+    :return: None
+    """
+    for token, (principal, _) in list(principal_cache.items()):
+        if principal.id == user_id:
+            principal_cache.pop(token, None)
+
 
 class JWTBearer(HTTPBearer):
     def __init__(self, auto_error: bool = True):
@@ -21,47 +70,61 @@ class JWTBearer(HTTPBearer):
         if credentials:
             if not credentials.scheme == "Bearer":
                 raise HTTPException(status_code=403, detail="Invalid authentication scheme.")
-            if not self.verify_jwt(credentials.credentials):
-                raise HTTPException(status_code=403, detail=messages.TOKEN_DECODE_ERROR)
+            if get_cached_principal(credentials.credentials) is None:
+                payload = self.decode_jwt(credentials.credentials)
+                if payload is None:
+                    raise HTTPException(status_code=403, detail=messages.TOKEN_DECODE_ERROR)
+                request.state.token_payload = payload
             return credentials.credentials
         else:
             raise HTTPException(status_code=403, detail="Invalid authorization code.")
 
     @staticmethod
-    def verify_jwt(token: str) -> bool:
+    def decode_jwt(token: str) -> Optional[dict]:
         """
-        Checks that token is valid and unexpired
-        :param token: jwt token that will be checked
-        :return: returns result of the check
+        Decodes token if it is valid and unexpired
+        :param token: jwt token that will be decoded
+        :return: token payload or None if token is invalid
         """
-        is_token_valid: bool = True
-
         try:
             payload = AccessToken().decode_token(token)
-            email = payload.get('sub')
-
-            if email is None:
-                is_token_valid = False
-
         except Exception as e:
-            is_token_valid = False
+            return None
+
+        if payload.get('sub') is None:
+            return None
+        return payload
 
-        return is_token_valid
+    @staticmethod
+    def verify_jwt(token: str) -> bool:
+        """
+        Checks that token is valid and unexpired
+        :param token: jwt token that will be checked
+        :return: returns result of the check
+        """
+        return JWTBearer.decode_jwt(token) is not None
 
 
-async def get_current_user(token: str = Depends(JWTBearer())) -> UserReadSchema:
+async def get_current_user(request: Request, token: str = Depends(JWTBearer())) -> UserReadSchema:
     """
-    Returns data of current user, that found using data from token
+    Returns data of current user, that found using data from token. Found user is cached by token
+    :param request: current request
     :param token: JWT token
     :return: user data
     """
+    principal = get_cached_principal(token)
+    if principal is not None:
+        return principal
+
     try:
-        payload = AccessToken().decode_token(token)
+        payload = getattr(request.state, 'token_payload', None) or AccessToken().decode_token(token)
         token_data = TokenData(email=payload.get('sub'))
-        user = find_user_by_email(token_data.email)
+        user = await find_principal_by_email(token_data.email)
         if not user:
             raise UserNotFound
-        return UserReadSchema(**user)
+        principal = UserReadSchema(**user)
+        cache_principal(token, principal, payload.get('exp'))
+        return principal
 
     except ValueError as e:
         raise HTTPException(status_code=403, detail=messages.EMAIL_VALIDATION_ERROR)
@@ -5,3 +5,7 @@ class TokenError(Exception):
 
 class UserNotFound(Exception):
     pass
+
+
+class PasswordHashingQueueFull(Exception):
+    pass
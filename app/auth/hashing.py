@@ -0,0 +1,77 @@
+import asyncio
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from app.auth.exceptions import PasswordHashingQueueFull
+from app.auth.service import pwd_context
+from app.config import get_settings
+from app.metrics.service import metrics
+
+
+class PasswordHashingPool:
+    """
+    Runs password hashing and verification in dedicated threads. Bcrypt releases GIL while hashing, so event loop
+    keeps serving other requests. Number of waiting operations is limited by queue size
+    """
+
+    def __init__(self, max_workers: int, max_queue_size: int):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='password-hashing')
+        self._max_pending_operations = max_workers + max_queue_size
+        self._pending_operations = 0
+
+    async def run(self, func: Callable, *args) -> Any:
+        """
+        Runs function in the pool
+        :param func: hashing function
+        :param args: function arguments
+        :return: function result
+        """
+        if self._pending_operations >= self._max_pending_operations:
+            metrics.increment('password_hashing_rejected_total')
+            raise PasswordHashingQueueFull('password hashing queue is full')
+
+        submitted_at = time.monotonic()
+
+        def run_and_measure_wait():
+            metrics.observe('password_hashing_queue_wait_seconds', time.monotonic() - submitted_at)
+            return func(*args)
+
+        self._pending_operations += 1
+        metrics.set_gauge('password_hashing_pending_operations', self._pending_operations)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, run_and_measure_wait)
+        finally:
+            self._pending_operations -= 1
+            metrics.set_gauge('password_hashing_pending_operations', self._pending_operations)
+
+    def shutdown(self) -> None:
+        """
+        Stops pool threads
+        :return: None
+        """
+        self._executor.shutdown(wait=True)
+
+
+password_hashing_pool = PasswordHashingPool(max_workers=get_settings().PASSWORD_HASHING_WORKERS,
+                                            max_queue_size=get_settings().PASSWORD_HASHING_QUEUE_SIZE)
+
+
+async def hash_password(password: str) -> str:
+    """
+    Hashes password in password hashing pool
+    :param password: plain password
+    :return: hashed password
+    """
+    return await password_hashing_pool.run(pwd_context.hash, password)
+
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """
+    Verifies password in password hashing pool
+    :param plain_password: plain password from user
+    :param hashed_password: hashed password from database
+    :return: True if passwords match, else False
+    """
+    return await password_hashing_pool.run(pwd_context.verify, plain_password, hashed_password)
@@ -0,0 +1,5 @@
+from app.database import make_async
+from app.auth import service
+
+find_user_by_email = make_async(service.find_user_by_email)
+find_principal_by_email = make_async(service.find_principal_by_email)
@@ -1,8 +1,10 @@
 from fastapi import APIRouter, HTTPException
 from starlette import status
 
+from app.auth.exceptions import PasswordHashingQueueFull
+from app.auth.hashing import verify_password
 from app.auth.jwt import AccessToken
-from app.auth.service import authenticate_user
+from app.auth.repository import find_user_by_email
 from app.auth.schemas import UserLogInSchema
 from app import messages
 
@@ -14,8 +16,13 @@ router = APIRouter(
 
 @router.post('/login')
 async def login_for_access_token(login_data: UserLogInSchema):
-    user = authenticate_user(**login_data.model_dump())
-    if not user:
+    user = await find_user_by_email(login_data.email)
+    try:
+        is_password_correct = bool(user) and await verify_password(login_data.password, user.get('password'))
+    except PasswordHashingQueueFull:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail=messages.PASSWORD_HASHING_UNAVAILABLE)
+    if not is_password_correct:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                             detail=messages.INCORRECT_LOGIN_INPUT)
     token = AccessToken()
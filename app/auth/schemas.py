@@ -11,7 +11,6 @@ class UserLogInSchema(BaseModel):
 class UserReadSchema(BaseModel):
     id: PyObjectId = Field(default_factory=PyObjectId, alias='_id')
     email: EmailStr
-    password: str
 
 
 class TokenData(BaseModel):
@@ -16,6 +16,15 @@ def find_user_by_email(email: str) -> dict:
     return get_user_collection().find_one({'email': email})
 
 
+def find_principal_by_email(email: str) -> dict:
+    """
+    Looks up the user in the database by email. Returns only fields required to identify user
+    :param email: user email
+    :return: user id and email from database
+    """
+    return get_user_collection().find_one({'email': email}, {'email': 1})
+
+
 def authenticate_user(email: str, password: str) -> Mapping | bool:
     """
     Authenticates user using passed email and password
@@ -1,21 +1,212 @@
-from app.comments.service import create_comment_in_db
+import asyncio
+
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from fastapi import HTTPException
+from pydantic import ValidationError
+
+from app.comments.repository import create_comment_in_db, create_comments_in_db, find_comment_by_id, \
+    find_comments_by_ids, find_pending_comments, set_pending_comment_status, update_comments_statistics, \
+    delete_post_comments_batch, delete_post_statistics, release_pending_comment
+from app.comments.service import build_comment_document
+from app.custom_fields import PyObjectId
+from app.comments.schemas import CommentStatus
+from app.config import get_settings
 from app.logger import get_logger
-from app.vertex_ai_core.core import generate_answer_to_user_comment_as_author_of_post
+from app.post.repository import find_post_by_id, find_posts_by_ids, find_oldest_deleted_post, purge_post
+from app.replies.repository import enqueue_replies, claim_due_replies, complete_replies, release_replies, \
+    delete_post_replies
+from app.user.repository import find_user_by_id
+from app.vertex_ai_core.core import generate_answer_to_user_comment_as_author_of_post, \
+    generate_answers_to_user_comments_as_author_of_post
+from app.vertex_ai_core.exceptions import OffensiveLanguageError
+from app.vertex_ai_core.moderation import validate_text_with_ai
 
 
-def answer_to_comment(post_data, comment_data) -> None:
+async def answer_to_comment(post_id: PyObjectId, comment_id: PyObjectId) -> None:
     """
-    Automatic answer to user comment
-    :param post_data: post data
-    :param comment_data: user comment
+    Automatic answer to user comment. Used by scheduler jobs created before reply queue was added, new answers are
+    created by process_reply_queue. Nothing is done if post or comment was deleted
+    :param post_id: id of post
+    :param comment_id: id of user comment
     :return: None
     """
     try:
-        text = generate_answer_to_user_comment_as_author_of_post(post=post_data.get('text'),
-                                                                 comment=comment_data.get('text'))
+        post_data = await find_post_by_id(post_id)
+        comment_data = await find_comment_by_id(comment_id)
+        if not post_data or not comment_data:
+            return
+
+        text = await generate_answer_to_user_comment_as_author_of_post(post=post_data.get('text'),
+                                                                       comment=comment_data.get('text'))
         data = {'text': text, 'post_author_answer': True, 'answered_comment_id': comment_data.get('_id')}
-        create_comment_in_db(post_data.get('_id'), post_data.get('user_id'), data)
+        await create_comment_in_db(post_data.get('_id'), post_data.get('user_id'), data)
     except Exception as _e:
         logger = get_logger()
         logger.error(_e, exc_info=True)
 
+
+async def schedule_answer_to_comment(post_data: dict, comment_data: dict) -> None:
+    """
+    Adds comment to reply queue if post author enabled automatic answers
+    :param post_data: post data
+    :param comment_data: published comment
+    :return: None
+    """
+    await schedule_answers_to_comments(post_data, [comment_data])
+
+
+async def schedule_answers_to_comments(post_data: dict, comments: List[dict]) -> None:
+    """
+    Adds comments to the same post to reply queue if post author enabled automatic answers
+    :param post_data: post data
+    :param comments: published comments
+    :return: None
+    """
+    post_author_data = await find_user_by_id(post_data.get('user_id'))
+    if not post_author_data.get('automatic_response_enabled'):
+        return
+
+    comment_ids = [comment.get('_id') for comment in comments
+                   if comment.get('author_id') != post_author_data.get('_id')]
+    if comment_ids:
+        delay = timedelta(minutes=post_author_data.get('automatic_response_delay_in_minutes'))
+        await enqueue_replies(post_data.get('_id'), comment_ids, datetime.utcnow() + delay)
+
+
+async def generate_answers_to_post_comments(post_data: dict, comments: List[dict]) -> List[Optional[str]]:
+    """
+    Generates answers to comments of the same post. Several comments are answered by single AI request
+    :param post_data: post data
+    :param comments: comments to the post
+    :return: answers in the same order as comments. Answer is None if it was not generated
+    """
+    batch_size = get_settings().REPLY_GENERATION_BATCH_SIZE
+    answers = []
+    for index in range(0, len(comments), batch_size):
+        comments_batch = [comment.get('text') for comment in comments[index:index + batch_size]]
+        try:
+            answers.extend(await generate_answers_to_user_comments_as_author_of_post(post_data.get('text'),
+                                                                                     comments_batch))
+        except Exception as _e:
+            logger = get_logger()
+            logger.error(_e, exc_info=True)
+            answers.extend([None] * len(comments_batch))
+    return answers
+
+
+async def process_reply_queue() -> None:
+    """
+    Answers comments from reply queue which answer time has come. Comments are grouped by post, answers to different
+    posts are generated concurrently and saved using single insert. Comments that were not answered are returned to
+    queue
+    :return: None
+    """
+    settings = get_settings()
+    replies = await claim_due_replies(settings.REPLY_QUEUE_BATCH_SIZE, settings.REPLY_QUEUE_CLAIM_TIMEOUT_SECONDS)
+    if not replies:
+        return
+
+    posts = {post['_id']: post for post in await find_posts_by_ids(list({reply['post_id'] for reply in replies}))}
+    comments = {comment['_id']: comment for comment in await find_comments_by_ids([reply['_id'] for reply in replies])}
+
+    comments_by_post = defaultdict(list)
+    processed_replies = []
+    for reply in replies:
+        if reply['post_id'] in posts and reply['_id'] in comments:
+            comments_by_post[reply['post_id']].append(comments[reply['_id']])
+        else:
+            processed_replies.append(reply['_id'])
+
+    answers_by_post = await asyncio.gather(*(generate_answers_to_post_comments(posts[post_id], post_comments)
+                                             for post_id, post_comments in comments_by_post.items()))
+
+    documents, answered_replies, failed_replies = [], [], []
+    for (post_id, post_comments), answers in zip(comments_by_post.items(), answers_by_post):
+        for comment, answer in zip(post_comments, answers):
+            data = {'text': answer, 'post_author_answer': True, 'answered_comment_id': comment['_id']}
+            try:
+                documents.append(build_comment_document(post_id, posts[post_id].get('user_id'), data))
+                answered_replies.append(comment['_id'])
+            except ValidationError:
+                failed_replies.append(comment['_id'])
+
+    if documents:
+        write_errors = await create_comments_in_db(documents)
+        for index, reply_id in enumerate(answered_replies):
+            (failed_replies if index in write_errors else processed_replies).append(reply_id)
+    if processed_replies:
+        await complete_replies(processed_replies)
+    if failed_replies:
+        await release_replies(failed_replies, settings.REPLY_QUEUE_RETRY_DELAY_SECONDS,
+                              settings.REPLY_QUEUE_MAX_ATTEMPTS)
+
+
+async def moderate_pending_comment(comment_data: dict) -> None:
+    """
+    Validates pending comment and publishes or blocks it. If AI is unavailable, comment stays pending and will be
+    validated again after retry delay. Comment that was not validated after max number of attempts is blocked
+    :param comment_data: pending comment
+    :return: None
+    """
+    settings = get_settings()
+    try:
+        await validate_text_with_ai({'text': comment_data.get('text')})
+    except OffensiveLanguageError:
+        if await set_pending_comment_status(comment_data.get('_id'), CommentStatus.blocked):
+            await update_comments_statistics(increase_blocked_comments=True, post_id=comment_data.get('post_id'))
+        return
+    except HTTPException as _e:
+        logger = get_logger()
+        logger.warning(f'comment {comment_data.get("_id")} was not moderated: {_e.detail}')
+        attempts = await release_pending_comment(comment_data.get('_id'),
+                                                 settings.PENDING_COMMENTS_MODERATION_RETRY_DELAY_SECONDS)
+        if attempts < settings.PENDING_COMMENTS_MODERATION_MAX_ATTEMPTS:
+            return
+        logger.warning(f'comment {comment_data.get("_id")} is blocked after {attempts} failed moderation attempts')
+        if await set_pending_comment_status(comment_data.get('_id'), CommentStatus.blocked):
+            await update_comments_statistics(increase_blocked_comments=True, post_id=comment_data.get('post_id'))
+        return
+
+    if not await set_pending_comment_status(comment_data.get('_id'), CommentStatus.published):
+        return
+    await update_comments_statistics(increase_created_comments=True, post_id=comment_data.get('post_id'))
+
+    post = await find_post_by_id(comment_data.get('post_id'))
+    if post:
+        await schedule_answer_to_comment(post, {**comment_data, 'status': CommentStatus.published.value})
+
+
+async def moderate_pending_comments() -> None:
+    """
+    Validates comments that wait for moderation
+    :return: None
+    """
+    pending_comments = await find_pending_comments(get_settings().PENDING_COMMENTS_MODERATION_BATCH_SIZE)
+    await asyncio.gather(*(moderate_pending_comment(comment) for comment in pending_comments))
+
+
+async def purge_deleted_post(post_id: PyObjectId) -> None:
+    """
+    Removes deleted post with its comments, statistics and queued answers. Comments are removed in batches with pause
+    between batches, so purge of popular post does not overload database
+    :param post_id: id of deleted post
+    :return: None
+    """
+    settings = get_settings()
+    await delete_post_replies(post_id)
+    while await delete_post_comments_batch(post_id, settings.POST_PURGE_BATCH_SIZE):
+        await asyncio.sleep(settings.POST_PURGE_BATCH_DELAY_SECONDS)
+    await delete_post_statistics(post_id)
+    await purge_post(post_id)
+
+
+async def purge_deleted_posts() -> None:
+    """
+    Removes posts that were marked as deleted
+    :return: None
+    """
+    while deleted_post := await find_oldest_deleted_post():
+        await purge_deleted_post(deleted_post['_id'])
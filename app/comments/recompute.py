@@ -0,0 +1,237 @@
+import argparse
+
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, Optional, Tuple
+
+from pymongo import UpdateMany, UpdateOne
+
+from app.comments.schemas import StatisticsGranularity
+from app.comments.service import HIDDEN_COMMENT_STATUSES
+from app.comments.statistics import DATE_FORMAT, HOUR_FORMAT, get_statistics_bucket, get_statistics_bucket_start, \
+    get_statistics_bucket_end, increase_statistics_version
+from app.config import get_settings
+from app.custom_fields import PyObjectId
+from app.database import get_comment_collection, get_statistic_collection, get_statistic_rollup_collection, \
+    get_statistics_recompute_collection
+from app.logger import get_logger
+
+CHECKPOINT_ID = 'statistics_recompute'
+
+# Buckets that are shorter than a day are always inside one chunk, longer buckets are collected through several chunks
+CHUNK_GRANULARITIES = [StatisticsGranularity.hour, StatisticsGranularity.day]
+OPEN_BUCKET_GRANULARITIES = [StatisticsGranularity.week, StatisticsGranularity.month]
+
+# Numbers of created comments keyed by bucket and post id. Post id is None for statistics of all posts
+BucketCounts = Dict[Tuple[str, Optional[PyObjectId]], int]
+
+
+def get_created_comments_query(chunk_start: datetime, chunk_end: datetime) -> dict:
+    """
+    Creates query that matches published comments created within chunk. Answers of post authors are not counted
+    :param chunk_start: start of chunk
+    :param chunk_end: end of chunk, not included
+    :return: query
+    """
+    return {'created_at': {'$gte': chunk_start.strftime(DATE_FORMAT), '$lt': chunk_end.strftime(DATE_FORMAT)},
+            'post_author_answer': {'$ne': True},
+            'status': {'$nin': HIDDEN_COMMENT_STATUSES}}
+
+
+def aggregate_created_comments(chunk_start: datetime, chunk_end: datetime,
+                               rollups: bool) -> Iterator[Tuple[str, Optional[PyObjectId], int]]:
+    """
+    Counts published comments created within chunk
+    :param chunk_start: start of chunk
+    :param chunk_end: end of chunk, not included
+    :param rollups: if true, comments are counted by hour and post, otherwise by day
+    :return: bucket, post id and number of comments
+    """
+    bucket_length = len(chunk_start.strftime(HOUR_FORMAT if rollups else DATE_FORMAT))
+    pipeline = [
+        {'$match': get_created_comments_query(chunk_start, chunk_end)},
+        {'$group': {'_id': {'bucket': {'$substrBytes': ['$created_at', 0, bucket_length]},
+                            'post_id': '$post_id' if rollups else None},
+                    'count': {'$sum': 1}}}
+    ]
+    for item in get_comment_collection().aggregate(pipeline, allowDiskUse=True):
+        yield item['_id']['bucket'], item['_id'].get('post_id'), item['count']
+
+
+def get_daily_statistics_operations(date_from: str, date_to: str, counts: Dict[str, int]) -> list:
+    """
+    Creates operations that replace number of created comments in daily statistics. Number of blocked comments is
+    kept, because blocked comments are not saved
+    :param date_from: first date
+    :param date_to: last date
+    :param counts: numbers of created comments by date
+    :return: bulk write operations
+    """
+    operations = [UpdateMany({'date': {'$gte': date_from, '$lte': date_to}}, {'$set': {'created_comments': 0}})]
+    operations.extend(UpdateOne({'date': date}, {'$set': {'created_comments': count},
+                                                 '$setOnInsert': {'blocked_comments': 0}}, upsert=True)
+                      for date, count in counts.items())
+    return operations
+
+
+def get_rollup_operations(granularity: StatisticsGranularity, bucket_from: str, bucket_to: str,
+                          counts: BucketCounts) -> list:
+    """
+    Creates operations that replace number of created comments in rollups
+    :param granularity: granularity of rollups
+    :param bucket_from: first bucket
+    :param bucket_to: last bucket
+    :param counts: numbers of created comments by bucket and post
+    :return: bulk write operations
+    """
+    operations = [UpdateMany({'granularity': granularity.value, 'bucket': {'$gte': bucket_from, '$lte': bucket_to}},
+                             {'$set': {'created_comments': 0}})]
+    operations.extend(UpdateOne({'granularity': granularity.value, 'bucket': bucket, 'post_id': post_id},
+                                {'$set': {'created_comments': count}, '$setOnInsert': {'blocked_comments': 0}},
+                                upsert=True)
+                      for (bucket, post_id), count in counts.items())
+    return operations
+
+
+def get_recompute_range(date_from: datetime, date_to: datetime, rollups: bool,
+                        include_today: bool) -> Tuple[datetime, datetime]:
+    """
+    Returns range of comments that will be processed. If rollups are recomputed, range is extended to whole weeks and
+    months. Range never includes future days, and current day is included only if requested
+    :param date_from: first date
+    :param date_to: last date
+    :param rollups: if true, rollups are recomputed
+    :param include_today: if true, current day can be recomputed
+    :return: start and end of range, end is not included
+    """
+    start, end = date_from, date_to + timedelta(days=1)
+    if rollups:
+        start = min(get_statistics_bucket_start(get_statistics_bucket(date_from, granularity), granularity)
+                    for granularity in OPEN_BUCKET_GRANULARITIES)
+        end = max(get_statistics_bucket_end(get_statistics_bucket(date_to, granularity), granularity)
+                  for granularity in OPEN_BUCKET_GRANULARITIES)
+
+    today = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+    return start, min(end, today + timedelta(days=1) if include_today else today)
+
+
+def recompute_statistics(date_from: datetime, date_to: datetime, rollups: bool = False, chunk_days: int = 7,
+                         include_today: bool = False) -> None:
+    """
+    Rebuilds number of created comments in daily statistics, and optionally in hourly, weekly, monthly and per post
+    rollups, from comments collection. Deleted comments are not counted. Comments are processed in chunks of days and
+    results are written after every chunk, so memory usage does not depend on range size. Progress is saved, so
+    interrupted recompute with the same parameters continues from the last processed chunk
+    :param date_from: first date
+    :param date_to: last date
+    :param rollups: if true, rollups are recomputed
+    :param chunk_days: number of days processed at once
+    :param include_today: if true, current day is recomputed too. Statistics of current day change while recompute
+    is running, so it is skipped by default
+    :return: None
+    """
+    logger = get_logger()
+    start, end = get_recompute_range(date_from, date_to, rollups, include_today)
+    parameters = {'date_from': date_from.strftime(DATE_FORMAT), 'date_to': date_to.strftime(DATE_FORMAT),
+                  'rollups': rollups, 'include_today': include_today}
+
+    checkpoint = get_statistics_recompute_collection().find_one({'_id': CHECKPOINT_ID, **parameters})
+    if checkpoint:
+        start = max(start, datetime.strptime(checkpoint['processed_to'], DATE_FORMAT))
+        logger.info(f'statistics recompute is resumed from {checkpoint["processed_to"]}')
+
+    run_start = start
+    open_buckets: Dict[Tuple[StatisticsGranularity, str], Dict[Optional[PyObjectId], int]] = {}
+    chunk_start = start
+    while chunk_start < end:
+        chunk_end = min(chunk_start + timedelta(days=chunk_days), end)
+        daily_counts = defaultdict(int)
+        chunk_counts: Dict[StatisticsGranularity, BucketCounts] = defaultdict(lambda: defaultdict(int))
+
+        if rollups:
+            day = chunk_start
+            while day < chunk_end:
+                for granularity in OPEN_BUCKET_GRANULARITIES:
+                    open_buckets.setdefault((granularity, get_statistics_bucket(day, granularity)), defaultdict(int))
+                day += timedelta(days=1)
+
+        for bucket, post_id, count in aggregate_created_comments(chunk_start, chunk_end, rollups):
+            moment = datetime.strptime(bucket, HOUR_FORMAT if rollups else DATE_FORMAT)
+            daily_counts[moment.strftime(DATE_FORMAT)] += count
+            if not rollups:
+                continue
+            chunk_counts[StatisticsGranularity.hour][(bucket, None)] += count
+            for granularity in CHUNK_GRANULARITIES:
+                chunk_counts[granularity][(get_statistics_bucket(moment, granularity), post_id)] += count
+            for granularity in OPEN_BUCKET_GRANULARITIES:
+                bucket_counts = open_buckets[(granularity, get_statistics_bucket(moment, granularity))]
+                bucket_counts[None] += count
+                bucket_counts[post_id] += count
+
+        last_hour = chunk_end - timedelta(hours=1)
+        get_statistic_collection().bulk_write(get_daily_statistics_operations(
+            chunk_start.strftime(DATE_FORMAT), last_hour.strftime(DATE_FORMAT), daily_counts))
+
+        if rollups:
+            operations = []
+            for granularity in CHUNK_GRANULARITIES:
+                operations.extend(get_rollup_operations(granularity, get_statistics_bucket(chunk_start, granularity),
+                                                        get_statistics_bucket(last_hour, granularity),
+                                                        chunk_counts[granularity]))
+            for (granularity, bucket), bucket_counts in list(open_buckets.items()):
+                if get_statistics_bucket_end(bucket, granularity) > chunk_end:
+                    continue
+                del open_buckets[(granularity, bucket)]
+                # buckets that started before processed range are not complete
+                if get_statistics_bucket_start(bucket, granularity) >= run_start:
+                    operations.extend(get_rollup_operations(granularity, bucket, bucket, {
+                        (bucket, post_id): count for post_id, count in bucket_counts.items()}))
+            get_statistic_rollup_collection().bulk_write(operations)
+
+        # recompute must be resumed from the start of the earliest bucket that is not written yet
+        processed_to = min([get_statistics_bucket_start(bucket, granularity) for granularity, bucket in open_buckets
+                            if get_statistics_bucket_start(bucket, granularity) >= run_start] + [chunk_end])
+        get_statistics_recompute_collection().update_one(
+            {'_id': CHECKPOINT_ID}, {'$set': {**parameters, 'processed_to': processed_to.strftime(DATE_FORMAT)}},
+            upsert=True)
+        logger.info(f'comment statistics are recomputed till {chunk_end.strftime(DATE_FORMAT)}')
+        chunk_start = chunk_end
+
+    get_statistics_recompute_collection().delete_one({'_id': CHECKPOINT_ID})
+    increase_statistics_version()
+
+
+def recompute_recent_statistics() -> None:
+    """
+    Recomputes statistics of last days. Used by scheduler
+    :return: None
+    """
+    settings = get_settings()
+    date_to = datetime.combine(datetime.utcnow().date(), datetime.min.time()) - timedelta(days=1)
+    date_from = date_to - timedelta(days=settings.STATISTICS_RECOMPUTE_DAYS - 1)
+    recompute_statistics(date_from, date_to, rollups=True, chunk_days=settings.STATISTICS_RECOMPUTE_CHUNK_DAYS)
+
+
+def parse_date(value: str) -> datetime:
+    """
+    Parses date from command line argument
+    :param value: date in YYYY-MM-DD format
+    :return: parsed date
+    """
+    return datetime.strptime(value, DATE_FORMAT)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rebuilds comment statistics from comments')
+    parser.add_argument('--date-from', type=parse_date, required=True, help='First date, YYYY-MM-DD')
+    parser.add_argument('--date-to', type=parse_date, help='Last date, YYYY-MM-DD. Yesterday by default')
+    parser.add_argument('--rollups', action='store_true', help='Recompute hourly, weekly, monthly and per post '
+                                                               'statistics too')
+    parser.add_argument('--chunk-days', type=int, default=get_settings().STATISTICS_RECOMPUTE_CHUNK_DAYS,
+                        help='Number of days processed at once')
+    parser.add_argument('--include-today', action='store_true', help='Recompute current day too')
+    arguments = parser.parse_args()
+
+    yesterday = datetime.combine(datetime.utcnow().date(), datetime.min.time()) - timedelta(days=1)
+    recompute_statistics(arguments.date_from, arguments.date_to or yesterday, rollups=arguments.rollups,
+                         chunk_days=arguments.chunk_days, include_today=arguments.include_today)
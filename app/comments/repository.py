@@ -0,0 +1,17 @@
+from app.database import make_async
+from app.comments import service
+
+create_comment_in_db = make_async(service.create_comment_in_db)
+create_comments_in_db = make_async(service.create_comments_in_db)
+find_comment_by_id = make_async(service.find_comment_by_id)
+find_comments_by_ids = make_async(service.find_comments_by_ids)
+update_comment = make_async(service.update_comment)
+find_pending_comments = make_async(service.find_pending_comments)
+set_pending_comment_status = make_async(service.set_pending_comment_status)
+release_pending_comment = make_async(service.release_pending_comment)
+delete_comment_in_db = make_async(service.delete_comment_in_db)
+delete_post_comments_batch = make_async(service.delete_post_comments_batch)
+delete_post_statistics = make_async(service.delete_post_statistics)
+update_comments_statistics = make_async(service.update_comments_statistics)
+add_comments_statistics = make_async(service.add_comments_statistics)
+get_comment_statistics_for_certain_period = make_async(service.get_comment_statistics_for_certain_period)
@@ -1,25 +1,35 @@
-from typing import Annotated
+import hashlib
+import json
 
-from datetime import datetime, timedelta
+from typing import Annotated, Optional
 
-from apscheduler.triggers.date import DateTrigger
-from fastapi import APIRouter, HTTPException, Depends, Query
+from datetime import datetime
+
+from fastapi import APIRouter, HTTPException, Depends, Query, Response, Header
+from fastapi.encoders import jsonable_encoder
 from starlette import status
 from starlette.responses import JSONResponse
 
 from app.auth.dependencies import get_current_user
 from app.auth.schemas import UserReadSchema
-from app.background_tasks import answer_to_comment
+from app.background_tasks import schedule_answer_to_comment, schedule_answers_to_comments
 from app.comments.schemas import CommentCreateInSchema, CommentUpdateSchema, CommentReadSchema, \
-    CommentReadPaginationSchema, CommentStatisticsResponseSchema
+    CommentReadPaginationSchema, CommentStatisticsResponseSchema, CommentStatus, StatisticsGranularity, \
+    CommentBulkCreateInSchema, CommentBulkCreateResponseSchema
+from app.config import get_settings
 from app.custom_fields import PyObjectId
 from app import messages
 from app.database import COMMENT_DOC
-from app.service import paginate_collection
-from app.post.service import find_post_by_id
-from app.comments.service import create_comment_in_db, find_comment_by_id, delete_comment_in_db, update_comment, \
-    get_post_match_pipeline, update_comments_statistics, get_comment_statistics_for_certain_period
-from app.user.service import find_user_by_id
+from app.exceptions import InvalidCursor
+from app.repository import paginate_collection, paginate_collection_by_cursor
+from app.post.repository import find_post_by_id
+from app.comments.repository import create_comment_in_db, find_comment_by_id, delete_comment_in_db, update_comment, \
+    update_comments_statistics, get_comment_statistics_for_certain_period, create_comments_in_db, \
+    add_comments_statistics
+from app.comments.service import get_post_match_pipeline, build_comment_document
+from app.comments.statistics import count_statistics_buckets
+from app.vertex_ai_core.exceptions import OffensiveLanguageError
+from app.vertex_ai_core.moderation import validate_text_with_ai, validate_texts_with_ai
 
 router = APIRouter(
     prefix='/posts/{post_id}/comments',
@@ -32,59 +42,133 @@ statistics_router = APIRouter(
 )
 
 
-@router.post(path='/', status_code=status.HTTP_201_CREATED, response_model=CommentReadSchema)
-async def create_comment(post_id: PyObjectId, comment: CommentCreateInSchema,
+@router.post(path='/', status_code=status.HTTP_201_CREATED, response_model=CommentReadSchema,
+             responses={status.HTTP_202_ACCEPTED: {'model': CommentReadSchema,
+                                                   'description': 'Comment is saved and waits for moderation'}})
+async def create_comment(post_id: PyObjectId, comment: CommentCreateInSchema, response: Response,
                          current_user: Annotated[UserReadSchema, Depends(get_current_user)]):
-    post = find_post_by_id(post_id)
+    post = await find_post_by_id(post_id)
     if not post:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=messages.POST_NOT_FOUND)
 
-    created_comment_id = create_comment_in_db(post_id, current_user.id, comment.model_dump())
-    update_comments_statistics(increase_created_comments=True)
-    created_comment = find_comment_by_id(created_comment_id)
-
-    post_author_data = find_user_by_id(post.get('user_id'))
-    if post_author_data.get('automatic_response_enabled') and post_author_data.get('_id') != current_user.id:
-        from app.main import scheduler
-        executing_date = datetime.now() + timedelta(minutes=post_author_data.get('automatic_response_delay_in_minutes'))
-        scheduler.add_job(answer_to_comment, DateTrigger(run_date=executing_date), [post, created_comment],
-                          misfire_grace_time=3600)
+    if get_settings().ASYNC_COMMENT_MODERATION:
+        data = {**comment.model_dump(), 'status': CommentStatus.pending.value}
+        created_comment = await create_comment_in_db(post_id, current_user.id, data)
+        response.status_code = status.HTTP_202_ACCEPTED
+        return created_comment
+
+    try:
+        await validate_text_with_ai({"text": comment.text})
+    except OffensiveLanguageError:
+        await update_comments_statistics(increase_blocked_comments=True, post_id=post_id)
+        raise
+
+    created_comment = await create_comment_in_db(post_id, current_user.id, comment.model_dump())
+    await update_comments_statistics(increase_created_comments=True, post_id=post_id)
+    await schedule_answer_to_comment(post, created_comment)
     return created_comment
 
 
+@router.post(path='/bulk', status_code=status.HTTP_200_OK, response_model=CommentBulkCreateResponseSchema,
+             responses={status.HTTP_202_ACCEPTED: {'model': CommentBulkCreateResponseSchema,
+                                                   'description': 'Comments are saved and wait for moderation'}})
+async def create_comments(post_id: PyObjectId, comments: CommentBulkCreateInSchema, response: Response,
+                          current_user: Annotated[UserReadSchema, Depends(get_current_user)]):
+    post = await find_post_by_id(post_id)
+    if not post:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=messages.POST_NOT_FOUND)
+
+    async_moderation = get_settings().ASYNC_COMMENT_MODERATION
+    if async_moderation:
+        moderation_errors = [None] * len(comments.items)
+        response.status_code = status.HTTP_202_ACCEPTED
+    else:
+        moderation_errors = await validate_texts_with_ai([{"text": comment.text} for comment in comments.items])
+
+    results = [{'index': index, 'created': False} for index in range(len(comments.items))]
+    documents, document_indexes = [], []
+    for index, (comment, moderation_error) in enumerate(zip(comments.items, moderation_errors)):
+        if moderation_error:
+            results[index]['detail'] = moderation_error.errors()
+            continue
+        data = comment.model_dump()
+        if async_moderation:
+            data['status'] = CommentStatus.pending.value
+        documents.append(build_comment_document(post_id, current_user.id, data))
+        document_indexes.append(index)
+
+    write_errors = await create_comments_in_db(documents) if documents else {}
+    created_comments = []
+    for document_index, (index, document) in enumerate(zip(document_indexes, documents)):
+        if document_index in write_errors:
+            results[index]['detail'] = messages.BULK_ITEM_NOT_CREATED
+            continue
+        results[index].update({'created': True, 'comment': document})
+        created_comments.append(document)
+
+    if async_moderation:
+        return {'items': results}
+
+    blocked_comments = sum(1 for moderation_error in moderation_errors if moderation_error)
+    if blocked_comments or created_comments:
+        await add_comments_statistics(post_id, blocked_comments=blocked_comments,
+                                      created_comments=len(created_comments))
+    if created_comments:
+        await schedule_answers_to_comments(post, created_comments)
+    return {'items': results}
+
+
 @router.get(path='/', status_code=status.HTTP_200_OK, response_model=CommentReadPaginationSchema)
 async def get_comments(post_id: PyObjectId,
                        current_user: Annotated[UserReadSchema, Depends(get_current_user)],
                        page: int = Query(1, gt=0, lt=2147483647),
-                       page_size: int = Query(1, gt=0, lt=2147483647)):
-    return paginate_collection(collection_name=COMMENT_DOC, pipeline=get_post_match_pipeline(post_id),
-                               page=page, items_per_page=page_size)
+                       page_size: int = Query(1, gt=0, lt=2147483647),
+                       cursor: Optional[str] = Query(None, description='Cursor from previous page. If passed, '
+                                                                       'page parameter is ignored'),
+                       exact_count: bool = Query(False, description='If true, total items count is calculated '
+                                                                    'exactly')):
+    # Comments of deleted post are kept until post is purged, but must not be returned
+    if not await find_post_by_id(post_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=messages.POST_NOT_FOUND)
+
+    pipeline = get_post_match_pipeline(post_id)
+    if cursor is None:
+        return await paginate_collection(collection_name=COMMENT_DOC, pipeline=pipeline, page=page,
+                                         items_per_page=page_size, exact_count=exact_count)
+    try:
+        return await paginate_collection_by_cursor(collection_name=COMMENT_DOC, pipeline=pipeline, cursor=cursor,
+                                                   items_per_page=page_size, exact_count=exact_count)
+    except InvalidCursor:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=messages.INVALID_CURSOR)
 
 
 @router.patch(path='/{comment_id}', status_code=status.HTTP_200_OK, response_model=CommentReadSchema)
 async def edit_comment(post_id: PyObjectId, comment_id: PyObjectId, comment_data: CommentUpdateSchema,
                        current_user: Annotated[UserReadSchema, Depends(get_current_user)]):
-    comment = find_comment_by_id(comment_id)
-    if not comment:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=messages.COMMENT_NOT_FOUND)
-    if comment.get('author_id') != current_user.id:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=messages.COMMENT_UPDATE_NOT_ALLOWED)
+    if not await find_post_by_id(post_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=messages.POST_NOT_FOUND)
+
+    updated_comment = await update_comment(comment_id, comment_data.model_dump(exclude_unset=True, exclude_none=True),
+                                           author_id=current_user.id)
+    if updated_comment:
+        return updated_comment
 
-    updated_comment_id = update_comment(comment_id, comment_data.model_dump(exclude_unset=True, exclude_none=True))
-    updated_comment = find_comment_by_id(updated_comment_id)
-    return updated_comment
+    # Comment is read only if it was not updated to find out the reason
+    if not await find_comment_by_id(comment_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=messages.COMMENT_NOT_FOUND)
+    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=messages.COMMENT_UPDATE_NOT_ALLOWED)
 
 
 @router.delete(path='/{comment_id}')
 async def delete_comment(post_id: PyObjectId, comment_id: PyObjectId,
                          current_user: Annotated[UserReadSchema, Depends(get_current_user)]):
-    comment = find_comment_by_id(comment_id)
+    comment = await find_comment_by_id(comment_id)
     if not comment:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=messages.COMMENT_NOT_FOUND)
     if comment.get('author_id') != current_user.id:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=messages.COMMENT_DELETE_NOT_ALLOWED)
 
-    result = delete_comment_in_db(comment_id)
+    result = await delete_comment_in_db(comment_id)
     return JSONResponse(status_code=status.HTTP_200_OK, content={'deleted': result})
 
 
@@ -96,7 +180,28 @@ async def read_comments_daily_breakdown(current_user: Annotated[UserReadSchema,
                                                                     example='2024-12-23'),
                                         date_to: datetime = Query(description='The date until which the search for '
                                                                               'comment statistics will be performed',
-                                                                  example='2024-12-23')):
-    comments_statistics = get_comment_statistics_for_certain_period(date_from=date_from.date().strftime("%Y-%m-%d"),
-                                                                    date_to=date_to.date().strftime("%Y-%m-%d"))
-    return comments_statistics
+                                                                  example='2024-12-23'),
+                                        granularity: StatisticsGranularity = Query(
+                                            StatisticsGranularity.day, description='Size of statistics buckets'),
+                                        post_id: Optional[PyObjectId] = Query(
+                                            None, description='If passed, only statistics of this post are returned'),
+                                        zero_fill: bool = Query(False, description='If true, buckets without comments '
+                                                                                   'are returned with zero counters'),
+                                        if_none_match: Optional[str] = Header(None)):
+    if date_to.date() < date_from.date():
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=messages.STATISTICS_INVALID_PERIOD)
+    if count_statistics_buckets(date_from, date_to, granularity) > get_settings().STATISTICS_MAX_BUCKETS:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail=messages.STATISTICS_PERIOD_TOO_LONG)
+    date_from, date_to = date_from.date().strftime("%Y-%m-%d"), date_to.date().strftime("%Y-%m-%d")
+    comments_statistics = await get_comment_statistics_for_certain_period(
+        date_from=date_from, date_to=date_to, granularity=granularity, post_id=post_id, zero_fill=zero_fill)
+
+    content = jsonable_encoder(comments_statistics)
+    etag = f'"{hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()}"'
+    # Finished periods can still be changed by statistics recompute, so clients must always revalidate
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+
+    if if_none_match and etag in [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return JSONResponse(content=content, headers=headers)
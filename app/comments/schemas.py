@@ -1,16 +1,24 @@
 from datetime import datetime
-from typing import Optional, List
+from enum import Enum
+from typing import Any, Optional, List
 
-from fastapi import HTTPException
-from google.api_core.exceptions import ResourceExhausted
-from pydantic import BaseModel, Field, model_validator, field_serializer
-from starlette import status
+from pydantic import BaseModel, Field, field_serializer
 
 from app.config import get_settings
 from app.custom_fields import PyObjectId
-from app.logger import get_logger
-from app.vertex_ai_core.core import get_result_of_ai_validation
-from app.messages import AI_VALIDATION_ERROR, AI_REQUEST_QUOTA_EXCEEDED
+
+
+class CommentStatus(Enum):
+    pending: str = 'pending'
+    published: str = 'published'
+    blocked: str = 'blocked'
+
+
+class StatisticsGranularity(Enum):
+    hour: str = 'hour'
+    day: str = 'day'
+    week: str = 'week'
+    month: str = 'month'
 
 
 class CommentBaseSchema(BaseModel):
@@ -18,28 +26,7 @@ class CommentBaseSchema(BaseModel):
 
 
 class CommentCreateInSchema(CommentBaseSchema):
-
-    @model_validator(mode='after')
-    def validate_attrs(self):
-        if get_settings().USE_AI_FOR_TEXT_VALIDATION:
-            try:
-                validation_result = get_result_of_ai_validation({"text": self.text})
-                if not validation_result.get('result'):
-                    failed_fields = validation_result.get('failed_fields')
-
-                    from app.comments.service import update_comments_statistics
-                    update_comments_statistics(increase_blocked_comments=True)
-
-                    raise ValueError(f'following fields contains offensive language: {failed_fields}')
-            except ValueError as _e:
-                raise ValueError(_e.args[0])
-            except ResourceExhausted:
-                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=AI_REQUEST_QUOTA_EXCEEDED)
-            except Exception as _e:
-                logger = get_logger()
-                logger.error(_e, exc_info=True)
-                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=AI_VALIDATION_ERROR)
-        return self
+    pass
 
 
 class CommentUpdateSchema(CommentBaseSchema):
@@ -51,6 +38,7 @@ class CommentCreateSchema(CommentBaseSchema):
     author_id: PyObjectId
     post_author_answer: bool = False
     answered_comment_id: Optional[PyObjectId] = Field(default=None)
+    status: str = CommentStatus.published.value
 
 
 class CommentReadSchema(CommentBaseSchema):
@@ -59,14 +47,31 @@ class CommentReadSchema(CommentBaseSchema):
     post_id: PyObjectId
     post_author_answer: bool = False
     answered_comment_id: Optional[PyObjectId] = Field(default=None)
+    status: str = CommentStatus.published.value
     updated_at: datetime
     created_at: datetime
 
 
+class CommentBulkCreateInSchema(BaseModel):
+    items: List[CommentCreateInSchema] = Field(min_length=1, max_length=get_settings().BULK_CREATE_MAX_ITEMS)
+
+
+class CommentBulkCreateItemSchema(BaseModel):
+    index: int
+    created: bool
+    comment: Optional[CommentReadSchema] = None
+    detail: Any = None
+
+
+class CommentBulkCreateResponseSchema(BaseModel):
+    items: List[CommentBulkCreateItemSchema] = []
+
+
 class CommentReadPaginationSchema(BaseModel):
     total_items_count: int
     page_size: int
-    page: int
+    page: Optional[int] = None
+    next_cursor: Optional[str] = None
     items: List[CommentReadSchema] = []
 
 
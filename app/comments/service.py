@@ -1,36 +1,76 @@
 import pymongo
 
-from datetime import datetime
+from pymongo import ReturnDocument
 
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from app.config import get_settings
+from app.logger import get_logger
+from app.metrics.service import metrics
 from app.custom_fields import PyObjectId
-from app.database import get_comment_collection, get_statistic_collection
-from app.comments.schemas import CommentCreateSchema, CommentStatisticsSchema
+from app.database import get_comment_collection, get_statistic_collection, get_statistic_rollup_collection, \
+    insert_documents_unordered, COMMENT_DOC
+from app.comments.schemas import CommentCreateSchema, CommentStatus, StatisticsGranularity
+from app.comments.statistics import DATE_FORMAT, HOUR_FORMAT, get_statistics_buckets, \
+    is_statistics_bucket_finished, statistics_cache, statistics_cache_lock, statistics_cache_version, \
+    write_statistics_increments, get_statistics_version, increase_statistics_version, validate_statistics_cache
+from app.comments.statistics_buffer import statistics_buffer
+from app.service import evict_cached_counts
+
+
+HIDDEN_COMMENT_STATUSES = [CommentStatus.pending.value, CommentStatus.blocked.value]
 
 
 def get_post_match_pipeline(post_id: PyObjectId) -> list:
     """
-    Creates match pipeline
+    Creates match pipeline. Comments that are not published are not matched
     :param post_id: id of post
     :return: list with match query
     """
     return [
-        {"$match": {"post_id": post_id}}
+        {"$match": {"post_id": post_id, "status": {"$nin": HIDDEN_COMMENT_STATUSES}}}
     ]
 
 
-def create_comment_in_db(post_id: PyObjectId, user_id: PyObjectId, data: dict) -> PyObjectId:
+def build_comment_document(post_id: PyObjectId, user_id: PyObjectId, data: dict) -> dict:
     """
-    Creates comment in database
+    Creates comment document that can be saved in database
     :param post_id: id of the post with which the comment will be associated
     :param user_id: id of user that creates comment
     :param data: comment data
-    :return: id of created comment
+    :return: comment document
     """
     current_time = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
-    data = CommentCreateSchema(**data, post_id=post_id, author_id=user_id).model_dump()
-    data.update({'updated_at': current_time, 'created_at': current_time})
-    result = get_comment_collection().insert_one(data)
-    return result.inserted_id
+    document = CommentCreateSchema(**data, post_id=post_id, author_id=user_id).model_dump()
+    document.update({'updated_at': current_time, 'created_at': current_time})
+    return document
+
+
+def create_comment_in_db(post_id: PyObjectId, user_id: PyObjectId, data: dict) -> dict:
+    """
+    Creates comment in database
+    :param post_id: id of the post with which the comment will be associated
+    :param user_id: id of user that creates comment
+    :param data: comment data
+    :return: created comment
+    """
+    document = build_comment_document(post_id, user_id, data)
+    get_comment_collection().insert_one(document)
+    evict_cached_counts(COMMENT_DOC)
+    return document
+
+
+def create_comments_in_db(documents: List[dict]) -> Dict[int, dict]:
+    """
+    Creates several comments in database using single request. Comment that failed to insert does not stop insertion
+    of others
+    :param documents: comment documents created by build_comment_document
+    :return: write errors by index of comment that was not created
+    """
+    errors = insert_documents_unordered(get_comment_collection(), documents)
+    evict_cached_counts(COMMENT_DOC)
+    return errors
 
 
 def find_comment_by_id(comment_id: PyObjectId) -> dict:
@@ -42,16 +82,80 @@ def find_comment_by_id(comment_id: PyObjectId) -> dict:
     return get_comment_collection().find_one({'_id': comment_id})
 
 
-def update_comment(comment_id: PyObjectId, data: dict) -> PyObjectId:
+def find_comments_by_ids(comment_ids: List[PyObjectId]) -> List[dict]:
+    """
+    Looks up several comments in the database
+    :param comment_ids: ids of comments that need to be found
+    :return: found comments
+    """
+    return list(get_comment_collection().find({'_id': {'$in': comment_ids}}))
+
+
+def update_comment(comment_id: PyObjectId, data: dict, author_id: Optional[PyObjectId] = None) -> Optional[dict]:
     """
     Updates comment in the database using passed data
     :param comment_id: id of comment that need to be updated
     :param data: data that will be used to update
-    :return: comment id
+    :param author_id: if passed, comment is updated only if it was created by this user
+    :return: updated comment or None if comment was not found
     """
+    query = {'_id': comment_id}
+    if author_id is not None:
+        query['author_id'] = author_id
     data.update({'updated_at': datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")})
-    get_comment_collection().update_one({'_id': comment_id}, {'$set': data})
-    return comment_id
+    return get_comment_collection().find_one_and_update(query, {'$set': data},
+                                                        return_document=ReturnDocument.AFTER)
+
+
+def get_pending_comments_query(current_time: datetime) -> dict:
+    """
+    Creates query that matches comments which wait for moderation and which next moderation attempt time has come
+    :param current_time: current time
+    :return: query
+    """
+    return {'status': CommentStatus.pending.value,
+            '$or': [{'next_attempt_at': None}, {'next_attempt_at': {'$lte': current_time}}]}
+
+
+def find_pending_comments(limit: int) -> list:
+    """
+    Looks up the oldest comments that wait for moderation. Comments which moderation failed are skipped until their
+    next attempt time
+    :param limit: max number of comments
+    :return: list of comments
+    """
+    query = get_pending_comments_query(datetime.utcnow())
+    return list(get_comment_collection().find(query).sort('created_at', pymongo.ASCENDING).limit(limit))
+
+
+def release_pending_comment(comment_id: PyObjectId, retry_delay_seconds: int) -> int:
+    """
+    Postpones moderation of pending comment which validation failed
+    :param comment_id: id of comment
+    :param retry_delay_seconds: delay before next attempt
+    :return: number of failed moderation attempts of comment, or 0 if comment is not pending anymore
+    """
+    comment = get_comment_collection().find_one_and_update(
+        {'_id': comment_id, 'status': CommentStatus.pending.value},
+        {'$set': {'next_attempt_at': datetime.utcnow() + timedelta(seconds=retry_delay_seconds)},
+         '$inc': {'moderation_attempts': 1}},
+        return_document=ReturnDocument.AFTER)
+    return comment.get('moderation_attempts', 0) if comment else 0
+
+
+def set_pending_comment_status(comment_id: PyObjectId, comment_status: CommentStatus) -> bool:
+    """
+    Sets moderation result of pending comment
+    :param comment_id: id of comment
+    :param comment_status: new status of comment
+    :return: True if comment was pending and its status was changed, else False
+    """
+    result = get_comment_collection().update_one(
+        {'_id': comment_id, 'status': CommentStatus.pending.value},
+        {'$set': {'status': comment_status.value,
+                  'updated_at': datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")}})
+    evict_cached_counts(COMMENT_DOC)
+    return bool(result.modified_count)
 
 
 def delete_comment_in_db(comment_id: PyObjectId) -> bool:
@@ -61,47 +165,136 @@ def delete_comment_in_db(comment_id: PyObjectId) -> bool:
     :return: deletion result
     """
     result = get_comment_collection().delete_one({'_id': comment_id})
+    evict_cached_counts(COMMENT_DOC)
     return bool(result.deleted_count)
 
 
-def get_comment_statistics_for_certain_period(date_from: str, date_to: str) -> dict:
+def find_statistics(bucket_from: str, bucket_to: str, granularity: StatisticsGranularity,
+                    post_id: Optional[PyObjectId] = None) -> Dict[str, dict]:
     """
-    Finds comment statistics in database within given date range. Aggregates found statistics by day
+    Finds comment statistics in database within given range of buckets. Daily statistics of all posts are read from
+    statistics collection, other statistics are read from pre-aggregated rollups, so comments are never scanned
+    :param bucket_from: first bucket
+    :param bucket_to: last bucket
+    :param granularity: size of statistics buckets
+    :param post_id: if passed, only statistics of this post are returned
+    :return: found statistics by bucket
+    """
+    buckets_range = {'$gte': bucket_from, '$lte': bucket_to}
+    if granularity == StatisticsGranularity.day and post_id is None:
+        query = {'date': buckets_range}
+        statistics = get_statistic_collection().find(query, {'_id': 0}).sort('date', pymongo.ASCENDING)
+        return {item.pop('date'): item for item in statistics}
+
+    query = {'granularity': granularity.value, 'post_id': post_id, 'bucket': buckets_range}
+    projection = {'_id': 0, 'bucket': 1, 'blocked_comments': 1, 'created_comments': 1}
+    statistics = get_statistic_rollup_collection().find(query, projection).sort('bucket', pymongo.ASCENDING)
+    return {item.pop('bucket'): item for item in statistics}
+
+
+def get_comment_statistics_for_certain_period(date_from: str, date_to: str,
+                                              granularity: StatisticsGranularity = StatisticsGranularity.day,
+                                              post_id: Optional[PyObjectId] = None, zero_fill: bool = False) -> dict:
+    """
+    Returns comment statistics within given date range. Statistics of finished buckets are cached until statistics
+    version is changed, so only buckets that are not finished or not cached yet are read from database
     :param date_from: Start date for search
     :param date_to: End date for search
+    :param granularity: size of statistics buckets
+    :param post_id: if passed, only statistics of this post are returned
+    :param zero_fill: if true, buckets without comments are returned with zero counters
     :return: Found statistics
     """
-    query = {'date': {'$gte': date_from, '$lte': date_to}}
-    comment_statistics = list(get_statistic_collection().find(query, {'_id': 0}).sort('date', pymongo.ASCENDING))
-    formatted_statistics = [{item.pop('date'): item} for item in comment_statistics]
-    return {'items': formatted_statistics}
+    buckets = get_statistics_buckets(datetime.strptime(date_from, DATE_FORMAT), datetime.strptime(date_to, DATE_FORMAT),
+                                     granularity)
+    statistics_by_bucket = {}
+    version = get_statistics_version()
+    with statistics_cache_lock:
+        validate_statistics_cache(version)
+        for bucket in buckets:
+            key = (granularity.value, post_id, bucket)
+            if key in statistics_cache:
+                statistics_by_bucket[bucket] = statistics_cache[key]
+    not_cached_buckets = [bucket for bucket in buckets if bucket not in statistics_by_bucket]
+
+    if not_cached_buckets:
+        found_statistics = find_statistics(not_cached_buckets[0], not_cached_buckets[-1], granularity, post_id)
+        with statistics_cache_lock:
+            for bucket in not_cached_buckets:
+                statistics_by_bucket[bucket] = found_statistics.get(bucket)
+                if statistics_cache_version['version'] == version and \
+                        is_statistics_bucket_finished(bucket, granularity):
+                    statistics_cache[(granularity.value, post_id, bucket)] = statistics_by_bucket[bucket]
+
+    empty_statistics = {'blocked_comments': 0, 'created_comments': 0}
+    return {'items': [{bucket: statistics_by_bucket[bucket] or empty_statistics} for bucket in buckets
+                      if zero_fill or statistics_by_bucket[bucket] is not None]}
 
 
 def update_comments_statistics(increase_blocked_comments: bool = False,
-                               increase_created_comments: bool = False) -> None:
+                               increase_created_comments: bool = False, post_id: Optional[PyObjectId] = None) -> None:
     """
-    Updates comment statistics for current date
+    Updates comment statistics for current date and hour, weekly, monthly and per post rollups using atomic upserts.
+    If statistics buffer is enabled, increments are written to database by buffer flush
     :param increase_blocked_comments: if true, number of blocked comments will be increased
     :param increase_created_comments: if true, number of created comments will be increased
+    :param post_id: id of commented post
     :return: None
     """
-    current_date = datetime.utcnow().date().strftime("%Y-%m-%d")
-    existing_statistics = get_statistic_collection().find_one({'date': current_date})
-
-    data = existing_statistics if existing_statistics else {'date': current_date}
-    data = CommentStatisticsSchema(**data).model_dump()
-
     if increase_blocked_comments:
-        data['blocked_comments'] += 1
+        add_comments_statistics(post_id, blocked_comments=1)
     elif increase_created_comments:
-        data['created_comments'] += 1
-    get_statistic_collection().update_one({'date': current_date}, {'$set': data}, upsert=True)
+        add_comments_statistics(post_id, created_comments=1)
+
+
+def add_comments_statistics(post_id: Optional[PyObjectId] = None, blocked_comments: int = 0,
+                            created_comments: int = 0) -> None:
+    """
+    Adds numbers of blocked and created comments to statistics for current date and hour, weekly, monthly and per
+    post rollups using single write. Statistics are written after comments are saved, so failed write is logged
+    instead of failing request
+    :param post_id: id of commented post
+    :param blocked_comments: number of blocked comments
+    :param created_comments: number of created comments
+    :return: None
+    """
+    current_hour = datetime.utcnow().strftime(HOUR_FORMAT)
+    increments = {'blocked_comments': blocked_comments, 'created_comments': created_comments}
+
+    if get_settings().STATISTICS_BUFFER_ENABLED:
+        statistics_buffer.add(current_hour, post_id, **increments)
+        return
+    try:
+        write_statistics_increments({(current_hour, post_id): increments})
+    except Exception as _e:
+        get_logger().error(_e, exc_info=True)
+        metrics.increment('statistics_write_errors_total')
+
+
+def delete_post_comments_batch(post_id: PyObjectId, batch_size: int) -> int:
+    """
+    Removes comments of post with the smallest ids. Comments are removed by range of ids, so single request never
+    removes more than batch size comments
+    :param post_id: id of post
+    :param batch_size: max number of removed comments
+    :return: number of removed comments
+    """
+    comment_ids = [comment['_id'] for comment in get_comment_collection().find(
+        {'post_id': post_id}, {'_id': 1}).sort('_id', pymongo.ASCENDING).limit(batch_size)]
+    if not comment_ids:
+        return 0
+
+    result = get_comment_collection().delete_many({'post_id': post_id,
+                                                   '_id': {'$gte': comment_ids[0], '$lte': comment_ids[-1]}})
+    return result.deleted_count
 
 
-def delete_all_comments_related_to_post(post_id: PyObjectId) -> None:
+def delete_post_statistics(post_id: PyObjectId) -> None:
     """
-    Removes all comments that are related to post
+    Removes statistics rollups of post. Statistics of all posts are kept
     :param post_id: id of post
     :return: None
     """
-    get_comment_collection().delete_many({'post_id': post_id})
+    get_statistic_rollup_collection().delete_many(
+        {'granularity': {'$in': [granularity.value for granularity in StatisticsGranularity]}, 'post_id': post_id})
+    increase_statistics_version()
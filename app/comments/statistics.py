@@ -0,0 +1,247 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+from threading import Lock
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+from cachetools import LRUCache
+from pymongo import UpdateOne
+from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError
+
+from app.comments.schemas import StatisticsGranularity
+from app.config import get_settings
+from app.custom_fields import PyObjectId
+from app.database import get_statistic_collection, get_statistic_rollup_collection, \
+    get_statistics_recompute_collection
+from app.exceptions import StatisticsWriteError
+
+HOUR_FORMAT = '%Y-%m-%dT%H'
+DATE_FORMAT = '%Y-%m-%d'
+MONTH_FORMAT = '%Y-%m'
+
+# Daily statistics of all posts are stored in statistics collection, other buckets in statistics rollup collection
+GLOBAL_ROLLUP_GRANULARITIES = [StatisticsGranularity.hour, StatisticsGranularity.week, StatisticsGranularity.month]
+POST_ROLLUP_GRANULARITIES = [StatisticsGranularity.hour, StatisticsGranularity.day, StatisticsGranularity.week,
+                             StatisticsGranularity.month]
+
+# Statistics increments keyed by hour bucket and post id
+StatisticsIncrements = Dict[Tuple[str, Optional[PyObjectId]], Dict[str, int]]
+# Increments of daily statistics keyed by date
+DailyStatisticsIncrements = Dict[str, Dict[str, int]]
+# Increments of rollups keyed by granularity, bucket and post id
+RollupStatisticsIncrements = Dict[Tuple[str, str, Optional[PyObjectId]], Dict[str, int]]
+
+# Statistics of finished buckets change only when they are recomputed or removed. Such changes increase statistics
+# version in database, and every process clears its cache when it sees new version
+STATISTICS_VERSION_ID = 'statistics_version'
+statistics_cache = LRUCache(maxsize=get_settings().STATISTICS_CACHE_MAX_SIZE)
+statistics_cache_lock = Lock()
+statistics_cache_version = {'version': None}
+
+
+def get_statistics_bucket(moment: datetime, granularity: StatisticsGranularity) -> str:
+    """
+    Returns bucket of given granularity that contains moment. Week bucket is date of week monday
+    :param moment: moment of time
+    :param granularity: bucket granularity
+    :return: bucket name
+    """
+    if granularity == StatisticsGranularity.hour:
+        return moment.strftime(HOUR_FORMAT)
+    if granularity == StatisticsGranularity.week:
+        return (moment - timedelta(days=moment.weekday())).strftime(DATE_FORMAT)
+    if granularity == StatisticsGranularity.month:
+        return moment.strftime(MONTH_FORMAT)
+    return moment.strftime(DATE_FORMAT)
+
+
+def get_statistics_bucket_start(bucket: str, granularity: StatisticsGranularity) -> datetime:
+    """
+    Returns moment when bucket starts
+    :param bucket: bucket name
+    :param granularity: bucket granularity
+    :return: start of bucket
+    """
+    if granularity == StatisticsGranularity.hour:
+        return datetime.strptime(bucket, HOUR_FORMAT)
+    if granularity == StatisticsGranularity.month:
+        return datetime.strptime(bucket, MONTH_FORMAT)
+    return datetime.strptime(bucket, DATE_FORMAT)
+
+
+def get_statistics_bucket_end(bucket: str, granularity: StatisticsGranularity) -> datetime:
+    """
+    Returns moment when bucket ends
+    :param bucket: bucket name
+    :param granularity: bucket granularity
+    :return: end of bucket
+    """
+    bucket_start = get_statistics_bucket_start(bucket, granularity)
+    if granularity == StatisticsGranularity.hour:
+        return bucket_start + timedelta(hours=1)
+    if granularity == StatisticsGranularity.month:
+        return (bucket_start + timedelta(days=31)).replace(day=1)
+    return bucket_start + timedelta(days=7 if granularity == StatisticsGranularity.week else 1)
+
+
+def is_statistics_bucket_finished(bucket: str, granularity: StatisticsGranularity) -> bool:
+    """
+    Checks if statistics of bucket can not change anymore. Buffered statistics are written to database with delay,
+    so bucket is finished only after buffer flush interval
+    :param bucket: bucket name
+    :param granularity: bucket granularity
+    :return: result of the check
+    """
+    settings = get_settings()
+    write_delay = timedelta(seconds=settings.STATISTICS_FLUSH_INTERVAL_SECONDS if
+                            settings.STATISTICS_BUFFER_ENABLED else 0)
+    return get_statistics_bucket_end(bucket, granularity) + write_delay <= datetime.utcnow()
+
+
+def count_statistics_buckets(date_from: datetime, date_to: datetime, granularity: StatisticsGranularity) -> int:
+    """
+    Counts buckets of given granularity between dates without creating them
+    :param date_from: start date
+    :param date_to: end date, including the whole day
+    :param granularity: bucket granularity
+    :return: number of buckets
+    """
+    days = (date_to.date() - date_from.date()).days + 1
+    if granularity == StatisticsGranularity.hour:
+        return days * 24
+    if granularity == StatisticsGranularity.week:
+        first_monday = date_from.date() - timedelta(days=date_from.weekday())
+        last_monday = date_to.date() - timedelta(days=date_to.weekday())
+        return (last_monday - first_monday).days // 7 + 1
+    if granularity == StatisticsGranularity.month:
+        return (date_to.year - date_from.year) * 12 + date_to.month - date_from.month + 1
+    return days
+
+
+def get_statistics_buckets(date_from: datetime, date_to: datetime, granularity: StatisticsGranularity) -> List[str]:
+    """
+    Returns all buckets of given granularity between dates
+    :param date_from: start date
+    :param date_to: end date, including the whole day
+    :param granularity: bucket granularity
+    :return: bucket names in ascending order
+    """
+    step = timedelta(hours=1) if granularity == StatisticsGranularity.hour else timedelta(days=1)
+    moment, end = date_from, date_to + timedelta(days=1)
+    buckets = []
+    while moment < end:
+        bucket = get_statistics_bucket(moment, granularity)
+        if not buckets or buckets[-1] != bucket:
+            buckets.append(bucket)
+        moment += step
+    return buckets
+
+
+def get_statistics_version() -> int:
+    """
+    Returns version of statistics that is increased every time already written statistics are changed
+    :return: statistics version
+    """
+    document = get_statistics_recompute_collection().find_one({'_id': STATISTICS_VERSION_ID})
+    return document.get('version', 0) if document else 0
+
+
+def increase_statistics_version() -> None:
+    """
+    Increases statistics version, so cached statistics are cleared in every process
+    :return: None
+    """
+    get_statistics_recompute_collection().update_one({'_id': STATISTICS_VERSION_ID}, {'$inc': {'version': 1}},
+                                                     upsert=True)
+
+
+def validate_statistics_cache(version: int) -> None:
+    """
+    Clears statistics cache if it was filled with statistics of another version. Must be called under
+    statistics_cache_lock
+    :param version: current statistics version
+    :return: None
+    """
+    if statistics_cache_version['version'] != version:
+        statistics_cache.clear()
+        statistics_cache_version['version'] = version
+
+
+def split_statistics_increments(
+        increments: StatisticsIncrements) -> Tuple[DailyStatisticsIncrements, RollupStatisticsIncrements]:
+    """
+    Converts statistics increments to increments of daily statistics and of hourly, weekly, monthly and per post
+    rollups
+    :param increments: increments keyed by hour bucket and post id
+    :return: daily increments and rollup increments
+    """
+    daily_increments = defaultdict(lambda: defaultdict(int))
+    rollup_increments = defaultdict(lambda: defaultdict(int))
+
+    for (hour, post_id), counters in increments.items():
+        moment = datetime.strptime(hour, HOUR_FORMAT)
+        rollups = [(granularity, None) for granularity in GLOBAL_ROLLUP_GRANULARITIES]
+        if post_id is not None:
+            rollups.extend((granularity, post_id) for granularity in POST_ROLLUP_GRANULARITIES)
+
+        for field, value in counters.items():
+            daily_increments[moment.strftime(DATE_FORMAT)][field] += value
+            for granularity, rollup_post_id in rollups:
+                key = (granularity.value, get_statistics_bucket(moment, granularity), rollup_post_id)
+                rollup_increments[key][field] += value
+
+    return daily_increments, rollup_increments
+
+
+def write_increments(collection: Collection, increments: Dict[Hashable, Dict[str, int]],
+                     get_query: Callable[[Hashable], dict]) -> Dict[Hashable, Dict[str, int]]:
+    """
+    Applies increments using single unordered bulk write
+    :param collection: collection where increments are applied
+    :param increments: counters increments by key of document
+    :param get_query: function that creates query of document by its key
+    :return: increments that were not applied, because their write failed
+    """
+    keys = list(increments)
+    if not keys:
+        return {}
+
+    try:
+        collection.bulk_write([UpdateOne(get_query(key), {'$inc': dict(increments[key])}, upsert=True)
+                               for key in keys], ordered=False)
+    except BulkWriteError as _e:
+        return {keys[error['index']]: increments[keys[error['index']]] for error in _e.details['writeErrors']}
+    return {}
+
+
+def write_daily_statistics_increments(increments: DailyStatisticsIncrements) -> DailyStatisticsIncrements:
+    """
+    Applies increments to daily statistics
+    :param increments: increments keyed by date
+    :return: increments that were not applied
+    """
+    return write_increments(get_statistic_collection(), increments, lambda date: {'date': date})
+
+
+def write_rollup_statistics_increments(increments: RollupStatisticsIncrements) -> RollupStatisticsIncrements:
+    """
+    Applies increments to hourly, weekly, monthly and per post rollups
+    :param increments: increments keyed by granularity, bucket and post id
+    :return: increments that were not applied
+    """
+    return write_increments(get_statistic_rollup_collection(), increments,
+                            lambda key: {'granularity': key[0], 'bucket': key[1], 'post_id': key[2]})
+
+
+def write_statistics_increments(increments: StatisticsIncrements) -> None:
+    """
+    Applies statistics increments to daily statistics and to hourly, weekly, monthly and per post rollups
+    :param increments: increments keyed by hour bucket and post id
+    :return: None
+    """
+    daily_increments, rollup_increments = split_statistics_increments(increments)
+    failed_daily_increments = write_daily_statistics_increments(daily_increments)
+    failed_rollup_increments = write_rollup_statistics_increments(rollup_increments)
+    if failed_daily_increments or failed_rollup_increments:
+        raise StatisticsWriteError(f'statistics increments were not written: {dict(failed_daily_increments)}, '
+                                   f'{dict(failed_rollup_increments)}')
@@ -0,0 +1,134 @@
+import asyncio
+import time
+
+from collections import defaultdict
+from threading import Lock
+from typing import Callable, Optional
+
+from app.comments.statistics import StatisticsIncrements, DailyStatisticsIncrements, RollupStatisticsIncrements, \
+    split_statistics_increments, write_daily_statistics_increments, write_rollup_statistics_increments
+from app.config import get_settings
+from app.custom_fields import PyObjectId
+from app.database import run_in_database_executor
+from app.logger import get_logger
+from app.metrics.service import metrics
+
+
+class StatisticsBuffer:
+    """
+    Collects comment statistics increments in memory and writes them to database using bulk writes.
+    Buffer is flushed periodically, on shutdown and when number of buffered increments reaches max size.
+    Daily statistics and rollups are written separately, so only increments which write failed are kept for next flush
+    """
+
+    def __init__(self, max_size: int):
+        self._max_size = max_size
+        self._lock = Lock()
+        self._flush_lock = Lock()
+        self._counters: StatisticsIncrements = defaultdict(lambda: {'blocked_comments': 0,
+                                                                         'created_comments': 0})
+        self._size = 0
+        self._oldest_increment_at: Optional[float] = None
+        self._failed_daily_increments: DailyStatisticsIncrements = {}
+        self._failed_rollup_increments: RollupStatisticsIncrements = {}
+
+    def add(self, hour: str, post_id: Optional[PyObjectId] = None, blocked_comments: int = 0,
+            created_comments: int = 0) -> None:
+        """
+        Adds increments of statistics for given hour and post
+        :param hour: hour bucket of statistics
+        :param post_id: id of commented post
+        :param blocked_comments: number of blocked comments
+        :param created_comments: number of created comments
+        :return: None
+        """
+        with self._lock:
+            self._counters[(hour, post_id)]['blocked_comments'] += blocked_comments
+            self._counters[(hour, post_id)]['created_comments'] += created_comments
+            self._size += 1
+            if self._oldest_increment_at is None:
+                self._oldest_increment_at = time.monotonic()
+            metrics.set_gauge('statistics_buffer_size', self._size)
+            buffer_is_full = self._size >= self._max_size
+
+        if buffer_is_full:
+            self.flush()
+
+    def _take_counters(self) -> tuple:
+        """
+        Takes buffered counters and clears buffer
+        :return: buffered counters, number of increments and time of the oldest increment
+        """
+        with self._lock:
+            counters, size, oldest_increment_at = dict(self._counters), self._size, self._oldest_increment_at
+            self._counters.clear()
+            self._size = 0
+            self._oldest_increment_at = None
+            metrics.set_gauge('statistics_buffer_size', 0)
+        return counters, size, oldest_increment_at
+
+    @staticmethod
+    def _merge_increments(increments: dict, failed_increments: dict) -> None:
+        """
+        Adds increments that were not written during previous flush to increments of current flush
+        :param increments: increments of current flush
+        :param failed_increments: increments that were not written
+        :return: None
+        """
+        for key, counters in failed_increments.items():
+            for field, value in counters.items():
+                increments[key][field] += value
+
+    @staticmethod
+    def _write_increments(write: Callable[[dict], dict], increments: dict) -> dict:
+        """
+        Writes increments to database
+        :param write: function that writes increments and returns increments which write failed
+        :param increments: increments that will be written
+        :return: increments that were not written
+        """
+        try:
+            failed_increments = write(increments)
+        except Exception as _e:
+            failed_increments = increments
+            get_logger().error(_e, exc_info=True)
+        if failed_increments:
+            metrics.increment('statistics_buffer_flush_errors_total')
+        return failed_increments
+
+    def flush(self) -> None:
+        """
+        Writes buffered counters to database. Increments which write failed stay in buffer until next flush
+        :return: None
+        """
+        with self._flush_lock:
+            counters, size, oldest_increment_at = self._take_counters()
+            if not counters and not self._failed_daily_increments and not self._failed_rollup_increments:
+                return
+
+            daily_increments, rollup_increments = split_statistics_increments(counters)
+            self._merge_increments(daily_increments, self._failed_daily_increments)
+            self._merge_increments(rollup_increments, self._failed_rollup_increments)
+
+            self._failed_daily_increments = self._write_increments(write_daily_statistics_increments,
+                                                                   daily_increments)
+            self._failed_rollup_increments = self._write_increments(write_rollup_statistics_increments,
+                                                                    rollup_increments)
+
+            if size:
+                metrics.observe('statistics_buffer_flush_size', size)
+                metrics.observe('statistics_buffer_flush_lag_seconds', time.monotonic() - oldest_increment_at)
+
+
+statistics_buffer = StatisticsBuffer(max_size=get_settings().STATISTICS_BUFFER_MAX_SIZE)
+
+
+async def flush_statistics_buffer_periodically(interval_seconds: int) -> None:
+    """
+    Flushes statistics buffer of current process with given interval until task is cancelled
+    :param interval_seconds: interval between flushes
+    :return: None
+    """
+    while True:
+        await asyncio.sleep(interval_seconds)
+        await run_in_database_executor(statistics_buffer.flush)
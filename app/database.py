@@ -1,20 +1,36 @@
+import asyncio
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+from typing import Any, Callable, Awaitable, Dict, List
+
 from pymongo import MongoClient
 from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError
 
 from app.config import get_settings
 
 settings = get_settings()
 
-mongo_client = MongoClient(settings.MONGO_URL)
+mongo_client = MongoClient(settings.MONGO_URL, maxPoolSize=settings.DATABASE_EXECUTOR_MAX_WORKERS)
 db = mongo_client[settings.DATABASE_NAME]
 
+database_executor = ThreadPoolExecutor(max_workers=settings.DATABASE_EXECUTOR_MAX_WORKERS,
+                                       thread_name_prefix='database')
+
 
 USER_DOC = 'users'
 POST_DOC = 'posts'
 COMMENT_DOC = 'comments'
 STATISTICS_DOC = 'statistics'
+STATISTICS_ROLLUP_DOC = 'statistics_rollups'
+STATISTICS_RECOMPUTE_DOC = 'statistics_recompute'
+MODERATION_VERDICT_DOC = 'moderation_verdicts'
+SCHEDULER_JOB_DOC = 'scheduler_jobs'
+REPLY_QUEUE_DOC = 'reply_queue'
+LEASE_DOC = 'leases'
 
-db.users.create_index(['email'], unique=True)
+DUPLICATE_KEY_ERROR_CODE = 11000
 
 
 def get_user_collection() -> Collection:
@@ -56,3 +72,83 @@ def get_statistic_collection() -> Collection:
     :return: statistics collection
     """
     return db.get_collection(STATISTICS_DOC)
+
+
+def get_statistic_rollup_collection() -> Collection:
+    """
+    returns statistics rollup collection
+    :return: statistics rollup collection
+    """
+    return db.get_collection(STATISTICS_ROLLUP_DOC)
+
+
+def get_statistics_recompute_collection() -> Collection:
+    """
+    returns collection with checkpoints of statistics recompute
+    :return: statistics recompute collection
+    """
+    return db.get_collection(STATISTICS_RECOMPUTE_DOC)
+
+
+def get_reply_queue_collection() -> Collection:
+    """
+    returns queue of automatic answers to comments
+    :return: reply queue collection
+    """
+    return db.get_collection(REPLY_QUEUE_DOC)
+
+
+def get_lease_collection() -> Collection:
+    """
+    returns collection with leases of background worker instances
+    :return: lease collection
+    """
+    return db.get_collection(LEASE_DOC)
+
+
+def get_moderation_verdict_collection() -> Collection:
+    """
+    returns moderation verdict collection
+    :return: moderation verdict collection
+    """
+    return db.get_collection(MODERATION_VERDICT_DOC)
+
+
+async def run_in_database_executor(func: Callable, *args, **kwargs) -> Any:
+    """
+    Runs blocking database function in bounded database executor, so event loop is not blocked while it waits for
+    database response
+    :param func: function that will be executed
+    :param args: function positional arguments
+    :param kwargs: function keyword arguments
+    :return: function result
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(database_executor, partial(func, *args, **kwargs))
+
+
+def make_async(func: Callable) -> Callable[..., Awaitable]:
+    """
+    Creates coroutine function that runs passed function in database executor
+    :param func: blocking database function
+    :return: coroutine function with same signature
+    """
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_in_database_executor(func, *args, **kwargs)
+    return wrapper
+
+
+def insert_documents_unordered(collection: Collection, documents: List[dict]) -> Dict[int, dict]:
+    """
+    Inserts documents using single unordered request, so document that failed to insert does not stop insertion of
+    others. Ids of inserted documents are set to documents
+    :param collection: collection where documents are inserted
+    :param documents: documents that will be inserted
+    :return: write errors by index of document that was not inserted
+    """
+    try:
+        collection.insert_many(documents, ordered=False)
+    except BulkWriteError as _e:
+        return {error['index']: error for error in _e.details['writeErrors']}
+    return {}
@@ -0,0 +1,11 @@
+
+class InvalidCursor(Exception):
+    pass
+
+
+class StatisticsWriteError(Exception):
+    pass
+
+
+class IndexMigrationError(Exception):
+    pass
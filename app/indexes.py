@@ -0,0 +1,231 @@
+import sys
+
+from datetime import datetime
+from typing import Dict, List, Iterator
+
+import pymongo
+from bson import ObjectId
+from pymongo import IndexModel
+from pymongo.collection import Collection
+from pymongo.errors import OperationFailure
+
+from app.comments.recompute import get_created_comments_query
+from app.comments.service import get_post_match_pipeline, get_pending_comments_query
+from app.config import get_settings
+from app.database import get_collection_by_name, DUPLICATE_KEY_ERROR_CODE, USER_DOC, POST_DOC, COMMENT_DOC, \
+    STATISTICS_DOC, STATISTICS_ROLLUP_DOC, MODERATION_VERDICT_DOC, REPLY_QUEUE_DOC
+from app.exceptions import IndexMigrationError
+from app.logger import get_logger
+from app.post.service import NOT_DELETED_POST_QUERY, get_not_deleted_posts_pipeline
+from app.replies.service import get_due_replies_query
+from app.service import PAGINATION_SORT, encode_cursor, get_cursor_match_pipeline
+
+# Errors returned when index with the same name or keys exists, but has different options
+INDEX_CONFLICT_ERROR_CODES = {85, 86}
+
+INDEXES: Dict[str, List[IndexModel]] = {
+    USER_DOC: [
+        IndexModel([('email', pymongo.ASCENDING)], unique=True),
+    ],
+    POST_DOC: [
+        # Deleted posts have no title and are not indexed, so their titles can be used again
+        IndexModel([('user_id', pymongo.ASCENDING), ('title', pymongo.ASCENDING)], unique=True,
+                   partialFilterExpression={'title': {'$exists': True}}),
+        IndexModel([('created_at', pymongo.ASCENDING), ('_id', pymongo.ASCENDING)]),
+        IndexModel([('deleted_at', pymongo.ASCENDING)], name='deleted_posts_deleted_at',
+                   partialFilterExpression={'deleted_at': {'$exists': True}}),
+    ],
+    COMMENT_DOC: [
+        IndexModel([('post_id', pymongo.ASCENDING), ('created_at', pymongo.ASCENDING), ('_id', pymongo.ASCENDING)]),
+        IndexModel([('post_id', pymongo.ASCENDING), ('_id', pymongo.ASCENDING)]),
+        IndexModel([('created_at', pymongo.ASCENDING)]),
+        IndexModel([('status', pymongo.ASCENDING), ('created_at', pymongo.ASCENDING)],
+                   name='pending_comments_created_at', partialFilterExpression={'status': 'pending'}),
+    ],
+    STATISTICS_DOC: [
+        IndexModel([('date', pymongo.ASCENDING)], unique=True),
+    ],
+    STATISTICS_ROLLUP_DOC: [
+        IndexModel([('granularity', pymongo.ASCENDING), ('post_id', pymongo.ASCENDING), ('bucket', pymongo.ASCENDING)],
+                   unique=True),
+    ],
+    REPLY_QUEUE_DOC: [
+        IndexModel([('run_at', pymongo.ASCENDING)]),
+        IndexModel([('post_id', pymongo.ASCENDING)]),
+    ],
+    MODERATION_VERDICT_DOC: [
+        IndexModel([('created_at', pymongo.ASCENDING)], expireAfterSeconds=get_settings().VERDICT_CACHE_TTL_SECONDS),
+    ],
+}
+
+
+def get_pipeline_filter(*pipelines: list) -> dict:
+    """
+    Combines match stages of pipelines into single query, so pipeline used by service can be explained as find query
+    :param pipelines: pipelines that contain only match stages
+    :return: query
+    """
+    queries = [stage['$match'] for pipeline in pipelines for stage in pipeline]
+    return queries[0] if len(queries) == 1 else {'$and': queries}
+
+
+PAGINATION_CURSOR = encode_cursor({'created_at': '2024-01-01T00:00:00Z', '_id': ObjectId()})
+PAGINATION_SORT_KEYS = list(PAGINATION_SORT.items())
+
+# Queries executed by services. Every query must be covered by index declared in INDEXES. Queries are built by the
+# same helpers that services use, so changed service query is checked without changes in this list
+QUERIES: List[dict] = [
+    {'collection': USER_DOC, 'filter': {'email': 'user@email.com'}},
+    {'collection': USER_DOC, 'filter': {'_id': ObjectId()}},
+    {'collection': POST_DOC, 'filter': {'_id': ObjectId(), **NOT_DELETED_POST_QUERY}},
+    {'collection': POST_DOC, 'filter': {'_id': {'$in': [ObjectId(), ObjectId()]}, **NOT_DELETED_POST_QUERY}},
+    {'collection': POST_DOC, 'filter': get_pipeline_filter(get_not_deleted_posts_pipeline()),
+     'sort': PAGINATION_SORT_KEYS},
+    {'collection': POST_DOC,
+     'filter': get_pipeline_filter(get_not_deleted_posts_pipeline(), get_cursor_match_pipeline(PAGINATION_CURSOR)),
+     'sort': PAGINATION_SORT_KEYS},
+    {'collection': POST_DOC, 'filter': {'deleted_at': {'$exists': True}}, 'sort': [('deleted_at', pymongo.ASCENDING)]},
+    {'collection': COMMENT_DOC, 'filter': {'_id': ObjectId()}},
+    {'collection': COMMENT_DOC, 'filter': {'_id': {'$in': [ObjectId(), ObjectId()]}}},
+    {'collection': COMMENT_DOC, 'filter': get_pipeline_filter(get_post_match_pipeline(ObjectId())),
+     'sort': PAGINATION_SORT_KEYS},
+    {'collection': COMMENT_DOC,
+     'filter': get_pipeline_filter(get_post_match_pipeline(ObjectId()), get_cursor_match_pipeline(PAGINATION_CURSOR)),
+     'sort': PAGINATION_SORT_KEYS},
+    {'collection': COMMENT_DOC, 'filter': {'post_id': ObjectId()}, 'sort': [('_id', pymongo.ASCENDING)]},
+    {'collection': COMMENT_DOC, 'filter': get_created_comments_query(datetime(2024, 1, 1), datetime(2024, 1, 8))},
+    {'collection': COMMENT_DOC, 'filter': get_pending_comments_query(datetime(2024, 1, 1)),
+     'sort': [('created_at', pymongo.ASCENDING)]},
+    {'collection': STATISTICS_DOC, 'filter': {'date': {'$gte': '2024-01-01', '$lte': '2024-12-31'}},
+     'sort': [('date', pymongo.ASCENDING)]},
+    {'collection': STATISTICS_ROLLUP_DOC,
+     'filter': {'granularity': 'week', 'post_id': None, 'bucket': {'$gte': '2024-01-01', '$lte': '2024-12-30'}},
+     'sort': [('bucket', pymongo.ASCENDING)]},
+    {'collection': STATISTICS_ROLLUP_DOC, 'filter': {'granularity': {'$in': ['hour', 'day', 'week', 'month']},
+                                                     'post_id': ObjectId()}},
+    {'collection': REPLY_QUEUE_DOC, 'filter': get_due_replies_query(datetime(2024, 1, 1)),
+     'sort': [('run_at', pymongo.ASCENDING)]},
+    {'collection': REPLY_QUEUE_DOC,
+     'filter': {'_id': {'$in': [ObjectId(), ObjectId()]}, **get_due_replies_query(datetime(2024, 1, 1))}},
+    {'collection': REPLY_QUEUE_DOC, 'filter': {'_id': {'$in': [ObjectId(), ObjectId()]}, 'claim_id': 'claim_id'}},
+    {'collection': REPLY_QUEUE_DOC, 'filter': {'post_id': ObjectId()}},
+    {'collection': MODERATION_VERDICT_DOC, 'filter': {'_id': 'verdict_key'}},
+    {'collection': MODERATION_VERDICT_DOC, 'filter': {'_id': {'$in': ['verdict_key', 'another_verdict_key']}}},
+]
+
+
+def find_duplicated_keys(collection: Collection, index: IndexModel, limit: int = 10) -> List[dict]:
+    """
+    Finds values of index keys that are used by several documents, so unique index can not be created
+    :param collection: indexed collection
+    :param index: unique index
+    :param limit: max number of returned values
+    :return: duplicated values of index keys and number of documents that use them
+    """
+    pipeline = []
+    if index.document.get('partialFilterExpression'):
+        pipeline.append({'$match': index.document['partialFilterExpression']})
+    pipeline.extend([
+        {'$group': {'_id': {field: f'${field}' for field in index.document['key']}, 'count': {'$sum': 1}}},
+        {'$match': {'count': {'$gt': 1}}},
+        {'$limit': limit}
+    ])
+    return list(collection.aggregate(pipeline, allowDiskUse=True))
+
+
+def get_index_migration_error(collection: Collection, index: IndexModel) -> IndexMigrationError:
+    """
+    Creates error about unique index that can not be created because of duplicated documents
+    :param collection: indexed collection
+    :param index: unique index
+    :return: error
+    """
+    duplicated_keys = [item['_id'] for item in find_duplicated_keys(collection, index)]
+    return IndexMigrationError(f'unique index {index.document["name"]} of {collection.name} collection can not be '
+                               f'created, because several documents have the same values: {duplicated_keys}. '
+                               f'Remove duplicated documents before startup')
+
+
+def create_index(collection: Collection, index: IndexModel) -> List[str]:
+    """
+    Creates index. Existing index with changed options is recreated. Unique index is dropped only if collection does
+    not contain duplicated documents, so failed migration does not leave collection without index
+    :param collection: indexed collection
+    :param index: index that will be created
+    :return: names of created indexes
+    """
+    try:
+        return collection.create_indexes([index])
+    except OperationFailure as _e:
+        if _e.code == DUPLICATE_KEY_ERROR_CODE:
+            raise get_index_migration_error(collection, index) from _e
+        if _e.code not in INDEX_CONFLICT_ERROR_CODES:
+            raise
+
+    if index.document.get('unique') and find_duplicated_keys(collection, index, limit=1):
+        raise get_index_migration_error(collection, index)
+
+    get_logger().warning(f'index {index.document["name"]} of {collection.name} collection is recreated because its '
+                         f'options were changed')
+    collection.drop_index(index.document['name'])
+    try:
+        return collection.create_indexes([index])
+    except OperationFailure as _e:
+        if _e.code == DUPLICATE_KEY_ERROR_CODE:
+            raise get_index_migration_error(collection, index) from _e
+        raise
+
+
+def sync_indexes() -> None:
+    """
+    Creates indexes declared in INDEXES. Existing indexes with changed options are recreated. Indexes that exist in
+    database but not declared are reported in logs
+    :return: None
+    """
+    logger = get_logger()
+    for collection_name, indexes in INDEXES.items():
+        collection = get_collection_by_name(collection_name)
+        created_indexes = set()
+        for index in indexes:
+            created_indexes.update(create_index(collection, index))
+        unknown_indexes = set(collection.index_information()) - created_indexes - {'_id_'}
+        for index_name in unknown_indexes:
+            logger.warning(f'index {index_name} of {collection_name} collection is not declared in index registry')
+
+
+def get_plan_stages(plan: dict) -> Iterator[str]:
+    """
+    Walks through query plan and returns names of all its stages
+    :param plan: query plan from explain result
+    :return: stage names
+    """
+    yield plan.get('stage')
+    if 'inputStage' in plan:
+        yield from get_plan_stages(plan['inputStage'])
+    for input_stage in plan.get('inputStages', []):
+        yield from get_plan_stages(input_stage)
+
+
+def check_query_plans() -> List[dict]:
+    """
+    Explains every query from QUERIES and finds queries that use collection scan
+    :return: queries that use collection scan
+    """
+    failed_queries = []
+    for query in QUERIES:
+        cursor = get_collection_by_name(query['collection']).find(query['filter'])
+        if query.get('sort'):
+            cursor = cursor.sort(query['sort'])
+        winning_plan = cursor.explain()['queryPlanner']['winningPlan']
+        if 'COLLSCAN' in get_plan_stages(winning_plan.get('queryPlan', winning_plan)):
+            failed_queries.append(query)
+    return failed_queries
+
+
+if __name__ == '__main__':
+    sync_indexes()
+    if '--check' in sys.argv:
+        collection_scans = check_query_plans()
+        for failed_query in collection_scans:
+            print(f'COLLSCAN: {failed_query}')
+        sys.exit(1 if collection_scans else 0)
@@ -0,0 +1,34 @@
+from datetime import datetime, timedelta
+
+from pymongo.errors import DuplicateKeyError
+
+from app.database import get_lease_collection
+
+
+def acquire_lease(name: str, owner: str, ttl_seconds: int) -> bool:
+    """
+    Acquires or renews lease. Lease can be acquired if it does not exist, is expired or already belongs to owner
+    :param name: lease name
+    :param owner: unique id of lease owner
+    :param ttl_seconds: time after which lease expires if it is not renewed
+    :return: True if owner holds lease, else False
+    """
+    current_time = datetime.utcnow()
+    try:
+        get_lease_collection().find_one_and_update(
+            {'_id': name, '$or': [{'owner': owner}, {'expires_at': {'$lt': current_time}}]},
+            {'$set': {'owner': owner, 'expires_at': current_time + timedelta(seconds=ttl_seconds)}},
+            upsert=True)
+    except DuplicateKeyError:
+        return False
+    return True
+
+
+def release_lease(name: str, owner: str) -> None:
+    """
+    Releases lease, so other instances can acquire it without waiting for expiration
+    :param name: lease name
+    :param owner: unique id of lease owner
+    :return: None
+    """
+    get_lease_collection().delete_one({'_id': name, 'owner': owner})
@@ -1,12 +1,16 @@
-from apscheduler.executors.pool import ThreadPoolExecutor, ProcessPoolExecutor
-from apscheduler.jobstores.memory import MemoryJobStore
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
+import asyncio
+import contextlib
+
 from fastapi import FastAPI
-from pytz import utc
 
 from app.api import api_router
 from app.logger import get_logger
 from app.config import get_settings
+from app.auth.hashing import password_hashing_pool
+from app.comments.statistics_buffer import statistics_buffer, flush_statistics_buffer_periodically
+from app.database import database_executor
+from app.indexes import sync_indexes
+from app.vertex_ai_core.moderation import moderation_batcher
 
 
 def get_application() -> FastAPI:
@@ -21,29 +25,29 @@ def get_application() -> FastAPI:
     return application
 
 
-jobstores = {
-    'default': MemoryJobStore()
-}
-
-executors = {
-    'default': ThreadPoolExecutor(20),
-    'processpool': ProcessPoolExecutor(5)
-}
-job_defaults = {
-    'coalesce': False,
-    'max_instances': 3
-}
-
-scheduler = AsyncIOScheduler(jobstores=jobstores, executors=executors, job_defaults=job_defaults, timezone=utc)
-
 app = get_application()
 
+# Background jobs are run by worker process (app/worker.py). API only flushes statistics collected in this process
+statistics_flush_task = None
+
 
 @app.on_event('startup')
 async def startup_event():
-    scheduler.start()
+    global statistics_flush_task
+
+    sync_indexes()
+    if get_settings().STATISTICS_BUFFER_ENABLED:
+        statistics_flush_task = asyncio.create_task(
+            flush_statistics_buffer_periodically(get_settings().STATISTICS_FLUSH_INTERVAL_SECONDS))
 
 
 @app.on_event('shutdown')
 async def shutdown_event():
-    scheduler.shutdown()
+    if statistics_flush_task:
+        statistics_flush_task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await statistics_flush_task
+    await moderation_batcher.close()
+    statistics_buffer.flush()
+    database_executor.shutdown(wait=True)
+    password_hashing_pool.shutdown()
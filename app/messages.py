@@ -3,6 +3,7 @@ TOKEN_DECODE_ERROR = 'Invalid or expired token'
 INCORRECT_LOGIN_INPUT = 'Please enter the correct email and password'
 EMAIL_VALIDATION_ERROR = 'Invalid email value'
 CREDENTIALS_INCORRECT = 'Could not validate credentials'
+PASSWORD_HASHING_UNAVAILABLE = 'Server is busy. Please try again later'
 
 POST_NOT_FOUND = 'Post not found'
 POST_ALREADY_EXISTS = 'You already created post with given title'
@@ -21,3 +22,10 @@ COMMENT_DELETE_NOT_ALLOWED = "You can't delete someone else`s comment"
 
 AI_REQUEST_QUOTA_EXCEEDED = 'AI Request quota exceeded. Please try again later'
 AI_VALIDATION_ERROR = 'AI validation currently unavailable. Please try again later'
+AI_TEMPORARILY_UNAVAILABLE = 'AI validation is temporarily disabled because of AI service failures. Please try again '\
+                             'later'
+
+INVALID_CURSOR = 'Invalid pagination cursor'
+STATISTICS_INVALID_PERIOD = 'End date of statistics period must not be earlier than start date'
+STATISTICS_PERIOD_TOO_LONG = 'Statistics period contains too many buckets. Choose shorter period or larger granularity'
+BULK_ITEM_NOT_CREATED = 'Item was not saved. Please try again later'
@@ -0,0 +1,18 @@
+from typing import Annotated
+
+from fastapi import APIRouter, Depends
+from starlette import status
+
+from app.auth.dependencies import get_current_user
+from app.auth.schemas import UserReadSchema
+from app.metrics.service import metrics
+
+router = APIRouter(
+    prefix='/metrics',
+    tags=['metrics']
+)
+
+
+@router.get(path='/', status_code=status.HTTP_200_OK)
+async def read_metrics(current_user: Annotated[UserReadSchema, Depends(get_current_user)]):
+    return metrics.snapshot()
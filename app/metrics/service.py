@@ -0,0 +1,62 @@
+from collections import defaultdict
+from threading import Lock
+
+
+class MetricsRegistry:
+    """
+    In-process registry of application metrics
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._counters = defaultdict(int)
+        self._gauges = {}
+        self._observations = {}
+
+    def increment(self, name: str, value: int = 1) -> None:
+        """
+        Increases counter
+        :param name: counter name
+        :param value: value that will be added to counter
+        :return: None
+        """
+        with self._lock:
+            self._counters[name] += value
+
+    def set_gauge(self, name: str, value: float) -> None:
+        """
+        Sets current value of gauge
+        :param name: gauge name
+        :param value: current value
+        :return: None
+        """
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, value: float) -> None:
+        """
+        Records observed value, for example duration of operation
+        :param name: observation name
+        :param value: observed value
+        :return: None
+        """
+        with self._lock:
+            observation = self._observations.setdefault(name, {'count': 0, 'sum': 0.0, 'max': 0.0})
+            observation['count'] += 1
+            observation['sum'] += value
+            observation['max'] = max(observation['max'], value)
+
+    def snapshot(self) -> dict:
+        """
+        Returns current values of all metrics
+        :return: metrics data
+        """
+        with self._lock:
+            return {
+                'counters': dict(self._counters),
+                'gauges': dict(self._gauges),
+                'observations': {name: dict(value) for name, value in self._observations.items()}
+            }
+
+
+metrics = MetricsRegistry()
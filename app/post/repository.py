@@ -0,0 +1,11 @@
+from app.database import make_async
+from app.post import service
+
+create_post_in_db = make_async(service.create_post_in_db)
+create_posts_in_db = make_async(service.create_posts_in_db)
+find_post_by_id = make_async(service.find_post_by_id)
+find_posts_by_ids = make_async(service.find_posts_by_ids)
+update_post = make_async(service.update_post)
+delete_post_in_db = make_async(service.delete_post_in_db)
+find_oldest_deleted_post = make_async(service.find_oldest_deleted_post)
+purge_post = make_async(service.purge_post)
@@ -1,17 +1,21 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
-from typing import Annotated
+from typing import Annotated, Optional
 from starlette import status
 from starlette.responses import JSONResponse
+from pymongo.errors import DuplicateKeyError
 
 from app.auth.dependencies import get_current_user
 from app.auth.schemas import UserReadSchema
 from app.custom_fields import PyObjectId
 from app import messages
-from app.database import POST_DOC
-from app.service import paginate_collection
-from app.post.service import create_post_in_db, find_post_by_id, update_post, delete_post_in_db, \
-    check_post_duplication_from_user
-from app.post.schema import PostCreateInSchema, PostReadSchema, PostUpdateSchema, PostReadPaginationSchema
+from app.database import POST_DOC, DUPLICATE_KEY_ERROR_CODE
+from app.exceptions import InvalidCursor
+from app.repository import paginate_collection, paginate_collection_by_cursor
+from app.post.repository import create_post_in_db, create_posts_in_db, find_post_by_id, update_post, delete_post_in_db
+from app.post.service import build_post_document, get_not_deleted_posts_pipeline
+from app.vertex_ai_core.moderation import validate_text_with_ai, validate_texts_with_ai
+from app.post.schema import PostCreateInSchema, PostReadSchema, PostUpdateSchema, PostReadPaginationSchema, \
+    PostBulkCreateInSchema, PostBulkCreateResponseSchema
 
 router = APIRouter(
     prefix='/posts',
@@ -21,24 +25,61 @@ router = APIRouter(
 
 @router.post(path='/', status_code=status.HTTP_201_CREATED, response_model=PostReadSchema)
 async def create_post(post: PostCreateInSchema, current_user: Annotated[UserReadSchema, Depends(get_current_user)]):
-    if check_post_duplication_from_user(post.title, current_user.id):
+    await validate_text_with_ai({"title": post.title, "text": post.text})
+    try:
+        return await create_post_in_db(post.model_dump(), user_id=current_user.id)
+    except DuplicateKeyError:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=messages.POST_ALREADY_EXISTS)
 
-    created_post_id = create_post_in_db(post.model_dump(), user_id=current_user.id)
-    created_post = find_post_by_id(created_post_id)
-    return created_post
+
+@router.post(path='/bulk', status_code=status.HTTP_200_OK, response_model=PostBulkCreateResponseSchema)
+async def create_posts(posts: PostBulkCreateInSchema,
+                       current_user: Annotated[UserReadSchema, Depends(get_current_user)]):
+    moderation_errors = await validate_texts_with_ai([{"title": post.title, "text": post.text}
+                                                      for post in posts.items])
+
+    results = [{'index': index, 'created': False} for index in range(len(posts.items))]
+    documents, document_indexes = [], []
+    for index, (post, moderation_error) in enumerate(zip(posts.items, moderation_errors)):
+        if moderation_error:
+            results[index]['detail'] = moderation_error.errors()
+            continue
+        documents.append(build_post_document(post.model_dump(), user_id=current_user.id))
+        document_indexes.append(index)
+
+    write_errors = await create_posts_in_db(documents) if documents else {}
+    for document_index, (index, document) in enumerate(zip(document_indexes, documents)):
+        if document_index not in write_errors:
+            results[index].update({'created': True, 'post': document})
+        elif write_errors[document_index].get('code') == DUPLICATE_KEY_ERROR_CODE:
+            results[index]['detail'] = messages.POST_ALREADY_EXISTS
+        else:
+            results[index]['detail'] = messages.BULK_ITEM_NOT_CREATED
+    return {'items': results}
 
 
 @router.get(path='/', status_code=status.HTTP_200_OK, response_model=PostReadPaginationSchema)
 async def get_list_of_posts(current_user: Annotated[UserReadSchema, Depends(get_current_user)],
                             page: int = Query(1, gt=0, lt=2147483647),
-                            page_size: int = Query(1, gt=0, lt=2147483647)):
-    return paginate_collection(collection_name=POST_DOC, pipeline=[], page=page, items_per_page=page_size)
+                            page_size: int = Query(1, gt=0, lt=2147483647),
+                            cursor: Optional[str] = Query(None, description='Cursor from previous page. If passed, '
+                                                                            'page parameter is ignored'),
+                            exact_count: bool = Query(False, description='If true, total items count is calculated '
+                                                                         'exactly')):
+    pipeline = get_not_deleted_posts_pipeline()
+    if cursor is None:
+        return await paginate_collection(collection_name=POST_DOC, pipeline=pipeline, page=page,
+                                         items_per_page=page_size, exact_count=exact_count)
+    try:
+        return await paginate_collection_by_cursor(collection_name=POST_DOC, pipeline=pipeline, cursor=cursor,
+                                                   items_per_page=page_size, exact_count=exact_count)
+    except InvalidCursor:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=messages.INVALID_CURSOR)
 
 
 @router.get(path='/{post_id}', status_code=status.HTTP_200_OK, response_model=PostReadSchema)
 async def read_post(post_id: PyObjectId, current_user: Annotated[UserReadSchema, Depends(get_current_user)]):
-    post = find_post_by_id(post_id)
+    post = await find_post_by_id(post_id)
     if not post:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=messages.POST_NOT_FOUND)
 
@@ -47,24 +88,27 @@ async def read_post(post_id: PyObjectId, current_user: Annotated[UserReadSchema,
 
 @router.patch(path='/{post_id}', status_code=status.HTTP_200_OK, response_model=PostReadSchema)
 async def edit_post(post_id: PyObjectId, post_data: PostUpdateSchema, current_user: Annotated[UserReadSchema, Depends(get_current_user)]):
-    old_post = find_post_by_id(post_id)
-    if not old_post:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=messages.POST_NOT_FOUND)
-    if old_post.get('user_id') != current_user.id:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=messages.POST_EDIT_NOT_ALLOWED)
+    try:
+        updated_post = await update_post(post_id, post_data.model_dump(exclude_unset=True, exclude_none=True),
+                                         user_id=current_user.id)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=messages.POST_ALREADY_EXISTS)
+    if updated_post:
+        return updated_post
 
-    updated_post_id = update_post(post_id, post_data.model_dump(exclude_unset=True, exclude_none=True))
-    updated_post = find_post_by_id(updated_post_id)
-    return updated_post
+    # Post is read only if it was not updated to find out the reason
+    if not await find_post_by_id(post_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=messages.POST_NOT_FOUND)
+    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=messages.POST_EDIT_NOT_ALLOWED)
 
 
 @router.delete(path='/{post_id}')
 async def delete_post(post_id: PyObjectId, current_user: Annotated[UserReadSchema, Depends(get_current_user)]):
-    post = find_post_by_id(post_id)
+    post = await find_post_by_id(post_id)
     if not post:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=messages.POST_NOT_FOUND)
     if post.get('user_id') != current_user.id:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=messages.POST_DELETE_NOT_ALLOWED)
 
-    result = delete_post_in_db(post_id)
+    result = await delete_post_in_db(post_id)
     return JSONResponse(status_code=status.HTTP_200_OK, content={'deleted': result})
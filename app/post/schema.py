@@ -1,16 +1,9 @@
 from datetime import datetime
-from typing import Optional, List
-from fastapi import HTTPException
-from starlette import status
+from typing import Any, Optional, List
 
-
-from google.api_core.exceptions import ResourceExhausted
-from pydantic import BaseModel, Field, model_validator
+from pydantic import BaseModel, Field
 
 from app.config import get_settings
-from app.logger import get_logger
-from app.messages import AI_REQUEST_QUOTA_EXCEEDED, AI_VALIDATION_ERROR
-from app.vertex_ai_core.core import get_result_of_ai_validation
 from app.custom_fields import PyObjectId
 
 
@@ -20,24 +13,7 @@ class PostBaseSchema(BaseModel):
 
 
 class PostCreateInSchema(PostBaseSchema):
-
-    @model_validator(mode='after')
-    def validate_attrs(self):
-        if get_settings().USE_AI_FOR_TEXT_VALIDATION:
-            try:
-                validation_result = get_result_of_ai_validation({"title": self.title, "text": self.text})
-                if not validation_result.get('result'):
-                    failed_fields = validation_result.get('failed_fields')
-                    raise ValueError(f'following fields contains offensive language: {failed_fields}')
-            except ValueError as _e:
-                raise ValueError(_e.args[0])
-            except ResourceExhausted:
-                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=AI_REQUEST_QUOTA_EXCEEDED)
-            except Exception as _e:
-                logger = get_logger()
-                logger.error(_e, exc_info=True)
-                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=AI_VALIDATION_ERROR)
-        return self
+    pass
 
 
 class PostCreateSchema(PostBaseSchema):
@@ -59,8 +35,21 @@ class PostReadSchema(PostBaseSchema):
 class PostReadPaginationSchema(BaseModel):
     total_items_count: int
     page_size: int
-    page: int
+    page: Optional[int] = None
+    next_cursor: Optional[str] = None
     items: List[PostReadSchema] = []
 
 
+class PostBulkCreateInSchema(BaseModel):
+    items: List[PostCreateInSchema] = Field(min_length=1, max_length=get_settings().BULK_CREATE_MAX_ITEMS)
+
+
+class PostBulkCreateItemSchema(BaseModel):
+    index: int
+    created: bool
+    post: Optional[PostReadSchema] = None
+    detail: Any = None
+
 
+class PostBulkCreateResponseSchema(BaseModel):
+    items: List[PostBulkCreateItemSchema] = []
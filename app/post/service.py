@@ -1,24 +1,65 @@
 from datetime import datetime
+from typing import Dict, List, Optional
 
-from app.database import get_post_collection
+import pymongo
+from pymongo import ReturnDocument
+
+from app.database import get_post_collection, insert_documents_unordered, POST_DOC
 from app.custom_fields import PyObjectId
 from app.post.schema import PostCreateSchema
-from app.comments.service import delete_all_comments_related_to_post
+from app.service import evict_cached_counts
+
 
+# Deleted posts are kept as tombstones until their comments are purged in background and must not be returned
+NOT_DELETED_POST_QUERY = {'deleted_at': None}
 
-def create_post_in_db(post_data: dict, user_id: PyObjectId) -> PyObjectId:
+
+def get_not_deleted_posts_pipeline() -> list:
     """
-    Creates post in database
+    Creates match pipeline. Posts that are marked as deleted are not matched
+    :return: list with match query
+    """
+    return [
+        {"$match": NOT_DELETED_POST_QUERY}
+    ]
+
+
+def build_post_document(post_data: dict, user_id: PyObjectId) -> dict:
+    """
+    Creates post document that can be saved in database
     :param post_data: post data
     :param user_id: id of user that creates post
-    :return: id of created post
+    :return: post document
     """
     current_time = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
-    data = PostCreateSchema(**post_data, user_id=user_id).model_dump()
-    data.update({'updated_at': current_time, 'created_at': current_time})
+    document = PostCreateSchema(**post_data, user_id=user_id).model_dump()
+    document.update({'updated_at': current_time, 'created_at': current_time})
+    return document
+
+
+def create_post_in_db(post_data: dict, user_id: PyObjectId) -> dict:
+    """
+    Creates post in database
+    :param post_data: post data
+    :param user_id: id of user that creates post
+    :return: created post
+    """
+    document = build_post_document(post_data, user_id)
+    get_post_collection().insert_one(document)
+    evict_cached_counts(POST_DOC)
+    return document
 
-    result = get_post_collection().insert_one(data)
-    return result.inserted_id
+
+def create_posts_in_db(documents: List[dict]) -> Dict[int, dict]:
+    """
+    Creates several posts in database using single request. Post that failed to insert does not stop insertion of
+    others
+    :param documents: post documents created by build_post_document
+    :return: write errors by index of post that was not created
+    """
+    errors = insert_documents_unordered(get_post_collection(), documents)
+    evict_cached_counts(POST_DOC)
+    return errors
 
 
 def find_post_by_id(post_id: PyObjectId) -> dict:
@@ -27,38 +68,59 @@ def find_post_by_id(post_id: PyObjectId) -> dict:
     :param post_id: id of post that need to be found
     :return: post data from database
     """
-    return get_post_collection().find_one({'_id': post_id})
+    return get_post_collection().find_one({'_id': post_id, **NOT_DELETED_POST_QUERY})
 
 
-def check_post_duplication_from_user(title: str, user_id: PyObjectId) -> bool:
+def find_posts_by_ids(post_ids: List[PyObjectId]) -> List[dict]:
     """
-    Checks if user already create post with given title
-    :param title: Post title
-    :param user_id: User id
-    :return: bool result of this check
+    Looks up several posts in the database
+    :param post_ids: ids of posts that need to be found
+    :return: found posts
     """
-    result = get_post_collection().find_one({'title': title, 'user_id': user_id})
-    return bool(result)
+    return list(get_post_collection().find({'_id': {'$in': post_ids}, **NOT_DELETED_POST_QUERY}))
 
 
-def update_post(post_id: PyObjectId, data: dict) -> PyObjectId:
+def update_post(post_id: PyObjectId, data: dict, user_id: Optional[PyObjectId] = None) -> Optional[dict]:
     """
     Updates post in the database using passed data
     :param post_id: id of post that need to be updated
     :param data: data that will be used to update
-    :return: post id
+    :param user_id: if passed, post is updated only if it was created by this user
+    :return: updated post or None if post was not found
     """
+    query = {'_id': post_id, **NOT_DELETED_POST_QUERY}
+    if user_id is not None:
+        query['user_id'] = user_id
     data.update({'updated_at': datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")})
-    get_post_collection().update_one({'_id': post_id}, {'$set': data})
-    return post_id
+    return get_post_collection().find_one_and_update(query, {'$set': data}, return_document=ReturnDocument.AFTER)
 
 
 def delete_post_in_db(post_id: PyObjectId) -> bool:
     """
-    Removes post from database
+    Marks post as deleted. Post and its comments are removed from database by purge_deleted_posts job. Title is moved
+    to deleted_title, so user can create new post with the same title before deleted post is purged
     :param post_id: id of post that need to be deleted
     :return: deletion result
     """
-    result = get_post_collection().delete_one({'_id': post_id})
-    delete_all_comments_related_to_post(post_id)
-    return bool(result.deleted_count)
+    result = get_post_collection().update_one({'_id': post_id, **NOT_DELETED_POST_QUERY},
+                                              [{'$set': {'deleted_at': datetime.utcnow(), 'deleted_title': '$title'}},
+                                               {'$project': {'title': 0}}])
+    evict_cached_counts(POST_DOC)
+    return bool(result.modified_count)
+
+
+def find_oldest_deleted_post() -> Optional[dict]:
+    """
+    Looks up the post that was marked as deleted earlier than others
+    :return: deleted post or None if there are no deleted posts
+    """
+    return get_post_collection().find_one({'deleted_at': {'$exists': True}}, sort=[('deleted_at', pymongo.ASCENDING)])
+
+
+def purge_post(post_id: PyObjectId) -> None:
+    """
+    Removes post that was marked as deleted from database
+    :param post_id: id of deleted post
+    :return: None
+    """
+    get_post_collection().delete_one({'_id': post_id, 'deleted_at': {'$exists': True}})
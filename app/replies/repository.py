@@ -0,0 +1,9 @@
+from app.database import make_async
+from app.replies import service
+
+enqueue_reply = make_async(service.enqueue_reply)
+enqueue_replies = make_async(service.enqueue_replies)
+claim_due_replies = make_async(service.claim_due_replies)
+complete_replies = make_async(service.complete_replies)
+release_replies = make_async(service.release_replies)
+delete_post_replies = make_async(service.delete_post_replies)
@@ -0,0 +1,101 @@
+import uuid
+
+from datetime import datetime, timedelta
+from typing import List
+
+import pymongo
+from pymongo import UpdateOne
+
+from app.custom_fields import PyObjectId
+from app.database import get_reply_queue_collection
+
+
+def get_due_replies_query(current_time: datetime) -> dict:
+    """
+    Creates query that matches replies which answer time has come and which are not claimed by worker
+    :param current_time: current time
+    :return: query
+    """
+    return {'run_at': {'$lte': current_time},
+            '$or': [{'claimed_until': None}, {'claimed_until': {'$lt': current_time}}]}
+
+
+def enqueue_reply(post_id: PyObjectId, comment_id: PyObjectId, run_at: datetime) -> None:
+    """
+    Adds comment to reply queue. Comment is added only once
+    :param post_id: id of commented post
+    :param comment_id: id of comment that will be answered
+    :param run_at: time when comment will be answered
+    :return: None
+    """
+    enqueue_replies(post_id, [comment_id], run_at)
+
+
+def enqueue_replies(post_id: PyObjectId, comment_ids: List[PyObjectId], run_at: datetime) -> None:
+    """
+    Adds several comments to the same post to reply queue using single request. Every comment is added only once
+    :param post_id: id of commented post
+    :param comment_ids: ids of comments that will be answered
+    :param run_at: time when comments will be answered
+    :return: None
+    """
+    get_reply_queue_collection().bulk_write([
+        UpdateOne({'_id': comment_id},
+                  {'$setOnInsert': {'post_id': post_id, 'run_at': run_at, 'claimed_until': None, 'attempts': 0}},
+                  upsert=True)
+        for comment_id in comment_ids
+    ], ordered=False)
+
+
+def claim_due_replies(limit: int, claim_timeout_seconds: int) -> List[dict]:
+    """
+    Claims replies which answer time has come. Claimed replies are not returned to other workers until claim timeout
+    :param limit: max number of replies
+    :param claim_timeout_seconds: time during which worker must process claimed replies
+    :return: claimed replies
+    """
+    current_time = datetime.utcnow()
+    query = get_due_replies_query(current_time)
+    reply_ids = [reply['_id'] for reply in get_reply_queue_collection().find(query, {'_id': 1})
+                 .sort('run_at', pymongo.ASCENDING).limit(limit)]
+    if not reply_ids:
+        return []
+
+    claim_id = uuid.uuid4().hex
+    get_reply_queue_collection().update_many(
+        {'_id': {'$in': reply_ids}, **query},
+        {'$set': {'claim_id': claim_id, 'claimed_until': current_time + timedelta(seconds=claim_timeout_seconds)}})
+    return list(get_reply_queue_collection().find({'_id': {'$in': reply_ids}, 'claim_id': claim_id}))
+
+
+def complete_replies(reply_ids: List[PyObjectId]) -> None:
+    """
+    Removes processed replies from queue
+    :param reply_ids: ids of processed replies
+    :return: None
+    """
+    get_reply_queue_collection().delete_many({'_id': {'$in': reply_ids}})
+
+
+def delete_post_replies(post_id: PyObjectId) -> None:
+    """
+    Removes replies to comments of post from queue
+    :param post_id: id of post
+    :return: None
+    """
+    get_reply_queue_collection().delete_many({'post_id': post_id})
+
+
+def release_replies(reply_ids: List[PyObjectId], retry_delay_seconds: int, max_attempts: int) -> None:
+    """
+    Returns replies that were not processed to queue. Replies are removed after max number of attempts
+    :param reply_ids: ids of replies that were not processed
+    :param retry_delay_seconds: delay before next attempt
+    :param max_attempts: max number of attempts
+    :return: None
+    """
+    get_reply_queue_collection().update_many(
+        {'_id': {'$in': reply_ids}},
+        {'$set': {'run_at': datetime.utcnow() + timedelta(seconds=retry_delay_seconds), 'claimed_until': None},
+         '$unset': {'claim_id': ''}, '$inc': {'attempts': 1}})
+    get_reply_queue_collection().delete_many({'_id': {'$in': reply_ids}, 'attempts': {'$gte': max_attempts}})
@@ -0,0 +1,5 @@
+from app.database import make_async
+from app import service
+
+paginate_collection = make_async(service.paginate_collection)
+paginate_collection_by_cursor = make_async(service.paginate_collection_by_cursor)
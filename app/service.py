@@ -1,25 +1,178 @@
-from typing import List, Dict
+import base64
+import json
 
+from datetime import datetime
+from threading import Lock
+from typing import List, Dict, Optional
+
+import pymongo
+from bson import ObjectId, json_util
+from bson.errors import InvalidId
+from cachetools import TTLCache
+
+from app.config import get_settings
 from app.database import get_collection_by_name
+from app.exceptions import InvalidCursor
+
+settings = get_settings()
+
+count_cache = TTLCache(maxsize=settings.COUNT_CACHE_MAX_SIZE, ttl=max(settings.COUNT_CACHE_TTL_SECONDS, 1))
+count_cache_lock = Lock()
+
+# Format of created_at and updated_at fields of posts and comments
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+PAGINATION_SORT = {'created_at': pymongo.ASCENDING, '_id': pymongo.ASCENDING}
+
+
+def encode_cursor(document: dict) -> str:
+    """
+    Creates opaque cursor that points to the given document
+    :param document: last document of the current page
+    :return: cursor token
+    """
+    position = {'created_at': document.get('created_at'), '_id': str(document.get('_id'))}
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> dict:
+    """
+    Decodes cursor created by encode_cursor
+    :param cursor: cursor token
+    :return: position of the document that cursor points to
+    """
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        # Cursor is sent by client, so its values must not be able to change the query
+        if not isinstance(position['created_at'], str) or not isinstance(position['_id'], str):
+            raise InvalidCursor('cursor is incorrect')
+        datetime.strptime(position['created_at'], TIMESTAMP_FORMAT)
+        return {'created_at': position['created_at'], '_id': ObjectId(position['_id'])}
+    except (ValueError, TypeError, KeyError, InvalidId):
+        raise InvalidCursor('cursor is incorrect')
+
+
+def get_cursor_match_pipeline(cursor: str) -> list:
+    """
+    Creates match pipeline, that selects documents placed after the cursor position
+    :param cursor: cursor token
+    :return: list with match query
+    """
+    position = decode_cursor(cursor)
+    return [
+        {"$match": {"$or": [{"created_at": {"$gt": position['created_at']}},
+                            {"created_at": position['created_at'], "_id": {"$gt": position['_id']}}]}}
+    ]
+
+
+def count_collection_items(collection_name: str, pipeline: List[Dict]) -> int:
+    """
+    Counts documents that match the pipeline
+    :param collection_name: collection to count
+    :param pipeline: starting pipeline
+    :return: number of documents
+    """
+    result = list(get_collection_by_name(collection_name).aggregate([*pipeline, {"$count": "count"}]))
+    return result[0].get('count', 0) if result else 0
+
+
+def evict_cached_counts(collection_name: str) -> None:
+    """
+    Removes cached counts of collection, so changes made by this process are counted on the next request. Counts
+    cached by other processes expire after COUNT_CACHE_TTL_SECONDS
+    :param collection_name: changed collection
+    :return: None
+    """
+    with count_cache_lock:
+        for key in [key for key in count_cache if key[0] == collection_name]:
+            count_cache.pop(key, None)
+
+
+def get_total_items_count(collection_name: str, pipeline: List[Dict], exact_count: bool = False,
+                          estimated_count: bool = False) -> int:
+    """
+    Returns number of documents that match the pipeline. Exact count is calculated only if it is requested,
+    otherwise collection metadata estimation or cached count is used
+    :param collection_name: collection to count
+    :param pipeline: starting pipeline
+    :param exact_count: if true, documents are counted in database without cache
+    :param estimated_count: if true, count is taken from collection metadata. Use only for unfiltered pipelines
+    :return: number of documents
+    """
+    if exact_count:
+        return count_collection_items(collection_name, pipeline)
+    if estimated_count:
+        return get_collection_by_name(collection_name).estimated_document_count()
+    if settings.COUNT_CACHE_TTL_SECONDS <= 0:
+        return count_collection_items(collection_name, pipeline)
+
+    key = (collection_name, json_util.dumps(pipeline))
+    with count_cache_lock:
+        cached_count = count_cache.get(key)
+    if cached_count is not None:
+        return cached_count
 
+    items_count = count_collection_items(collection_name, pipeline)
+    with count_cache_lock:
+        count_cache[key] = items_count
+    return items_count
 
-def paginate_collection(collection_name: str, pipeline: List[Dict], page: int = 1, items_per_page: int = 5) -> dict:
+
+def paginate_collection(collection_name: str, pipeline: List[Dict], page: int = 1, items_per_page: int = 5,
+                        exact_count: bool = False, estimated_count: bool = False) -> dict:
     """
     Paginates collection.
     :param collection_name: collection to paginate
     :param pipeline: starting pipeline
     :param page: current page
     :param items_per_page: items per page
+    :param exact_count: if true, total items count is calculated without cache
+    :param estimated_count: if true, total items count is taken from collection metadata
     :return: paginated result
     """
-    pipeline.append({"$group": {"_id": "null", "count": {"$sum": 1}, "results": {"$push": "$$ROOT"}}})
-    pipeline.append({"$project": {"count": 1, "rows": {"$slice": ["$results", (page-1) * items_per_page, items_per_page]}}})
-    collection = list(get_collection_by_name(collection_name).aggregate(pipeline))
-    items = collection[0] if collection else {}
+    total_items_count = get_total_items_count(collection_name, pipeline, exact_count, estimated_count)
+    page_pipeline = [*pipeline,
+                     {"$sort": PAGINATION_SORT},
+                     {"$skip": (page-1) * items_per_page},
+                     {"$limit": items_per_page + 1}]
+    items = list(get_collection_by_name(collection_name).aggregate(page_pipeline))
+    has_next_page = len(items) > items_per_page
+    items = items[:items_per_page]
     return {
-        "items": items.get('rows', []),
-        "total_items_count": items.get('count', 0),
+        "items": items,
+        "total_items_count": total_items_count,
         "page_size": items_per_page,
-        "page": page
+        "page": page,
+        "next_cursor": encode_cursor(items[-1]) if has_next_page else None
     }
 
+
+def paginate_collection_by_cursor(collection_name: str, pipeline: List[Dict], cursor: Optional[str] = None,
+                                  items_per_page: int = 5, exact_count: bool = False,
+                                  estimated_count: bool = False) -> dict:
+    """
+    Paginates collection using keyset pagination on created_at and _id. Unlike paginate_collection it never skips
+    documents, so page latency does not depend on page depth.
+    :param collection_name: collection to paginate
+    :param pipeline: starting pipeline
+    :param cursor: cursor token from previous page. If not passed, first page is returned
+    :param items_per_page: items per page
+    :param exact_count: if true, total items count is calculated without cache
+    :param estimated_count: if true, total items count is taken from collection metadata
+    :return: paginated result
+    """
+    total_items_count = get_total_items_count(collection_name, pipeline, exact_count, estimated_count)
+    page_pipeline = [*pipeline,
+                     *(get_cursor_match_pipeline(cursor) if cursor else []),
+                     {"$sort": PAGINATION_SORT},
+                     {"$limit": items_per_page + 1}]
+    items = list(get_collection_by_name(collection_name).aggregate(page_pipeline))
+    has_next_page = len(items) > items_per_page
+    items = items[:items_per_page]
+    return {
+        "items": items,
+        "total_items_count": total_items_count,
+        "page_size": items_per_page,
+        "page": None,
+        "next_cursor": encode_cursor(items[-1]) if has_next_page else None
+    }
@@ -1,5 +1,6 @@
 from enum import Enum
 from os import getenv
+from typing import List, Optional
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -9,16 +10,83 @@ class AppEnvTypes(Enum):
     test: str = 'test'
 
 
+class AIBackendTypes(Enum):
+    vertex: str = 'vertex'
+    local: str = 'local'
+
+
+class AIFailurePolicyTypes(Enum):
+    fail_open: str = 'fail_open'
+    fail_closed: str = 'fail_closed'
+
+
 class BaseAppSettings(BaseSettings):
     environment: AppEnvTypes = AppEnvTypes.local
 
+    AI_BACKEND: AIBackendTypes = AIBackendTypes.vertex
     AI_MODEL_NAME: str = "gemini-1.5-flash-002"
     GOOGLE_CLOUD_PROJECT_LOCATION: str = "us-central1"
     GOOGLE_CLOUD_PROJECT_ID: str = 'clean-heading-439815-v5'
     GOOGLE_CLOUD_PROJECT_CREDENTIALS_PATH: str = '/app/vertex_ai_core/service_account_credentials.json'
 
+    AI_MAX_CONCURRENT_REQUESTS: int = 8
+    AI_REQUEST_TIMEOUT_SECONDS: float = 30
+    AI_RETRY_MAX_ATTEMPTS: int = 3
+    AI_RETRY_BASE_DELAY_SECONDS: float = 0.2
+    AI_RETRY_MAX_DELAY_SECONDS: float = 2
+    AI_CIRCUIT_BREAKER_FAILURE_THRESHOLD: int = 5
+    AI_CIRCUIT_BREAKER_RESET_TIMEOUT_SECONDS: float = 30
+    AI_FAILURE_POLICY: AIFailurePolicyTypes = AIFailurePolicyTypes.fail_closed
+    MODERATION_BLOCKED_WORDS: List[str] = []
+    MODERATION_ALLOWED_TEXTS: List[str] = ['nice post!', 'great post!', 'thanks', 'thanks!', 'thank you', '+1']
+    MODERATION_SHORT_TEXT_LENGTH: int = 2
+    MODERATION_LEXICON_PATH: Optional[str] = None
+    MODERATION_BATCH_WINDOW_MS: int = 20
+    MODERATION_BATCH_MAX_ITEMS: int = 16
+    BULK_CREATE_MAX_ITEMS: int = 100
+    VERDICT_CACHE_TTL_SECONDS: int = 7 * 24 * 60 * 60
+    VERDICT_CACHE_MAX_SIZE: int = 10000
+
     SECRET_KEY: str
     ACCESS_TOKEN_LIFETIME_MINUTES: int = 15
     ALGORITHM: str = 'HS256'
+    PRINCIPAL_CACHE_TTL_SECONDS: int = 60
+    PRINCIPAL_CACHE_MAX_SIZE: int = 10000
+    PASSWORD_HASHING_WORKERS: int = 4
+    PASSWORD_HASHING_QUEUE_SIZE: int = 100
+
+    DATABASE_EXECUTOR_MAX_WORKERS: int = 32
+
+    ASYNC_COMMENT_MODERATION: bool = False
+    PENDING_COMMENTS_MODERATION_INTERVAL_SECONDS: int = 5
+    PENDING_COMMENTS_MODERATION_BATCH_SIZE: int = 100
+    PENDING_COMMENTS_MODERATION_RETRY_DELAY_SECONDS: int = 60
+    PENDING_COMMENTS_MODERATION_MAX_ATTEMPTS: int = 5
+
+    STATISTICS_BUFFER_ENABLED: bool = True
+    STATISTICS_FLUSH_INTERVAL_SECONDS: int = 5
+    STATISTICS_BUFFER_MAX_SIZE: int = 1000
+    STATISTICS_CACHE_MAX_SIZE: int = 100000
+    STATISTICS_MAX_BUCKETS: int = 2000
+    STATISTICS_RECOMPUTE_ENABLED: bool = False
+    STATISTICS_RECOMPUTE_HOUR: int = 3
+    STATISTICS_RECOMPUTE_DAYS: int = 2
+    STATISTICS_RECOMPUTE_CHUNK_DAYS: int = 7
+
+    REPLY_QUEUE_POLL_INTERVAL_SECONDS: int = 5
+    REPLY_QUEUE_BATCH_SIZE: int = 100
+    REPLY_QUEUE_CLAIM_TIMEOUT_SECONDS: int = 300
+    REPLY_QUEUE_RETRY_DELAY_SECONDS: int = 60
+    REPLY_QUEUE_MAX_ATTEMPTS: int = 3
+    POST_PURGE_INTERVAL_SECONDS: int = 60
+    POST_PURGE_BATCH_SIZE: int = 1000
+    POST_PURGE_BATCH_DELAY_SECONDS: float = 0.1
+    REPLY_GENERATION_BATCH_SIZE: int = 10
+
+    WORKER_LEASE_TTL_SECONDS: int = 30
+    WORKER_LEASE_RENEW_INTERVAL_SECONDS: int = 10
+
+    COUNT_CACHE_TTL_SECONDS: int = 30
+    COUNT_CACHE_MAX_SIZE: int = 10000
 
     model_config = SettingsConfigDict(env_file='.env', extra='ignore')
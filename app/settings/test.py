@@ -1,4 +1,4 @@
-from .base import BaseAppSettings
+from .base import BaseAppSettings, AIBackendTypes
 
 
 class TestAppSettings(BaseAppSettings):
@@ -7,3 +7,5 @@ class TestAppSettings(BaseAppSettings):
     LOGS_ENABLED: bool = False
 
     USE_AI_FOR_TEXT_VALIDATION: bool = False
+    AI_BACKEND: AIBackendTypes = AIBackendTypes.local
+    STATISTICS_BUFFER_ENABLED: bool = False
@@ -0,0 +1,6 @@
+from app.database import make_async
+from app.user import service
+
+find_user_by_id = make_async(service.find_user_by_id)
+create_user = make_async(service.create_user)
+update_user = make_async(service.update_user)
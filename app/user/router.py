@@ -5,11 +5,13 @@ from starlette import status
 from pymongo.errors import DuplicateKeyError
 
 from app import messages
-from app.auth.dependencies import get_current_user
+from app.auth.dependencies import get_current_user, evict_cached_principal
+from app.auth.exceptions import PasswordHashingQueueFull
+from app.auth.hashing import hash_password
 from app.auth.schemas import UserReadSchema
 from app.custom_fields import PyObjectId
 from app.user.schemas import UserRegisterSchema, UserResponseSchema, UserSettingReadSchema, UserSettingsUpdateSchema
-from app.user.service import create_user, find_user_by_id, update_user
+from app.user.repository import create_user, find_user_by_id, update_user
 
 router = APIRouter(
     prefix='/users',
@@ -20,9 +22,11 @@ router = APIRouter(
 @router.post('/', status_code=status.HTTP_201_CREATED, response_model=UserResponseSchema)
 async def register_user(user_data: UserRegisterSchema):
     try:
-        created_user_id = create_user(user_data.model_dump())
-        created_user = find_user_by_id(created_user_id)
-        return created_user
+        hashed_password = await hash_password(user_data.password)
+        return await create_user(user_data.model_dump(), hashed_password=hashed_password)
+    except PasswordHashingQueueFull:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail=messages.PASSWORD_HASHING_UNAVAILABLE)
     except DuplicateKeyError:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                             detail=messages.USER_ALREADY_EXISTS)
@@ -33,7 +37,7 @@ async def get_user_settings(user_id: PyObjectId, current_user: Annotated[UserRea
     if user_id != current_user.id:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=messages.USER_SETTINGS_READ_NOT_ALLOWED)
 
-    user_data = find_user_by_id(user_id)
+    user_data = await find_user_by_id(user_id)
     return user_data
 
 
@@ -43,6 +47,6 @@ async def update_user_settings(user_id: PyObjectId, settings: UserSettingsUpdate
     if user_id != current_user.id:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=messages.USER_SETTINGS_UPDATE_NOT_ALLOWED)
 
-    updated_user_id = update_user(user_id, settings.model_dump(exclude_unset=True, exclude_none=True))
-    updated_user = find_user_by_id(updated_user_id)
+    updated_user = await update_user(user_id, settings.model_dump(exclude_unset=True, exclude_none=True))
+    evict_cached_principal(user_id)
     return updated_user
@@ -1,5 +1,8 @@
+from typing import Optional
+
 from bson import ObjectId
 from fastapi.encoders import jsonable_encoder
+from pymongo import ReturnDocument
 
 from app.custom_fields import PyObjectId
 from app.user.schemas import UserCreateSchema
@@ -16,25 +19,26 @@ def find_user_by_id(user_id: ObjectId) -> dict:
     return get_user_collection().find_one({'_id': user_id})
 
 
-def create_user(user_data: dict) -> PyObjectId:
+def create_user(user_data: dict, hashed_password: Optional[str] = None) -> dict:
     """
     Creates user with hashed password in database
     :param user_data: data that will be used to create user
-    :return: id of created user
+    :param hashed_password: already hashed password. If not passed, password from user data is hashed
+    :return: created user
     """
     data = UserCreateSchema(**user_data).model_dump()
     user_dict = jsonable_encoder(data)
-    user_dict['password'] = pwd_context.hash(user_dict['password'])
-    result = get_user_collection().insert_one(user_dict)
-    return result.inserted_id
+    user_dict['password'] = hashed_password if hashed_password else pwd_context.hash(user_dict['password'])
+    get_user_collection().insert_one(user_dict)
+    return user_dict
 
 
-def update_user(user_id: PyObjectId, data: dict) -> PyObjectId:
+def update_user(user_id: PyObjectId, data: dict) -> Optional[dict]:
     """
     Updates user in the database using passed data
     :param user_id: id of user that need to be updated
     :param data: data that will be used to update
-    :return: user id
+    :return: updated user or None if user was not found
     """
-    get_user_collection().update_one({'_id': user_id}, {'$set': data})
-    return user_id
+    return get_user_collection().find_one_and_update({'_id': user_id}, {'$set': data},
+                                                     return_document=ReturnDocument.AFTER)
@@ -0,0 +1,166 @@
+import asyncio
+import json
+
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from pathlib import Path
+from threading import Lock
+from typing import Any, List, Optional
+
+from app.config import get_settings
+from app.settings.base import AIBackendTypes
+from app.vertex_ai_core.prefilter import get_moderation_prefilter, PrefilterVerdict
+from app.vertex_ai_core.prompts import get_validation_prompt, get_batch_validation_prompt, get_generation_prompt, \
+    get_batch_generation_prompt, clear_response, parse_batch_validation_response, parse_batch_generation_response
+
+
+class AIBackend(ABC):
+    """
+    Backend used for text validation and answer generation
+    """
+
+    @abstractmethod
+    async def validate(self, data: dict) -> dict:
+        """
+        Checks if fields of data contain offensive language
+        :param data: data that will be validated
+        :return: result of validation with 'result' and 'failed_fields' fields
+        """
+
+    @abstractmethod
+    async def validate_batch(self, items: List[dict]) -> List[Optional[dict]]:
+        """
+        Checks if fields of several items contain offensive language
+        :param items: data of items that will be validated
+        :return: results of validation in the same order as items. Result is None if item was not validated
+        """
+
+    @abstractmethod
+    async def generate_answer(self, post: str, comment: str) -> str:
+        """
+        Generates answer to user comment as author of post
+        :param post: post text
+        :param comment: user comment
+        :return: generated answer
+        """
+
+    async def generate_answers(self, post: str, comments: List[str]) -> List[Optional[str]]:
+        """
+        Generates answers to several comments to the same post
+        :param post: post text
+        :param comments: user comments
+        :return: generated answers in the same order as comments. Answer is None if it was not generated
+        """
+        return [await self.generate_answer(post, comment) for comment in comments]
+
+    def is_quota_exceeded_error(self, error: Exception) -> bool:
+        """
+        Checks if error was raised because request quota is exceeded
+        :param error: raised error
+        :return: result of the check
+        """
+        return False
+
+
+def get_credentials() -> Any:
+    """
+    Get credentials for google cloud from service account credentials
+    :return: Credentials instance
+    """
+    from google.auth.transport.requests import Request
+    from google.oauth2.service_account import Credentials
+
+    project_path = str(Path().resolve())
+    path = project_path + get_settings().GOOGLE_CLOUD_PROJECT_CREDENTIALS_PATH
+    credentials = Credentials.from_service_account_file(path,
+                                                        scopes=['https://www.googleapis.com/auth/cloud-platform'])
+    if credentials.expired:
+        credentials.refresh(Request())
+
+    return credentials
+
+
+class VertexAIBackend(AIBackend):
+    """
+    Backend that uses Gemini model from Vertex AI. Vertex AI is initialized on first request
+    """
+
+    def __init__(self):
+        self._model = None
+        self._model_lock = Lock()
+
+    def _get_model(self) -> Any:
+        """
+        Initializes Vertex AI and creates model
+        :return: model instance
+        """
+        with self._model_lock:
+            if self._model is None:
+                import vertexai
+                from vertexai.generative_models import GenerativeModel
+
+                settings = get_settings()
+                vertexai.init(project=settings.GOOGLE_CLOUD_PROJECT_ID,
+                              location=settings.GOOGLE_CLOUD_PROJECT_LOCATION,
+                              credentials=get_credentials())
+                self._model = GenerativeModel(settings.AI_MODEL_NAME)
+        return self._model
+
+    async def _generate_content(self, prompt: str) -> str:
+        """
+        Sends prompt to model
+        :param prompt: prompt for model
+        :return: model response text
+        """
+        model = self._model or await asyncio.get_running_loop().run_in_executor(None, self._get_model)
+        response = await model.generate_content_async(prompt)
+        return response.text
+
+    async def validate(self, data: dict) -> dict:
+        response = await self._generate_content(get_validation_prompt(data))
+        return json.loads(clear_response(response))
+
+    async def validate_batch(self, items: List[dict]) -> List[Optional[dict]]:
+        response = await self._generate_content(get_batch_validation_prompt(items))
+        return parse_batch_validation_response(response, len(items))
+
+    async def generate_answer(self, post: str, comment: str) -> str:
+        return await self._generate_content(get_generation_prompt(post, comment))
+
+    async def generate_answers(self, post: str, comments: List[str]) -> List[Optional[str]]:
+        response = await self._generate_content(get_batch_generation_prompt(post, comments))
+        return parse_batch_generation_response(response, len(comments))
+
+    def is_quota_exceeded_error(self, error: Exception) -> bool:
+        from google.api_core.exceptions import ResourceExhausted
+
+        return isinstance(error, ResourceExhausted)
+
+
+class LocalAIBackend(AIBackend):
+    """
+    Deterministic backend that works without network. Texts are validated using moderation lexicon
+    """
+
+    async def validate(self, data: dict) -> dict:
+        verdict, failed_fields = get_moderation_prefilter().check(data)
+        return {'result': verdict != PrefilterVerdict.block, 'failed_fields': failed_fields}
+
+    async def validate_batch(self, items: List[dict]) -> List[Optional[dict]]:
+        return [await self.validate(data) for data in items]
+
+    async def generate_answer(self, post: str, comment: str) -> str:
+        return f'Thank you for your comment: "{comment[:100]}"'
+
+
+@lru_cache
+def get_ai_backend() -> AIBackend:
+    """
+    Creates AI backend selected in settings
+    :return: AI backend instance
+    """
+    backends = {
+        AIBackendTypes.vertex: VertexAIBackend,
+        AIBackendTypes.local: LocalAIBackend
+    }
+    return backends[get_settings().AI_BACKEND]()
@@ -0,0 +1,128 @@
+import asyncio
+import random
+import time
+
+from enum import Enum
+from typing import Any, Awaitable, Callable
+
+from app.metrics.service import metrics
+from app.vertex_ai_core.exceptions import CircuitBreakerOpen
+
+
+class CircuitBreakerState(Enum):
+    closed: str = 'closed'
+    open: str = 'open'
+    half_open: str = 'half_open'
+
+
+class CircuitBreaker:
+    """
+    Stops sending requests to dependency after several consecutive failures. After reset timeout single probe request
+    is allowed: if it succeeds requests are allowed again, otherwise breaker stays open for another timeout
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout_seconds: float):
+        self.name = name
+        self._failure_threshold = failure_threshold
+        self._reset_timeout_seconds = reset_timeout_seconds
+        self._failures_count = 0
+        self._opened_at = 0.0
+        self._probe_in_progress = False
+        self.state = CircuitBreakerState.closed
+
+    def _set_state(self, state: CircuitBreakerState) -> None:
+        """
+        Changes breaker state
+        :param state: new state
+        :return: None
+        """
+        self.state = state
+        metrics.set_gauge(f'{self.name}_circuit_breaker_open', int(state != CircuitBreakerState.closed))
+
+    def allow_request(self) -> bool:
+        """
+        Checks if request can be sent to dependency
+        :return: result of the check
+        """
+        if self.state == CircuitBreakerState.closed:
+            return True
+        if self.state == CircuitBreakerState.open and time.monotonic() - self._opened_at >= self._reset_timeout_seconds:
+            self._set_state(CircuitBreakerState.half_open)
+        if self.state == CircuitBreakerState.half_open and not self._probe_in_progress:
+            self._probe_in_progress = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        """
+        Registers successful request
+        :return: None
+        """
+        self._failures_count = 0
+        self._probe_in_progress = False
+        if self.state != CircuitBreakerState.closed:
+            self._set_state(CircuitBreakerState.closed)
+
+    def record_failure(self) -> None:
+        """
+        Registers failed request
+        :return: None
+        """
+        self._failures_count += 1
+        self._probe_in_progress = False
+        if self.state == CircuitBreakerState.half_open or self._failures_count >= self._failure_threshold:
+            self._opened_at = time.monotonic()
+            self._set_state(CircuitBreakerState.open)
+
+    def record_cancellation(self) -> None:
+        """
+        Registers request that was cancelled before it finished. State of dependency is unknown, so failure is not
+        counted, but next request can be sent as probe
+        :return: None
+        """
+        self._probe_in_progress = False
+
+    async def call(self, request_factory: Callable[[], Awaitable]) -> Any:
+        """
+        Sends request to dependency if breaker allows it
+        :param request_factory: function that creates request
+        :return: request result
+        """
+        if not self.allow_request():
+            metrics.increment(f'{self.name}_circuit_breaker_rejected_total')
+            raise CircuitBreakerOpen(f'{self.name} circuit breaker is open')
+
+        try:
+            result = await request_factory()
+        except Exception:
+            self.record_failure()
+            raise
+        except BaseException:
+            self.record_cancellation()
+            raise
+        self.record_success()
+        return result
+
+
+async def retry_with_backoff(request_factory: Callable[[], Awaitable], is_retryable: Callable[[Exception], bool],
+                             max_attempts: int, base_delay_seconds: float, max_delay_seconds: float) -> Any:
+    """
+    Sends request and repeats it after retryable errors. Delay between attempts grows exponentially and is randomized,
+    so clients do not retry at the same time
+    :param request_factory: function that creates request
+    :param is_retryable: function that checks if request can be repeated after error
+    :param max_attempts: max number of attempts
+    :param base_delay_seconds: delay before second attempt
+    :param max_delay_seconds: max delay between attempts
+    :return: request result
+    """
+    attempt = 1
+    while True:
+        try:
+            return await request_factory()
+        except Exception as _e:
+            if attempt >= max_attempts or not is_retryable(_e):
+                raise
+        metrics.increment('ai_request_retries_total')
+        await asyncio.sleep(random.uniform(0, min(max_delay_seconds, base_delay_seconds * 2 ** (attempt - 1))))
+        attempt += 1
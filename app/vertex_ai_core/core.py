@@ -1,94 +1,116 @@
-import json
-from typing import Any
+import asyncio
+import time
+import weakref
 
-import vertexai
-
-from pathlib import Path
-from google.auth.transport.requests import Request
-from google.oauth2.service_account import Credentials
-from vertexai.generative_models import GenerativeModel
+from typing import Any, Awaitable, Callable, List, Optional
 
 from app.config import get_settings
+from app.database import run_in_database_executor
+from app.metrics.service import metrics
+from app.vertex_ai_core.backends import get_ai_backend
+from app.vertex_ai_core.circuit_breaker import CircuitBreaker, retry_with_backoff
+from app.vertex_ai_core.verdict_cache import get_cached_verdict, get_cached_verdicts, cache_verdict
 
+ai_request_limiters = weakref.WeakKeyDictionary()
 
-def get_credentials() -> Any:
-    """
-    Get credentials for google cloud from service account credentials
-    :return: Credentials instance
-    """
-    project_path = str(Path().resolve())
-    path = project_path + get_settings().GOOGLE_CLOUD_PROJECT_CREDENTIALS_PATH
-    credentials = Credentials.from_service_account_file(path,
-                                                        scopes=['https://www.googleapis.com/auth/cloud-platform'])
-    if credentials.expired:
-        credentials.refresh(Request())
-
-    return credentials
-
+ai_circuit_breaker = CircuitBreaker(name='ai',
+                                    failure_threshold=get_settings().AI_CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+                                    reset_timeout_seconds=get_settings().AI_CIRCUIT_BREAKER_RESET_TIMEOUT_SECONDS)
 
-vertexai.init(project=get_settings().GOOGLE_CLOUD_PROJECT_ID, location=get_settings().GOOGLE_CLOUD_PROJECT_LOCATION,
-              credentials=get_credentials())
 
-model = GenerativeModel(get_settings().AI_MODEL_NAME)
-
-
-def get_validation_prompt(data: dict) -> str:
+def get_ai_request_limiter() -> asyncio.Semaphore:
     """
-    Creates validation prompt filled with passed data
-    :param data: data that used in prompt
-    :return: validation prompt
+    Returns semaphore that limits number of concurrent model requests in current event loop
+    :return: semaphore
     """
-    validation_prompt = f"Analyze following data and check if its fields contains offensive language: {data}." \
-                        f"Format your response in JsonFormat. It must contain 'result' field, which will contain " \
-                        f"boolean value of this check and 'failed_fields' field which will contain name of " \
-                        f"fields, that failed check"
-    return validation_prompt
+    loop = asyncio.get_running_loop()
+    if loop not in ai_request_limiters:
+        ai_request_limiters[loop] = asyncio.Semaphore(get_settings().AI_MAX_CONCURRENT_REQUESTS)
+    return ai_request_limiters[loop]
 
 
-def get_generation_prompt(post: str, comment: str) -> str:
+async def run_limited_ai_request(request: Awaitable) -> Any:
     """
-    Creates generation prompt filled with passed data
-    :param post: post data used in prompt
-    :param comment: comment data used in prompt
-    :return: generation prompt
+    Runs request to AI backend. Number of concurrent requests and request duration are limited
+    :param request: request to AI backend
+    :return: request result
     """
-    generation_prompt = f'You an author of this post: {post}. Generate answer to following user comment: {comment}.' \
-                        f'Your response should be related to this comment and your post. Response should be ' \
-                        f'less than 1000 characters'
-    return generation_prompt
+    requested_at = time.monotonic()
+    async with get_ai_request_limiter():
+        metrics.observe('ai_request_limiter_wait_seconds', time.monotonic() - requested_at)
+        return await asyncio.wait_for(request, timeout=get_settings().AI_REQUEST_TIMEOUT_SECONDS)
 
 
-def clear_response(response: str) -> str:
+async def run_ai_request(request_factory: Callable[[], Awaitable]) -> Any:
     """
-    Clears model response
-    :param response: model response
-    :return: cleared response
+    Runs request to AI backend through circuit breaker. Requests that failed because of exceeded quota are retried
+    :param request_factory: function that creates request to AI backend
+    :return: request result
     """
-    opening_bracket = response.find('{')
-    closing_bracket = response.find('}')
-    return response[opening_bracket:closing_bracket+1]
+    settings = get_settings()
+
+    async def send_request():
+        return await retry_with_backoff(lambda: run_limited_ai_request(request_factory()),
+                                        is_retryable=get_ai_backend().is_quota_exceeded_error,
+                                        max_attempts=settings.AI_RETRY_MAX_ATTEMPTS,
+                                        base_delay_seconds=settings.AI_RETRY_BASE_DELAY_SECONDS,
+                                        max_delay_seconds=settings.AI_RETRY_MAX_DELAY_SECONDS)
 
+    return await ai_circuit_breaker.call(send_request)
 
-def get_result_of_ai_validation(data: dict) -> dict:
+
+async def get_result_of_ai_validation(data: dict) -> dict:
     """
     Returns result of ai text validation
     :param data: data that will be validated
     :return: result of validation
     """
-    prompt = get_validation_prompt(data)
-    response = model.generate_content(prompt)
-    cleared_response = clear_response(response.text)
-    validation_result = json.loads(cleared_response)
+    cached_validation_result = await run_in_database_executor(get_cached_verdict, data)
+    if cached_validation_result is not None:
+        return cached_validation_result
+
+    validation_result = await run_ai_request(lambda: get_ai_backend().validate(data))
+    if 'result' in validation_result:
+        await run_in_database_executor(cache_verdict, data, validation_result)
     return validation_result
 
 
-def generate_answer_to_user_comment_as_author_of_post(post: str, comment: str) -> str:
+async def get_results_of_ai_batch_validation(items: List[dict]) -> List[Optional[dict]]:
+    """
+    Returns results of ai text validation of several items using single model request
+    :param items: data of items that will be validated
+    :return: results of validation in the same order as items. Result is None if model did not return valid result
+    for item
+    """
+    results: List[Optional[dict]] = await run_in_database_executor(get_cached_verdicts, items)
+    not_cached_items = [index for index, result in enumerate(results) if result is None]
+    if not not_cached_items:
+        return results
+
+    not_cached_data = [items[index] for index in not_cached_items]
+    batch_results = await run_ai_request(lambda: get_ai_backend().validate_batch(not_cached_data))
+    for index, validation_result in zip(not_cached_items, batch_results):
+        if validation_result is not None:
+            await run_in_database_executor(cache_verdict, items[index], validation_result)
+            results[index] = validation_result
+    return results
+
+
+async def generate_answer_to_user_comment_as_author_of_post(post: str, comment: str) -> str:
     """
     Generates ai answer as author of post to user comment
     :param post: post data
     :param comment: user comment
     :return: generated answer to comment
     """
-    prompt = get_generation_prompt(post, comment)
-    response = model.generate_content(prompt)
-    return response.text
+    return await run_ai_request(lambda: get_ai_backend().generate_answer(post, comment))
+
+
+async def generate_answers_to_user_comments_as_author_of_post(post: str, comments: List[str]) -> List[Optional[str]]:
+    """
+    Generates ai answers as author of post to several user comments using single model request
+    :param post: post data
+    :param comments: user comments
+    :return: generated answers in the same order as comments. Answer is None if model did not generate it
+    """
+    return await run_ai_request(lambda: get_ai_backend().generate_answers(post, comments))
@@ -0,0 +1,18 @@
+from typing import Any
+
+from fastapi.exceptions import RequestValidationError
+
+
+class OffensiveLanguageError(RequestValidationError):
+    def __init__(self, failed_fields: Any):
+        self.failed_fields = failed_fields
+        super().__init__([{'type': 'value_error', 'loc': ('body',), 'input': None,
+                           'msg': f'Value error, following fields contains offensive language: {failed_fields}'}])
+
+
+class CircuitBreakerOpen(Exception):
+    pass
+
+
+class InvalidAIResponse(Exception):
+    pass
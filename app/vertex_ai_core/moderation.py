@@ -0,0 +1,244 @@
+import asyncio
+
+from typing import Any, Awaitable, List, Optional, Set, Tuple
+
+from fastapi import HTTPException
+from starlette import status
+
+from app.config import get_settings
+from app.settings.base import AIFailurePolicyTypes
+from app.logger import get_logger
+from app.messages import AI_REQUEST_QUOTA_EXCEEDED, AI_VALIDATION_ERROR, AI_TEMPORARILY_UNAVAILABLE
+from app.metrics.service import metrics
+from app.vertex_ai_core.backends import get_ai_backend
+from app.vertex_ai_core.core import get_result_of_ai_validation, get_results_of_ai_batch_validation
+from app.vertex_ai_core.exceptions import OffensiveLanguageError, CircuitBreakerOpen, InvalidAIResponse
+from app.vertex_ai_core.prefilter import get_moderation_prefilter, PrefilterVerdict
+
+
+class ModerationBatcher:
+    """
+    Collects validation requests made during short time window and validates them using single model request.
+    Results are returned to every waiting request separately
+    """
+
+    def __init__(self, window_seconds: float, max_items: int):
+        self._window_seconds = window_seconds
+        self._max_items = max_items
+        self._pending: List[Tuple[dict, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        # Event loop keeps only weak references to tasks, so running tasks are kept here until they are done
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def validate(self, data: dict) -> dict:
+        """
+        Adds data to current batch and waits for its validation result
+        :param data: data that will be validated
+        :return: result of validation
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((data, future))
+
+        if len(self._pending) >= self._max_items:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self._window_seconds, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        """
+        Sends collected batch to validation
+        :return: None
+        """
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        batch, self._pending = self._pending, []
+        if batch:
+            self._start_task(self._validate_batch(batch), [future for _, future in batch])
+
+    def _start_task(self, coroutine: Awaitable[None], futures: List[asyncio.Future]) -> None:
+        """
+        Runs validation task in background and keeps reference to it until it is done
+        :param coroutine: validation coroutine
+        :param futures: futures of requests that wait for task
+        :return: None
+        """
+        task = asyncio.ensure_future(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(lambda done_task: self._on_task_done(done_task, futures))
+
+    def _on_task_done(self, task: asyncio.Task, futures: List[asyncio.Future]) -> None:
+        """
+        Forgets finished task. If task failed or was cancelled, its error is returned to requests that still wait for it
+        :param task: finished task
+        :param futures: futures of requests that wait for task
+        :return: None
+        """
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is None:
+            return
+        if not task.cancelled():
+            get_logger().error(task.exception(), exc_info=task.exception())
+        for future in futures:
+            if future.done():
+                continue
+            if task.cancelled():
+                future.cancel()
+            else:
+                future.set_exception(task.exception())
+
+    async def close(self) -> None:
+        """
+        Sends collected batch to validation and waits until all validation tasks are done
+        :return: None
+        """
+        self._flush()
+        while self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _validate_batch(self, batch: List[Tuple[dict, asyncio.Future]]) -> None:
+        """
+        Validates batch and returns results to waiting requests. Items, for which model did not return valid result,
+        are validated separately
+        :param batch: data and futures of waiting requests
+        :return: None
+        """
+        metrics.observe('moderation_batch_size', len(batch))
+        try:
+            results = await get_results_of_ai_batch_validation([data for data, _ in batch])
+        except Exception as _e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(_e)
+            return
+
+        for (data, future), result in zip(batch, results):
+            if result is None:
+                metrics.increment('moderation_batch_item_fallbacks_total')
+                self._start_task(self._validate_item(data, future), [future])
+            elif not future.done():
+                future.set_result(result)
+
+    @staticmethod
+    async def _validate_item(data: dict, future: asyncio.Future) -> None:
+        """
+        Validates single item, that was not validated in batch
+        :param data: data that will be validated
+        :param future: future of waiting request
+        :return: None
+        """
+        try:
+            result = await get_result_of_ai_validation(data)
+        except Exception as _e:
+            if not future.done():
+                future.set_exception(_e)
+            return
+        if not future.done():
+            future.set_result(result)
+
+
+moderation_batcher = ModerationBatcher(window_seconds=get_settings().MODERATION_BATCH_WINDOW_MS / 1000,
+                                       max_items=get_settings().MODERATION_BATCH_MAX_ITEMS)
+
+
+def check_validation_result(validation_result: Any) -> dict:
+    """
+    Checks that AI validation result has expected shape
+    :param validation_result: result returned by AI backend
+    :return: validation result, or raises InvalidAIResponse if result is malformed
+    """
+    if not isinstance(validation_result, dict) or not isinstance(validation_result.get('result'), bool):
+        raise InvalidAIResponse(f'malformed AI validation result: {validation_result!r}')
+    return validation_result
+
+
+async def validate_text_with_ai(data: dict) -> None:
+    """
+    Checks with AI that data does not contain offensive language. Texts that match local lexicon are checked without
+    model request. If AI is unavailable, text is accepted or rejected depending on AI failure policy.
+    Does nothing if AI validation is turned off
+    :param data: data that will be validated
+    :return: None
+    """
+    if not get_settings().USE_AI_FOR_TEXT_VALIDATION:
+        return
+
+    prefilter_verdict, failed_fields = get_moderation_prefilter().check(data)
+    metrics.increment(f'moderation_prefilter_{prefilter_verdict.value}_total')
+    if prefilter_verdict == PrefilterVerdict.block:
+        raise OffensiveLanguageError(failed_fields)
+    if prefilter_verdict == PrefilterVerdict.allow:
+        return
+
+    try:
+        validation_result = check_validation_result(await moderation_batcher.validate(data))
+    except Exception as _e:
+        handle_ai_validation_error(_e)
+        return
+
+    if not validation_result.get('result'):
+        raise OffensiveLanguageError(validation_result.get('failed_fields'))
+
+
+async def validate_texts_with_ai(items: List[dict]) -> List[Optional[OffensiveLanguageError]]:
+    """
+    Checks several items with AI using single batch model request. Unlike validate_text_with_ai, offensive items do
+    not raise error, so every item gets its own result. AI failure policy is applied to the whole batch
+    :param items: data of items that will be validated
+    :return: errors of offensive items in the same order as items. Error is None if item is valid
+    """
+    errors: List[Optional[OffensiveLanguageError]] = [None] * len(items)
+    if not get_settings().USE_AI_FOR_TEXT_VALIDATION:
+        return errors
+
+    model_items = []
+    for index, data in enumerate(items):
+        prefilter_verdict, failed_fields = get_moderation_prefilter().check(data)
+        metrics.increment(f'moderation_prefilter_{prefilter_verdict.value}_total')
+        if prefilter_verdict == PrefilterVerdict.block:
+            errors[index] = OffensiveLanguageError(failed_fields)
+        elif prefilter_verdict == PrefilterVerdict.ask_model:
+            model_items.append(index)
+    if not model_items:
+        return errors
+
+    metrics.observe('moderation_batch_size', len(model_items))
+    try:
+        results = await get_results_of_ai_batch_validation([items[index] for index in model_items])
+        not_validated_items = [position for position, result in enumerate(results) if result is None]
+        metrics.increment('moderation_batch_item_fallbacks_total', len(not_validated_items))
+        fallback_results = await asyncio.gather(*(get_result_of_ai_validation(items[model_items[position]])
+                                                  for position in not_validated_items))
+        for position, result in zip(not_validated_items, fallback_results):
+            results[position] = result
+        results = [check_validation_result(result) for result in results]
+    except Exception as _e:
+        handle_ai_validation_error(_e)
+        return errors
+
+    for index, validation_result in zip(model_items, results):
+        if not validation_result.get('result'):
+            errors[index] = OffensiveLanguageError(validation_result.get('failed_fields'))
+    return errors
+
+
+def handle_ai_validation_error(_e: Exception) -> None:
+    """
+    Applies AI failure policy to error of AI validation request
+    :param _e: error of AI validation request
+    :return: None if text can be accepted without validation, else raises HTTPException
+    """
+    if get_settings().AI_FAILURE_POLICY == AIFailurePolicyTypes.fail_open:
+        metrics.increment('moderation_fail_open_total')
+        get_logger().warning(f'text accepted without AI validation: {_e!r}')
+        return
+    if isinstance(_e, CircuitBreakerOpen):
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=AI_TEMPORARILY_UNAVAILABLE)
+    if get_ai_backend().is_quota_exceeded_error(_e):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=AI_REQUEST_QUOTA_EXCEEDED)
+    logger = get_logger()
+    logger.error(_e, exc_info=True)
+    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=AI_VALIDATION_ERROR)
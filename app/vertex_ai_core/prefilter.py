@@ -0,0 +1,141 @@
+import json
+
+from collections import deque
+from enum import Enum
+from functools import lru_cache
+from typing import Iterable, Iterator, List, Tuple
+
+from app.config import get_settings
+from app.vertex_ai_core.verdict_cache import normalize_text
+
+
+class PrefilterVerdict(Enum):
+    block: str = 'block'
+    allow: str = 'allow'
+    ask_model: str = 'ask_model'
+
+
+class AhoCorasickMatcher:
+    """
+    Finds occurrences of many patterns in text using single pass over text
+    """
+
+    def __init__(self, patterns: Iterable[str]):
+        self._transitions: List[dict] = [{}]
+        self._fail_links: List[int] = [0]
+        self._outputs: List[List[str]] = [[]]
+
+        for pattern in patterns:
+            self._add_pattern(pattern)
+        self._build_fail_links()
+
+    def _add_pattern(self, pattern: str) -> None:
+        """
+        Adds pattern to trie
+        :param pattern: pattern that will be added
+        :return: None
+        """
+        if not pattern:
+            return
+
+        state = 0
+        for char in pattern:
+            if char not in self._transitions[state]:
+                self._transitions.append({})
+                self._fail_links.append(0)
+                self._outputs.append([])
+                self._transitions[state][char] = len(self._transitions) - 1
+            state = self._transitions[state][char]
+        self._outputs[state].append(pattern)
+
+    def _build_fail_links(self) -> None:
+        """
+        Links every trie state with the longest proper suffix, that is also present in trie
+        :return: None
+        """
+        queue = deque(self._transitions[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._transitions[state].items():
+                queue.append(next_state)
+                fail_state = self._fail_links[state]
+                while fail_state and char not in self._transitions[fail_state]:
+                    fail_state = self._fail_links[fail_state]
+                self._fail_links[next_state] = self._transitions[fail_state].get(char, 0)
+                self._outputs[next_state] = self._outputs[next_state] + self._outputs[self._fail_links[next_state]]
+
+    def find_all(self, text: str) -> Iterator[Tuple[int, str]]:
+        """
+        Finds all occurrences of patterns in text
+        :param text: text where patterns are searched
+        :return: start position and pattern of every occurrence
+        """
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in self._transitions[state]:
+                state = self._fail_links[state]
+            state = self._transitions[state].get(char, 0)
+            for pattern in self._outputs[state]:
+                yield position - len(pattern) + 1, pattern
+
+    def contains_word(self, text: str) -> bool:
+        """
+        Checks if text contains any pattern as separate word or phrase
+        :param text: text where patterns are searched
+        :return: result of the check
+        """
+        for start, pattern in self.find_all(text):
+            end = start + len(pattern)
+            if (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum()):
+                return True
+        return False
+
+
+class ModerationPrefilter:
+    """
+    Gives verdict for texts that can be moderated without AI: texts with blocked words are blocked, short and allowed
+    texts are allowed. Other texts must be checked by model
+    """
+
+    def __init__(self, blocked_words: Iterable[str], allowed_texts: Iterable[str], short_text_length: int):
+        self._blocked_words_matcher = AhoCorasickMatcher(normalize_text(word) for word in blocked_words)
+        self._allowed_texts = {normalize_text(text) for text in allowed_texts}
+        self._short_text_length = short_text_length
+
+    def check(self, data: dict) -> Tuple[PrefilterVerdict, List[str]]:
+        """
+        Checks fields of data
+        :param data: data that will be checked
+        :return: verdict and names of fields that contain blocked words
+        """
+        normalized_data = {field: normalize_text(str(value)) for field, value in data.items()}
+
+        # Blocked words are checked before short texts are allowed, because blocked word can be short
+        failed_fields = [field for field, text in normalized_data.items()
+                         if self._blocked_words_matcher.contains_word(text)]
+        if failed_fields:
+            return PrefilterVerdict.block, failed_fields
+
+        if all(text in self._allowed_texts or len(text) <= self._short_text_length
+               for text in normalized_data.values()):
+            return PrefilterVerdict.allow, []
+        return PrefilterVerdict.ask_model, []
+
+
+@lru_cache
+def get_moderation_prefilter() -> ModerationPrefilter:
+    """
+    Creates prefilter using lexicon from settings and lexicon file
+    :return: prefilter instance
+    """
+    settings = get_settings()
+    blocked_words = list(settings.MODERATION_BLOCKED_WORDS)
+    allowed_texts = list(settings.MODERATION_ALLOWED_TEXTS)
+
+    if settings.MODERATION_LEXICON_PATH:
+        with open(settings.MODERATION_LEXICON_PATH) as lexicon_file:
+            lexicon = json.load(lexicon_file)
+        blocked_words.extend(lexicon.get('blocked_words', []))
+        allowed_texts.extend(lexicon.get('allowed_texts', []))
+
+    return ModerationPrefilter(blocked_words, allowed_texts, settings.MODERATION_SHORT_TEXT_LENGTH)
@@ -0,0 +1,120 @@
+import json
+
+from typing import List, Optional
+
+
+def get_validation_prompt(data: dict) -> str:
+    """
+    Creates validation prompt filled with passed data
+    :param data: data that used in prompt
+    :return: validation prompt
+    """
+    validation_prompt = f"Analyze following data and check if its fields contains offensive language: {data}." \
+                        f"Format your response in JsonFormat. It must contain 'result' field, which will contain " \
+                        f"boolean value of this check and 'failed_fields' field which will contain name of " \
+                        f"fields, that failed check"
+    return validation_prompt
+
+
+def get_batch_validation_prompt(items: List[dict]) -> str:
+    """
+    Creates validation prompt for several items filled with passed data
+    :param items: data of items that used in prompt
+    :return: batch validation prompt
+    """
+    numbered_items = [{'id': index, 'data': data} for index, data in enumerate(items)]
+    validation_prompt = f"Analyze following items and check if fields of their data contains offensive language: " \
+                        f"{numbered_items}. Format your response in JsonFormat as array, that contains object for " \
+                        f"every item. Each object must contain 'id' field with id of item, 'result' field, which " \
+                        f"will contain boolean value of this check and 'failed_fields' field which will contain " \
+                        f"name of fields, that failed check"
+    return validation_prompt
+
+
+def get_generation_prompt(post: str, comment: str) -> str:
+    """
+    Creates generation prompt filled with passed data
+    :param post: post data used in prompt
+    :param comment: comment data used in prompt
+    :return: generation prompt
+    """
+    generation_prompt = f'You an author of this post: {post}. Generate answer to following user comment: {comment}.' \
+                        f'Your response should be related to this comment and your post. Response should be ' \
+                        f'less than 1000 characters'
+    return generation_prompt
+
+
+def get_batch_generation_prompt(post: str, comments: List[str]) -> str:
+    """
+    Creates generation prompt for several comments to the same post
+    :param post: post data used in prompt
+    :param comments: comments data used in prompt
+    :return: batch generation prompt
+    """
+    numbered_comments = [{'id': index, 'comment': comment} for index, comment in enumerate(comments)]
+    generation_prompt = f'You an author of this post: {post}. Generate answers to following user comments: ' \
+                        f'{numbered_comments}. Every answer should be related to its comment and your post and ' \
+                        f'should be less than 1000 characters. Format your response in JsonFormat as array, that ' \
+                        f'contains object for every comment. Each object must contain \'id\' field with id of ' \
+                        f'comment and \'answer\' field with answer to comment'
+    return generation_prompt
+
+
+def clear_response(response: str) -> str:
+    """
+    Clears model response
+    :param response: model response
+    :return: cleared response
+    """
+    opening_bracket = response.find('{')
+    closing_bracket = response.find('}')
+    return response[opening_bracket:closing_bracket+1]
+
+
+def clear_batch_response(response: str) -> str:
+    """
+    Clears model response that contains array
+    :param response: model response
+    :return: cleared response
+    """
+    opening_bracket = response.find('[')
+    closing_bracket = response.rfind(']')
+    return response[opening_bracket:closing_bracket+1]
+
+
+def parse_batch_generation_response(response: str, comments_count: int) -> List[Optional[str]]:
+    """
+    Parses model response to batch generation prompt
+    :param response: model response
+    :param comments_count: number of answered comments
+    :return: answers in the same order as comments. Answer is None if response does not contain answer for comment
+    """
+    answers: List[Optional[str]] = [None] * comments_count
+    batch_result = json.loads(clear_batch_response(response))
+
+    for item_result in batch_result if isinstance(batch_result, list) else []:
+        item_id = item_result.get('id') if isinstance(item_result, dict) else None
+        if not isinstance(item_id, int) or not 0 <= item_id < comments_count:
+            continue
+        if isinstance(item_result.get('answer'), str) and item_result.get('answer'):
+            answers[item_id] = item_result.get('answer')
+    return answers
+
+
+def parse_batch_validation_response(response: str, items_count: int) -> List[Optional[dict]]:
+    """
+    Parses model response to batch validation prompt
+    :param response: model response
+    :param items_count: number of validated items
+    :return: results of validation in the same order as items. Result is None if response does not contain valid
+    result for item
+    """
+    results: List[Optional[dict]] = [None] * items_count
+    batch_result = json.loads(clear_batch_response(response))
+
+    for item_result in batch_result if isinstance(batch_result, list) else []:
+        item_id = item_result.get('id') if isinstance(item_result, dict) else None
+        if not isinstance(item_id, int) or not 0 <= item_id < items_count or 'result' not in item_result:
+            continue
+        results[item_id] = {'result': item_result.get('result'), 'failed_fields': item_result.get('failed_fields')}
+    return results
@@ -0,0 +1,107 @@
+import hashlib
+import json
+
+from datetime import datetime
+from threading import Lock
+from typing import Optional, List
+
+from cachetools import TTLCache
+
+from app.config import get_settings
+from app.database import get_moderation_verdict_collection
+from app.metrics.service import metrics
+
+settings = get_settings()
+
+local_verdict_cache = TTLCache(maxsize=settings.VERDICT_CACHE_MAX_SIZE, ttl=settings.VERDICT_CACHE_TTL_SECONDS)
+local_verdict_cache_lock = Lock()
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalizes text, so texts that differ only by case and whitespaces are considered the same
+    :param text: text that will be normalized
+    :return: normalized text
+    """
+    return ' '.join(text.casefold().split())
+
+
+def get_verdict_key(data: dict) -> str:
+    """
+    Creates cache key for validated data
+    :param data: validated fields
+    :return: hash of normalized fields
+    """
+    normalized_data = {field: normalize_text(str(value)) for field, value in data.items()}
+    return hashlib.sha256(json.dumps(normalized_data, sort_keys=True).encode()).hexdigest()
+
+
+def get_cached_verdict(data: dict) -> Optional[dict]:
+    """
+    Looks up result of validation of the same data in application memory and then in database
+    :param data: validated fields
+    :return: cached result of validation or None
+    """
+    key = get_verdict_key(data)
+    with local_verdict_cache_lock:
+        verdict = local_verdict_cache.get(key)
+    if verdict is not None:
+        metrics.increment('moderation_verdict_cache_local_hits_total')
+        return verdict
+
+    cached_verdict = get_moderation_verdict_collection().find_one({'_id': key})
+    if cached_verdict is None:
+        metrics.increment('moderation_verdict_cache_misses_total')
+        return None
+
+    metrics.increment('moderation_verdict_cache_database_hits_total')
+    verdict = cached_verdict.get('verdict')
+    with local_verdict_cache_lock:
+        local_verdict_cache[key] = verdict
+    return verdict
+
+
+def get_cached_verdicts(items: List[dict]) -> List[Optional[dict]]:
+    """
+    Looks up results of validation of several items in application memory and then in database. Items that are not
+    cached in memory are looked up using single database request
+    :param items: validated fields of every item
+    :return: cached results of validation in the same order as items. Result is None if it is not cached
+    """
+    keys = [get_verdict_key(data) for data in items]
+    verdicts = {}
+    with local_verdict_cache_lock:
+        for key in keys:
+            verdict = local_verdict_cache.get(key)
+            if verdict is not None:
+                verdicts[key] = verdict
+    metrics.increment('moderation_verdict_cache_local_hits_total', sum(key in verdicts for key in keys))
+
+    not_cached_keys = list({key for key in keys if key not in verdicts})
+    if not_cached_keys:
+        cached_verdicts = {cached_verdict['_id']: cached_verdict.get('verdict') for cached_verdict in
+                           get_moderation_verdict_collection().find({'_id': {'$in': not_cached_keys}})}
+        with local_verdict_cache_lock:
+            for key, verdict in cached_verdicts.items():
+                local_verdict_cache[key] = verdict
+        verdicts.update(cached_verdicts)
+        metrics.increment('moderation_verdict_cache_database_hits_total',
+                          sum(key in cached_verdicts for key in keys))
+
+    metrics.increment('moderation_verdict_cache_misses_total', sum(key not in verdicts for key in keys))
+    return [verdicts.get(key) for key in keys]
+
+
+def cache_verdict(data: dict, verdict: dict) -> None:
+    """
+    Saves result of validation in application memory and in database
+    :param data: validated fields
+    :param verdict: result of validation
+    :return: None
+    """
+    key = get_verdict_key(data)
+    with local_verdict_cache_lock:
+        local_verdict_cache[key] = verdict
+    get_moderation_verdict_collection().update_one({'_id': key},
+                                                   {'$set': {'verdict': verdict, 'created_at': datetime.utcnow()}},
+                                                   upsert=True)
@@ -0,0 +1,123 @@
+import asyncio
+import contextlib
+import os
+import signal
+import socket
+import uuid
+
+from apscheduler.executors.asyncio import AsyncIOExecutor
+from apscheduler.executors.pool import ThreadPoolExecutor, ProcessPoolExecutor
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.jobstores.mongodb import MongoDBJobStore
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+from pytz import utc
+
+from app.background_tasks import moderate_pending_comments, process_reply_queue, purge_deleted_posts
+from app.comments.recompute import recompute_recent_statistics
+from app.comments.statistics_buffer import statistics_buffer, flush_statistics_buffer_periodically
+from app.config import get_settings
+from app.database import database_executor, mongo_client, run_in_database_executor, SCHEDULER_JOB_DOC
+from app.indexes import sync_indexes
+from app.leases import acquire_lease, release_lease
+from app.logger import get_logger
+from app.vertex_ai_core.moderation import moderation_batcher
+
+WORKER_LEASE = 'scheduler'
+
+
+def create_scheduler() -> AsyncIOScheduler:
+    """
+    Creates scheduler with background jobs. Jobs persisted in database survive restarts, periodic jobs are added on
+    every start
+    :return: scheduler
+    """
+    settings = get_settings()
+    jobstores = {
+        'default': MongoDBJobStore(database=settings.DATABASE_NAME, collection=SCHEDULER_JOB_DOC,
+                                   client=mongo_client),
+        'memory': MemoryJobStore()
+    }
+    executors = {
+        'default': ThreadPoolExecutor(20),
+        'processpool': ProcessPoolExecutor(5),
+        'asyncio': AsyncIOExecutor()
+    }
+    job_defaults = {
+        'coalesce': False,
+        'max_instances': 3
+    }
+    scheduler = AsyncIOScheduler(jobstores=jobstores, executors=executors, job_defaults=job_defaults, timezone=utc)
+
+    if settings.ASYNC_COMMENT_MODERATION:
+        scheduler.add_job(moderate_pending_comments,
+                          IntervalTrigger(seconds=settings.PENDING_COMMENTS_MODERATION_INTERVAL_SECONDS),
+                          id='moderate_pending_comments', replace_existing=True, executor='asyncio',
+                          jobstore='memory', max_instances=1, coalesce=True)
+    scheduler.add_job(process_reply_queue, IntervalTrigger(seconds=settings.REPLY_QUEUE_POLL_INTERVAL_SECONDS),
+                      id='process_reply_queue', replace_existing=True, executor='asyncio', jobstore='memory',
+                      max_instances=1, coalesce=True)
+    scheduler.add_job(purge_deleted_posts, IntervalTrigger(seconds=settings.POST_PURGE_INTERVAL_SECONDS),
+                      id='purge_deleted_posts', replace_existing=True, executor='asyncio', jobstore='memory',
+                      max_instances=1, coalesce=True)
+    if settings.STATISTICS_RECOMPUTE_ENABLED:
+        scheduler.add_job(recompute_recent_statistics, CronTrigger(hour=settings.STATISTICS_RECOMPUTE_HOUR),
+                          id='recompute_recent_statistics', replace_existing=True, jobstore='memory', max_instances=1,
+                          coalesce=True)
+    return scheduler
+
+
+async def run_worker() -> None:
+    """
+    Runs background jobs. Several worker instances can be started, but jobs are run only by instance that holds
+    worker lease. Other instances wait and take over if lease expires
+    :return: None
+    """
+    settings = get_settings()
+    logger = get_logger()
+    owner = f'{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex}'
+
+    stop_event = asyncio.Event()
+    for stop_signal in (signal.SIGINT, signal.SIGTERM):
+        asyncio.get_running_loop().add_signal_handler(stop_signal, stop_event.set)
+
+    sync_indexes()
+    scheduler = create_scheduler()
+    scheduler.start(paused=True)
+    statistics_flush_task = asyncio.create_task(
+        flush_statistics_buffer_periodically(settings.STATISTICS_FLUSH_INTERVAL_SECONDS))
+
+    is_leader = False
+    while not stop_event.is_set():
+        try:
+            has_lease = await run_in_database_executor(acquire_lease, WORKER_LEASE, owner,
+                                                       settings.WORKER_LEASE_TTL_SECONDS)
+        except Exception as _e:
+            logger.error(_e, exc_info=True)
+            has_lease = False
+
+        if has_lease and not is_leader:
+            logger.info(f'worker {owner} acquired lease and runs background jobs')
+            scheduler.resume()
+        elif not has_lease and is_leader:
+            logger.warning(f'worker {owner} lost lease and stops background jobs')
+            scheduler.pause()
+        is_leader = has_lease
+
+        with contextlib.suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(stop_event.wait(), timeout=settings.WORKER_LEASE_RENEW_INTERVAL_SECONDS)
+
+    scheduler.shutdown()
+    statistics_flush_task.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await statistics_flush_task
+    await moderation_batcher.close()
+    statistics_buffer.flush()
+    if is_leader:
+        release_lease(WORKER_LEASE, owner)
+    database_executor.shutdown(wait=True)
+
+
+if __name__ == '__main__':
+    asyncio.run(run_worker())
@@ -5,6 +5,7 @@ import pytest
 from httpx import AsyncClient
 from starlette import status
 
+from app.auth.dependencies import get_cached_principal
 from tests.conftest import USER_DATA
 
 
@@ -31,3 +32,31 @@ async def test_cant_login_with_invalid_credentials(client: AsyncClient):
 
     assert response.status_code == status.HTTP_401_UNAUTHORIZED
 
+
+async def test_authenticated_user_is_cached(client: AsyncClient, user, token, post):
+    assert not get_cached_principal(token)
+
+    response = await client.get(url=f'api/v1/posts/{post}',
+                                headers={'Authorization': f'Bearer {token}'})
+
+    assert response.status_code == status.HTTP_200_OK
+
+    cached_principal = get_cached_principal(token)
+    assert cached_principal
+    assert cached_principal.id == user
+    assert cached_principal.email == USER_DATA.get('email')
+
+
+async def test_cached_user_is_evicted_when_user_is_updated(client: AsyncClient, user, token, post):
+    response = await client.get(url=f'api/v1/posts/{post}',
+                                headers={'Authorization': f'Bearer {token}'})
+
+    assert response.status_code == status.HTTP_200_OK
+    assert get_cached_principal(token)
+
+    response = await client.patch(url=f'api/v1/users/{user}/settings',
+                                  data=json.dumps({'automatic_response_enabled': True}),
+                                  headers={'Authorization': f'Bearer {token}'})
+
+    assert response.status_code == status.HTTP_200_OK
+    assert not get_cached_principal(token)
@@ -2,13 +2,20 @@ import pytest
 import json
 
 from datetime import datetime
+from fastapi import HTTPException
 from httpx import AsyncClient
 from starlette import status
 
-from app import messages
-from app.database import get_statistic_collection
+from app import background_tasks, messages
+from app.background_tasks import moderate_pending_comments
+from app.config import get_settings
+from app.database import get_comment_collection, get_statistic_collection
+from app.comments import service as comments_service
+from app.comments.service import create_comment_in_db, build_comment_document
 from app.custom_fields import PyObjectId
-from tests.conftest import COMMENT_DATA
+from app.exceptions import StatisticsWriteError
+from app.vertex_ai_core import moderation
+from tests.conftest import COMMENT_DATA, COMMENT_DATA2
 
 
 async def test_not_authenticated_user_cant_create_comment(client: AsyncClient, post):
@@ -132,6 +139,103 @@ async def test_user_can_create_comment(client: AsyncClient, user, token, post):
     assert existing_statistics.get('blocked_comments') == 0
 
 
+async def test_comment_is_created_when_statistics_write_fails(client: AsyncClient, user, token, post, monkeypatch):
+    def write_statistics_increments(increments):
+        raise StatisticsWriteError('statistics increments were not written')
+
+    monkeypatch.setattr(get_settings(), 'STATISTICS_BUFFER_ENABLED', False)
+    monkeypatch.setattr(comments_service, 'write_statistics_increments', write_statistics_increments)
+
+    response = await client.post(url=f'api/v1/posts/{post}/comments/',
+                                 data=json.dumps(COMMENT_DATA.copy()),
+                                 headers={'Authorization': f'Bearer {token}'})
+
+    assert response.status_code == status.HTTP_201_CREATED
+    assert get_comment_collection().count_documents({'post_id': post}) == 1
+
+
+async def test_comment_is_published_after_async_moderation(client: AsyncClient, user, token, post, monkeypatch):
+    monkeypatch.setattr(get_settings(), 'ASYNC_COMMENT_MODERATION', True)
+
+    response = await client.post(url=f'api/v1/posts/{post}/comments/',
+                                 data=json.dumps(COMMENT_DATA.copy()),
+                                 headers={'Authorization': f'Bearer {token}'})
+
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    assert response.json().get('status') == 'pending'
+
+    response = await client.get(url=f'api/v1/posts/{post}/comments/?exact_count=true',
+                                headers={'Authorization': f'Bearer {token}'})
+    assert response.json().get('total_items_count') == 0
+
+    await moderate_pending_comments()
+
+    response = await client.get(url=f'api/v1/posts/{post}/comments/?exact_count=true',
+                                headers={'Authorization': f'Bearer {token}'})
+    response_data = response.json()
+    assert response_data.get('total_items_count') == 1
+    assert response_data.get('items')[0].get('status') == 'published'
+
+    current_date = datetime.utcnow().date().strftime("%Y-%m-%d")
+    existing_statistics = get_statistic_collection().find_one({'date': current_date})
+    assert existing_statistics.get('created_comments') == 1
+
+
+async def test_comment_is_blocked_after_failed_moderation_attempts(client: AsyncClient, user, token, post,
+                                                                   monkeypatch):
+    async def validate_text(data):
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=messages.AI_VALIDATION_ERROR)
+
+    monkeypatch.setattr(get_settings(), 'ASYNC_COMMENT_MODERATION', True)
+    monkeypatch.setattr(get_settings(), 'PENDING_COMMENTS_MODERATION_MAX_ATTEMPTS', 2)
+    monkeypatch.setattr(background_tasks, 'validate_text_with_ai', validate_text)
+
+    response = await client.post(url=f'api/v1/posts/{post}/comments/',
+                                 data=json.dumps(COMMENT_DATA.copy()),
+                                 headers={'Authorization': f'Bearer {token}'})
+    comment_id = PyObjectId(response.json().get('_id'))
+
+    await moderate_pending_comments()
+    await moderate_pending_comments()
+
+    comment = get_comment_collection().find_one({'_id': comment_id})
+    assert comment.get('status') == 'pending'
+    assert comment.get('moderation_attempts') == 1
+    assert comment.get('next_attempt_at') > datetime.utcnow()
+
+    get_comment_collection().update_one({'_id': comment_id}, {'$set': {'next_attempt_at': datetime.utcnow()}})
+    await moderate_pending_comments()
+
+    comment = get_comment_collection().find_one({'_id': comment_id})
+    assert comment.get('status') == 'blocked'
+    assert comment.get('moderation_attempts') == 2
+
+    current_date = datetime.utcnow().date().strftime("%Y-%m-%d")
+    existing_statistics = get_statistic_collection().find_one({'date': current_date})
+    assert existing_statistics.get('blocked_comments') == 1
+
+
+async def test_user_cant_list_or_edit_comments_of_deleted_post(client: AsyncClient, user, token, post, comment):
+    response = await client.delete(url=f'api/v1/posts/{post}',
+                                   headers={'Authorization': f'Bearer {token}'})
+
+    assert response.status_code == status.HTTP_200_OK
+
+    response = await client.get(url=f'api/v1/posts/{post}/comments/',
+                                headers={'Authorization': f'Bearer {token}'})
+
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert response.json().get('detail') == messages.POST_NOT_FOUND
+
+    response = await client.patch(url=f'api/v1/posts/{post}/comments/{comment.id}',
+                                  data=json.dumps({'text': 'new text'}),
+                                  headers={'Authorization': f'Bearer {token}'})
+
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert response.json().get('detail') == messages.POST_NOT_FOUND
+    assert get_comment_collection().find_one({'_id': comment.id}).get('text') == comment.text
+
+
 async def test_user_can_edit_comment(client: AsyncClient, user, token, post, comment):
     new_data = {'text': 'new text'}
     assert new_data.get('text') != comment.text
@@ -237,6 +341,68 @@ async def test_user_can_paginate_comment_list(client: AsyncClient, user, token,
     assert items[0].get('_id') == str(comment2.id)
 
 
+async def test_user_can_paginate_comment_list_with_cursor(client: AsyncClient, user, token, post, comment, comment2):
+    response = await client.get(url=f'api/v1/posts/{post}/comments/',
+                                headers={'Authorization': f'Bearer {token}'})
+
+    assert response.status_code == status.HTTP_200_OK
+
+    response_data = response.json()
+
+    assert response_data
+    assert response_data.get('items')[0].get('_id') == str(comment.id)
+
+    next_cursor = response_data.get('next_cursor')
+    assert next_cursor
+
+    response = await client.get(url=f'api/v1/posts/{post}/comments/?cursor={next_cursor}',
+                                headers={'Authorization': f'Bearer {token}'})
+
+    assert response.status_code == status.HTTP_200_OK
+
+    response_data = response.json()
+
+    assert response_data
+    assert response_data.get('total_items_count') == 2
+    assert response_data.get('page_size') == 1
+    assert response_data.get('next_cursor') is None
+
+    items = response_data.get('items')
+    assert items
+    assert items[0].get('_id') == str(comment2.id)
+
+
+async def test_user_can_get_exact_comments_count(client: AsyncClient, user, token, post, comment):
+    response = await client.get(url=f'api/v1/posts/{post}/comments/',
+                                headers={'Authorization': f'Bearer {token}'})
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json().get('total_items_count') == 1
+
+    create_comment_in_db(post, user, COMMENT_DATA2.copy())
+
+    response = await client.get(url=f'api/v1/posts/{post}/comments/',
+                                headers={'Authorization': f'Bearer {token}'})
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json().get('total_items_count') == 2
+
+    # Comment inserted without service does not clear cached count
+    get_comment_collection().insert_one(build_comment_document(post, user, COMMENT_DATA2.copy()))
+
+    response = await client.get(url=f'api/v1/posts/{post}/comments/',
+                                headers={'Authorization': f'Bearer {token}'})
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json().get('total_items_count') == 2
+
+    response = await client.get(url=f'api/v1/posts/{post}/comments/?exact_count=true',
+                                headers={'Authorization': f'Bearer {token}'})
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json().get('total_items_count') == 3
+
+
 async def test_user_can_change_comment_list_page_size(client: AsyncClient, user, token, post, comment, comment2):
     response = await client.get(url=f'api/v1/posts/{post}/comments/?page_size=2',
                                 headers={'Authorization': f'Bearer {token}'})
@@ -277,3 +443,91 @@ async def test_user_can_get_comment_statistics(client: AsyncClient, user, token,
     assert daily_statistics
     assert daily_statistics.get('created_comments') == existing_statistics.get('created_comments')
     assert daily_statistics.get('blocked_comments') == existing_statistics.get('blocked_comments')
+
+
+async def test_user_can_get_weekly_comment_statistics_of_post(client: AsyncClient, user, token, post, comment):
+    await client.post(url=f'api/v1/posts/{post}/comments/',
+                      data=json.dumps(COMMENT_DATA.copy()),
+                      headers={'Authorization': f'Bearer {token}'})
+    current_date = datetime.utcnow().date().strftime("%Y-%m-%d")
+
+    response = await client.get(url=f"api/v1/statistics/comments-daily-breakdown?date_from={current_date}"
+                                    f"&date_to={current_date}&granularity=week&post_id={post}&zero_fill=true",
+                                headers={'Authorization': f'Bearer {token}'})
+
+    assert response.status_code == status.HTTP_200_OK
+
+    items = response.json().get('items')
+    assert len(items) == 1
+    assert list(items[0].values())[0] == {'blocked_comments': 0, 'created_comments': 1}
+
+
+async def test_user_cant_get_comment_statistics_for_reversed_period(client: AsyncClient, user, token):
+    response = await client.get(url="api/v1/statistics/comments-daily-breakdown?date_from=2024-08-31"
+                                    "&date_to=2024-08-01",
+                                headers={'Authorization': f'Bearer {token}'})
+
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+async def test_user_cant_get_comment_statistics_with_too_many_buckets(client: AsyncClient, user, token):
+    response = await client.get(url="api/v1/statistics/comments-daily-breakdown?date_from=0001-01-01"
+                                    "&date_to=9999-12-31&granularity=hour",
+                                headers={'Authorization': f'Bearer {token}'})
+
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+async def test_comment_statistics_are_not_sent_if_not_modified(client: AsyncClient, user, token, comments_statistics):
+    url = "api/v1/statistics/comments-daily-breakdown?date_from=2024-08-01&date_to=2024-08-31"
+    response = await client.get(url=url, headers={'Authorization': f'Bearer {token}'})
+
+    assert response.status_code == status.HTTP_200_OK
+    assert 'no-cache' in response.headers.get('Cache-Control')
+    etag = response.headers.get('ETag')
+    assert etag
+
+    response = await client.get(url=url, headers={'Authorization': f'Bearer {token}', 'If-None-Match': etag})
+
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.headers.get('ETag') == etag
+
+
+async def test_user_can_create_comments_in_bulk(client: AsyncClient, user, token, post, monkeypatch):
+    batches = []
+
+    async def validate_batch(items):
+        batches.append(items)
+        return [{'result': 'offensive' not in item['text'], 'failed_fields': ['text']} for item in items]
+
+    monkeypatch.setattr(get_settings(), 'USE_AI_FOR_TEXT_VALIDATION', True)
+    monkeypatch.setattr(moderation, 'get_results_of_ai_batch_validation', validate_batch)
+
+    comments = [COMMENT_DATA.copy(), {'text': 'offensive comment'}, COMMENT_DATA2.copy()]
+    response = await client.post(url=f'api/v1/posts/{post}/comments/bulk',
+                                 data=json.dumps({'items': comments}),
+                                 headers={'Authorization': f'Bearer {token}'})
+
+    assert response.status_code == status.HTTP_200_OK
+    assert len(batches) == 1
+
+    items = response.json().get('items')
+    assert [item.get('created') for item in items] == [True, False, True]
+    assert items[0].get('comment').get('text') == COMMENT_DATA.get('text')
+    assert items[0].get('comment').get('post_id') == str(post)
+    assert items[1].get('detail')
+    assert get_comment_collection().count_documents({'post_id': post}) == 2
+
+    current_date = datetime.utcnow().date().strftime("%Y-%m-%d")
+    existing_statistics = get_statistic_collection().find_one({'date': current_date})
+    assert existing_statistics.get('created_comments') == 2
+    assert existing_statistics.get('blocked_comments') == 1
+
+
+async def test_user_cant_create_comments_in_bulk_for_non_existing_post(client: AsyncClient, user, token):
+    response = await client.post(url=f'api/v1/posts/{PyObjectId()}/comments/bulk',
+                                 data=json.dumps({'items': [COMMENT_DATA.copy()]}),
+                                 headers={'Authorization': f'Bearer {token}'})
+
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert response.json().get('detail') == messages.POST_NOT_FOUND
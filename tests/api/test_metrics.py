@@ -0,0 +1,15 @@
+from httpx import AsyncClient
+from starlette import status
+
+
+async def test_not_authenticated_user_cant_read_metrics(client: AsyncClient):
+    response = await client.get(url='api/v1/metrics/')
+
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+async def test_authenticated_user_can_read_metrics(client: AsyncClient, user, token):
+    response = await client.get(url='api/v1/metrics/', headers={'Authorization': f'Bearer {token}'})
+
+    assert response.status_code == status.HTTP_200_OK
+    assert isinstance(response.json(), dict)
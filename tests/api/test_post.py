@@ -1,12 +1,16 @@
+import base64
 import pytest
 import json
 
 from httpx import AsyncClient
 from starlette import status
 
+from app.background_tasks import purge_deleted_posts
+from app.config import get_settings
 from app.custom_fields import PyObjectId
-from app.database import get_comment_collection
-from app.messages import POST_NOT_FOUND, POST_EDIT_NOT_ALLOWED, POST_DELETE_NOT_ALLOWED, POST_ALREADY_EXISTS
+from app.database import get_comment_collection, get_post_collection
+from app.messages import POST_NOT_FOUND, POST_EDIT_NOT_ALLOWED, POST_DELETE_NOT_ALLOWED, POST_ALREADY_EXISTS, \
+    INVALID_CURSOR
 from tests.conftest import POST_DATA
 
 
@@ -264,6 +268,25 @@ async def test_user_can_delete_post(client: AsyncClient, user, token):
     assert response.get('deleted')
 
 
+async def test_user_can_recreate_deleted_post(client: AsyncClient, user, token, post):
+    response = await client.delete(url=f'api/v1/posts/{post}',
+                                   headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == status.HTTP_200_OK
+
+    response = await client.post(url='api/v1/posts/',
+                                 data=json.dumps(POST_DATA.copy()),
+                                 headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == status.HTTP_201_CREATED
+    assert response.json().get('title') == POST_DATA.get('title')
+
+    response = await client.delete(url=f'api/v1/posts/{response.json().get("_id")}',
+                                   headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == status.HTTP_200_OK
+
+    await purge_deleted_posts()
+    assert not get_post_collection().count_documents({})
+
+
 async def test_when_user_delete_post_all_related_comment_deleted(client: AsyncClient, user, token, post, comment,
                                                                  comment2):
     comments_count = get_comment_collection().count_documents({'post_id': post})
@@ -279,6 +302,12 @@ async def test_when_user_delete_post_all_related_comment_deleted(client: AsyncCl
     assert response
     assert response.get('deleted')
 
+    response = await client.get(url=f'api/v1/posts/{post}',
+                                headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    await purge_deleted_posts()
+
     comments_count = get_comment_collection().count_documents({'post_id': post})
     assert comments_count == 0
 
@@ -301,6 +330,22 @@ async def test_user_can_get_post_list(client: AsyncClient, user, token, post):
     assert items[0].get('_id') == str(post)
 
 
+async def test_deleted_post_is_not_counted_in_post_list(client: AsyncClient, user, token, post, post2):
+    response = await client.delete(url=f'api/v1/posts/{post2}',
+                                   headers={'Authorization': f'Bearer {token}'})
+
+    assert response.status_code == status.HTTP_200_OK
+
+    response = await client.get(url='api/v1/posts/?page_size=10',
+                                headers={'Authorization': f'Bearer {token}'})
+
+    assert response.status_code == status.HTTP_200_OK
+
+    response_data = response.json()
+    assert response_data.get('total_items_count') == 1
+    assert [item.get('_id') for item in response_data.get('items')] == [str(post)]
+
+
 async def test_user_can_paginate_post_list(client: AsyncClient, user, token, post, post2):
     response = await client.get(url='api/v1/posts/',
                                 headers={'Authorization': f'Bearer {token}'})
@@ -352,3 +397,96 @@ async def test_user_can_change_page_size(client: AsyncClient, user, token, post,
     assert items
     assert len(items) == 2
 
+
+async def test_user_can_paginate_post_list_with_cursor(client: AsyncClient, user, token, post, post2):
+    response = await client.get(url='api/v1/posts/',
+                                headers={'Authorization': f'Bearer {token}'})
+
+    assert response.status_code == status.HTTP_200_OK
+
+    response_data = response.json()
+
+    assert response_data
+    assert response_data.get('items')[0].get('_id') == str(post)
+
+    next_cursor = response_data.get('next_cursor')
+    assert next_cursor
+
+    response = await client.get(url=f'api/v1/posts/?cursor={next_cursor}',
+                                headers={'Authorization': f'Bearer {token}'})
+
+    assert response.status_code == status.HTTP_200_OK
+
+    response_data = response.json()
+
+    assert response_data
+    assert response_data.get('total_items_count') == 2
+    assert response_data.get('page') is None
+    assert response_data.get('page_size') == 1
+    assert response_data.get('next_cursor') is None
+
+    items = response_data.get('items')
+    assert items
+    assert items[0].get('_id') == str(post2)
+
+
+async def test_user_cant_paginate_post_list_with_invalid_cursor(client: AsyncClient, user, token):
+    response = await client.get(url='api/v1/posts/?cursor=invalid',
+                                headers={'Authorization': f'Bearer {token}'})
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    response = response.json()
+    assert response
+    assert response.get('detail') == INVALID_CURSOR
+
+
+async def test_user_cant_edit_post_title_to_title_of_another_post(client: AsyncClient, user, token, post, post2):
+    response = await client.patch(url=f'api/v1/posts/{post2}',
+                                  data=json.dumps({'title': POST_DATA.get('title')}),
+                                  headers={'Authorization': f'Bearer {token}'})
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json().get('detail') == POST_ALREADY_EXISTS
+
+
+async def test_user_can_create_posts_in_bulk(client: AsyncClient, user, token, post):
+    posts = [{'title': 'First bulk post', 'text': 'some text'}, POST_DATA.copy(),
+             {'title': 'First bulk post', 'text': 'another text'}]
+    response = await client.post(url='api/v1/posts/bulk',
+                                 data=json.dumps({'items': posts}),
+                                 headers={'Authorization': f'Bearer {token}'})
+
+    assert response.status_code == status.HTTP_200_OK
+
+    items = response.json().get('items')
+    assert [item.get('created') for item in items] == [True, False, False]
+    assert items[0].get('post').get('title') == posts[0].get('title')
+    assert items[0].get('post').get('user_id') == str(user)
+    assert items[1].get('detail') == POST_ALREADY_EXISTS
+    assert items[2].get('detail') == POST_ALREADY_EXISTS
+    assert get_post_collection().count_documents({}) == 2
+
+
+async def test_user_cant_create_too_many_posts_in_bulk(client: AsyncClient, user, token):
+    posts = [{'title': f'Post {index}', 'text': 'some text'}
+             for index in range(get_settings().BULK_CREATE_MAX_ITEMS + 1)]
+    response = await client.post(url='api/v1/posts/bulk',
+                                 data=json.dumps({'items': posts}),
+                                 headers={'Authorization': f'Bearer {token}'})
+
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    assert not get_post_collection().count_documents({})
+
+
+@pytest.mark.parametrize('position', [{'created_at': {'$ne': None}, '_id': '6ad4b7cc37e368203545ef31'},
+                                      {'created_at': '2024-01-01', '_id': '6ad4b7cc37e368203545ef31'},
+                                      {'created_at': '2024-01-01T00:00:00Z', '_id': {'$ne': None}}])
+async def test_user_cant_paginate_post_list_with_cursor_containing_query(client: AsyncClient, user, token, post,
+                                                                         position):
+    cursor = base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+    response = await client.get(url=f'api/v1/posts/?cursor={cursor}',
+                                headers={'Authorization': f'Bearer {token}'})
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json().get('detail') == INVALID_CURSOR
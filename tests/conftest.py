@@ -5,14 +5,19 @@ from typing import Generator, Any
 from fastapi import FastAPI
 from httpx import AsyncClient, ASGITransport
 
+from app.auth.dependencies import principal_cache
 from app.auth.jwt import AccessToken
 from app.main import get_application
 from app.config import get_settings
 from app.database import mongo_client, get_statistic_collection
+from app.indexes import sync_indexes
 from app.comments.schemas import CommentReadSchema
-from app.comments.service import create_comment_in_db, find_comment_by_id
+from app.comments.service import create_comment_in_db
+from app.comments.statistics import statistics_cache
 from app.post.service import create_post_in_db
+from app.service import count_cache
 from app.user.service import create_user
+from app.vertex_ai_core.verdict_cache import local_verdict_cache
 
 settings = get_settings()
 
@@ -63,9 +68,14 @@ COMMENT_STATISTICS = {
 @pytest.fixture
 async def app() -> Generator[FastAPI, Any, None]:
     _app = get_application()
+    sync_indexes()
     yield _app
 
     mongo_client.drop_database(get_settings().DATABASE_NAME)
+    principal_cache.clear()
+    local_verdict_cache.clear()
+    statistics_cache.clear()
+    count_cache.clear()
 
 
 @pytest.fixture(scope="function")
@@ -76,14 +86,14 @@ async def client(app: FastAPI) -> AsyncClient:
 
 @pytest.fixture
 async def user():
-    created_user_id = create_user(USER_DATA)
-    return created_user_id
+    created_user = create_user(USER_DATA)
+    return created_user['_id']
 
 
 @pytest.fixture
 async def user2():
-    created_user_id = create_user(USER2_DATA)
-    return created_user_id
+    created_user = create_user(USER2_DATA)
+    return created_user['_id']
 
 
 @pytest.fixture
@@ -98,38 +108,38 @@ async def token2():
 
 @pytest.fixture
 async def post(user):
-    created_post_id = create_post_in_db(POST_DATA.copy(), user_id=user)
-    return created_post_id
+    created_post = create_post_in_db(POST_DATA.copy(), user_id=user)
+    return created_post['_id']
 
 
 @pytest.fixture
 async def post2(user):
-    created_post_id = create_post_in_db(POST_DATA2.copy(), user_id=user)
-    return created_post_id
+    created_post = create_post_in_db(POST_DATA2.copy(), user_id=user)
+    return created_post['_id']
 
 
 @pytest.fixture
 async def comment(user, post) -> CommentReadSchema:
     comment_data = COMMENT_DATA.copy()
-    created_comment_id = create_comment_in_db(post, user, comment_data)
-    return CommentReadSchema(**find_comment_by_id(created_comment_id))
+    created_comment = create_comment_in_db(post, user, comment_data)
+    return CommentReadSchema(**created_comment)
 
 
 @pytest.fixture
 async def comment2(user, post) -> CommentReadSchema:
     comment_data = COMMENT_DATA2.copy()
-    created_comment_id = create_comment_in_db(post, user, comment_data)
-    return CommentReadSchema(**find_comment_by_id(created_comment_id))
+    created_comment = create_comment_in_db(post, user, comment_data)
+    return CommentReadSchema(**created_comment)
 
 
 @pytest.fixture
 async def comment_to_another_post(user, post2) -> CommentReadSchema:
     comment_data = COMMENT_DATA3.copy()
-    created_comment_id = create_comment_in_db(post2, user, comment_data)
-    return CommentReadSchema(**find_comment_by_id(created_comment_id))
+    created_comment = create_comment_in_db(post2, user, comment_data)
+    return CommentReadSchema(**created_comment)
 
 
 @pytest.fixture
-async def comments_statistics():
+async def comments_statistics(app):
     created_statistics_id = get_statistic_collection().insert_one(COMMENT_STATISTICS.copy())
     return created_statistics_id.inserted_id
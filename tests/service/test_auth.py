@@ -1,5 +1,10 @@
+import asyncio
+import time
+
 import pytest
 
+from app.auth.exceptions import PasswordHashingQueueFull
+from app.auth.hashing import PasswordHashingPool, hash_password, verify_password as verify_password_in_pool
 from app.auth.service import pwd_context, verify_password, find_user_by_email, authenticate_user
 from tests.conftest import USER_DATA
 
@@ -41,3 +46,24 @@ async def test_authenticate_user_with_incorrect_password(app, user):
 async def test_authenticate_user_with_correct_data(app, user):
     result = authenticate_user(USER_DATA.get('email'), USER_DATA.get('password'))
     assert result
+
+
+async def test_hash_and_verify_password_in_pool():
+    plain_password = 'test123'
+    hashed_password = await hash_password(plain_password)
+
+    assert hashed_password != plain_password
+    assert await verify_password_in_pool(plain_password, hashed_password)
+    assert not await verify_password_in_pool('wrong', hashed_password)
+
+
+async def test_password_hashing_pool_rejects_operations_when_queue_is_full():
+    pool = PasswordHashingPool(max_workers=1, max_queue_size=0)
+    running_operation = asyncio.create_task(pool.run(time.sleep, 0.2))
+    await asyncio.sleep(0)
+
+    with pytest.raises(PasswordHashingQueueFull):
+        await pool.run(time.sleep, 0)
+
+    await running_operation
+    pool.shutdown()
@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+from app.vertex_ai_core.circuit_breaker import CircuitBreaker, CircuitBreakerState, retry_with_backoff
+from app.vertex_ai_core.exceptions import CircuitBreakerOpen
+
+
+async def failing_request():
+    raise ValueError('dependency is unavailable')
+
+
+async def successful_request():
+    return 'result'
+
+
+async def test_circuit_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(name='test', failure_threshold=2, reset_timeout_seconds=60)
+
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            await breaker.call(failing_request)
+    assert breaker.state == CircuitBreakerState.open
+
+    with pytest.raises(CircuitBreakerOpen):
+        await breaker.call(successful_request)
+
+
+async def test_circuit_breaker_closes_after_successful_probe():
+    breaker = CircuitBreaker(name='test', failure_threshold=1, reset_timeout_seconds=0.01)
+
+    with pytest.raises(ValueError):
+        await breaker.call(failing_request)
+    await asyncio.sleep(0.02)
+
+    assert await breaker.call(successful_request) == 'result'
+    assert breaker.state == CircuitBreakerState.closed
+
+
+async def test_circuit_breaker_reopens_after_failed_probe():
+    breaker = CircuitBreaker(name='test', failure_threshold=1, reset_timeout_seconds=0.01)
+
+    with pytest.raises(ValueError):
+        await breaker.call(failing_request)
+    await asyncio.sleep(0.02)
+
+    with pytest.raises(ValueError):
+        await breaker.call(failing_request)
+    assert breaker.state == CircuitBreakerState.open
+
+
+async def test_circuit_breaker_allows_new_probe_after_cancelled_probe():
+    breaker = CircuitBreaker(name='test', failure_threshold=1, reset_timeout_seconds=0.01)
+
+    with pytest.raises(ValueError):
+        await breaker.call(failing_request)
+    await asyncio.sleep(0.02)
+
+    probe = asyncio.create_task(breaker.call(lambda: asyncio.sleep(60)))
+    await asyncio.sleep(0)
+    assert breaker.state == CircuitBreakerState.half_open
+    probe.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await probe
+
+    assert await breaker.call(successful_request) == 'result'
+    assert breaker.state == CircuitBreakerState.closed
+
+
+async def test_retry_with_backoff_retries_only_retryable_errors():
+    attempts = []
+
+    async def request():
+        attempts.append(1)
+        raise ValueError('quota exceeded')
+
+    with pytest.raises(ValueError):
+        await retry_with_backoff(request, is_retryable=lambda _e: True, max_attempts=3,
+                                 base_delay_seconds=0, max_delay_seconds=0)
+    assert len(attempts) == 3
+
+    attempts.clear()
+    with pytest.raises(ValueError):
+        await retry_with_backoff(request, is_retryable=lambda _e: False, max_attempts=3,
+                                 base_delay_seconds=0, max_delay_seconds=0)
+    assert len(attempts) == 1
@@ -1,11 +1,19 @@
 import pytest
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
-from app.database import get_comment_collection, get_statistic_collection
+from app.database import get_comment_collection, get_statistic_collection, get_statistic_rollup_collection, \
+    get_statistics_recompute_collection
+from app.comments.schemas import StatisticsGranularity
+from app.comments.statistics import get_statistics_buckets, increase_statistics_version, count_statistics_buckets
+from app.background_tasks import answer_to_comment
+from app.comments.recompute import recompute_statistics, CHECKPOINT_ID
+from app.comments import statistics_buffer as statistics_buffer_module
+from app.comments.statistics_buffer import StatisticsBuffer
 from app.comments.service import create_comment_in_db, find_comment_by_id, update_comment, delete_comment_in_db, \
     get_post_match_pipeline, update_comments_statistics, get_comment_statistics_for_certain_period, \
-    delete_all_comments_related_to_post
+    delete_post_comments_batch
 from tests.conftest import COMMENT_DATA
 
 
@@ -18,11 +26,11 @@ async def test_get_post_match_pipeline(app, post):
 
 
 async def test_user_can_create_comment(app, user, post):
-    created_comment_id = create_comment_in_db(data=COMMENT_DATA.copy(), user_id=user, post_id=post)
-    assert created_comment_id
+    returned_comment = create_comment_in_db(data=COMMENT_DATA.copy(), user_id=user, post_id=post)
+    assert returned_comment.get('_id')
 
-    created_comment = get_comment_collection().find_one({'_id': created_comment_id})
-    assert created_comment
+    created_comment = get_comment_collection().find_one({'_id': returned_comment.get('_id')})
+    assert created_comment == returned_comment
     assert created_comment.get('text') == COMMENT_DATA.get('text')
     assert created_comment.get('post_id') == post
     assert created_comment.get('author_id') == user
@@ -43,11 +51,9 @@ async def test_update_comment(app, comment):
 
     assert new_data.get('title') != old_comment.get('title')
 
-    updated_comment_id = update_comment(comment.id, new_data)
-    assert updated_comment_id
-
-    updated_comment = find_comment_by_id(updated_comment_id)
+    updated_comment = update_comment(comment.id, new_data)
     assert updated_comment.get('title') == new_data.get('title')
+    assert updated_comment == find_comment_by_id(comment.id)
     assert updated_comment.get('_id') == old_comment.get('_id')
 
 
@@ -97,6 +103,63 @@ async def test_update_statistics_increase_blocked_comments_count(app):
     assert existing_statistics.get('date') == current_date
 
 
+async def test_concurrent_statistics_updates_are_not_lost(app):
+    current_date = datetime.utcnow().date().strftime("%Y-%m-%d")
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        for _ in range(50):
+            executor.submit(update_comments_statistics, increase_created_comments=True)
+
+    existing_statistics = get_statistic_collection().find_one({'date': current_date})
+    assert existing_statistics.get('created_comments') == 50
+    assert get_statistic_collection().count_documents({'date': current_date}) == 1
+
+
+async def test_statistics_buffer_writes_counters_on_flush(app):
+    statistics_buffer = StatisticsBuffer(max_size=100)
+    statistics_buffer.add('2024-08-16T10', created_comments=1)
+    statistics_buffer.add('2024-08-16T11', blocked_comments=1)
+    statistics_buffer.add('2024-08-17T09', created_comments=1)
+
+    assert not get_statistic_collection().count_documents({})
+
+    statistics_buffer.flush()
+
+    statistics = get_statistic_collection().find_one({'date': '2024-08-16'})
+    assert statistics.get('created_comments') == 1
+    assert statistics.get('blocked_comments') == 1
+    assert get_statistic_collection().find_one({'date': '2024-08-17'}).get('created_comments') == 1
+
+
+async def test_statistics_buffer_flushes_when_it_is_full(app):
+    statistics_buffer = StatisticsBuffer(max_size=2)
+    statistics_buffer.add('2024-08-16T10', created_comments=1)
+    statistics_buffer.add('2024-08-16T10', created_comments=1)
+
+    statistics = get_statistic_collection().find_one({'date': '2024-08-16'})
+    assert statistics.get('created_comments') == 2
+
+
+async def test_statistics_buffer_rewrites_only_failed_increments(app, monkeypatch):
+    def fail_write(increments):
+        raise ConnectionError('rollups are not available')
+
+    statistics_buffer = StatisticsBuffer(max_size=100)
+    statistics_buffer.add('2024-08-16T10', created_comments=1)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(statistics_buffer_module, 'write_rollup_statistics_increments', fail_write)
+        statistics_buffer.flush()
+
+    assert get_statistic_collection().find_one({'date': '2024-08-16'}).get('created_comments') == 1
+    assert not get_statistic_rollup_collection().count_documents({})
+
+    statistics_buffer.flush()
+
+    assert get_statistic_collection().find_one({'date': '2024-08-16'}).get('created_comments') == 1
+    rollup = get_statistic_rollup_collection().find_one({'granularity': 'hour', 'bucket': '2024-08-16T10'})
+    assert rollup.get('created_comments') == 1
+
+
 async def test_get_comment_statistics_for_certain_period(comments_statistics):
     existing_statistics = get_statistic_collection().find_one({'_id': comments_statistics})
     assert existing_statistics
@@ -115,14 +178,152 @@ async def test_get_comment_statistics_for_certain_period(comments_statistics):
     assert statistics_by_day.get('blocked_comments') == existing_statistics.get('blocked_comments')
 
 
-async def test_delete_all_comments_related_to_post(app, post, post2, comment, comment2, comment_to_another_post):
+async def test_statistics_rollups_are_updated_with_daily_statistics(app, post):
+    update_comments_statistics(increase_created_comments=True, post_id=post)
+    update_comments_statistics(increase_blocked_comments=True, post_id=post)
+    current_date = datetime.utcnow().date().strftime("%Y-%m-%d")
+
+    for granularity in StatisticsGranularity:
+        statistics = get_comment_statistics_for_certain_period(current_date, current_date, granularity, post)
+        assert len(statistics.get('items')) == 1
+        assert list(statistics.get('items')[0].values())[0] == {'blocked_comments': 1, 'created_comments': 1}
+
+    monthly_statistics = get_comment_statistics_for_certain_period(current_date, current_date,
+                                                                   StatisticsGranularity.month)
+    assert list(monthly_statistics.get('items')[0].values())[0] == {'blocked_comments': 1, 'created_comments': 1}
+
+
+async def test_get_comment_statistics_with_zero_fill(comments_statistics):
+    statistics = get_comment_statistics_for_certain_period('2024-08-14', '2024-08-17', zero_fill=True)
+
+    items = statistics.get('items')
+    assert [list(item)[0] for item in items] == ['2024-08-14', '2024-08-15', '2024-08-16', '2024-08-17']
+    assert items[0].get('2024-08-14') == {'blocked_comments': 0, 'created_comments': 0}
+    assert items[2].get('2024-08-16').get('created_comments') == 12
+
+
+async def test_statistics_of_finished_days_are_cached(comments_statistics):
+    get_comment_statistics_for_certain_period('2024-08-16', '2024-08-16')
+    get_statistic_collection().update_one({'_id': comments_statistics}, {'$inc': {'created_comments': 1}})
+
+    statistics = get_comment_statistics_for_certain_period('2024-08-16', '2024-08-16')
+    assert statistics.get('items')[0].get('2024-08-16').get('created_comments') == 12
+
+
+async def test_get_statistics_buckets():
+    date_from, date_to = datetime(2024, 8, 14), datetime(2024, 9, 2)
+
+    assert len(get_statistics_buckets(date_from, date_to, StatisticsGranularity.hour)) == 20 * 24
+    assert get_statistics_buckets(date_from, date_to, StatisticsGranularity.week) == \
+           ['2024-08-12', '2024-08-19', '2024-08-26', '2024-09-02']
+    assert get_statistics_buckets(date_from, date_to, StatisticsGranularity.month) == ['2024-08', '2024-09']
+
+
+async def test_count_statistics_buckets():
+    date_from, date_to = datetime(2024, 8, 14), datetime(2024, 9, 2)
+
+    for granularity in StatisticsGranularity:
+        assert count_statistics_buckets(date_from, date_to, granularity) == \
+               len(get_statistics_buckets(date_from, date_to, granularity))
+
+
+def insert_comment_created_at(post_id, user_id, created_at: str, **data) -> None:
+    get_comment_collection().insert_one({'text': 'comment', 'post_id': post_id, 'author_id': user_id,
+                                         'created_at': created_at, 'updated_at': created_at, **data})
+
+
+async def test_recompute_statistics_rebuilds_created_comments(comments_statistics, user, post):
+    insert_comment_created_at(post, user, '2024-08-16T10:00:00Z')
+    insert_comment_created_at(post, user, '2024-08-16T23:59:59Z')
+    insert_comment_created_at(post, user, '2024-08-16T11:00:00Z', post_author_answer=True)
+    insert_comment_created_at(post, user, '2024-08-16T12:00:00Z', status='blocked')
+
+    recompute_statistics(datetime(2024, 8, 16), datetime(2024, 8, 16))
+
+    statistics = get_statistic_collection().find_one({'date': '2024-08-16'})
+    assert statistics.get('created_comments') == 2
+    assert statistics.get('blocked_comments') == 8
+    assert not get_statistics_recompute_collection().find_one({'_id': CHECKPOINT_ID})
+
+
+async def test_recompute_statistics_rebuilds_rollups(app, user, post):
+    insert_comment_created_at(post, user, '2024-08-30T10:00:00Z')
+    insert_comment_created_at(post, user, '2024-09-01T10:00:00Z')
+    insert_comment_created_at(post, user, '2024-09-02T10:00:00Z')
+    get_statistic_rollup_collection().insert_one({'granularity': 'month', 'bucket': '2024-08', 'post_id': None,
+                                                  'created_comments': 100, 'blocked_comments': 1})
+
+    recompute_statistics(datetime(2024, 8, 30), datetime(2024, 9, 2), rollups=True, chunk_days=2)
+
+    def get_created_comments(granularity, bucket, post_id=None):
+        rollup = get_statistic_rollup_collection().find_one({'granularity': granularity, 'bucket': bucket,
+                                                            'post_id': post_id})
+        return rollup.get('created_comments') if rollup else 0
+
+    assert get_created_comments('month', '2024-08') == 1
+    assert get_created_comments('month', '2024-09', post) == 2
+    assert get_created_comments('week', '2024-08-26') == 2
+    assert get_created_comments('week', '2024-09-02', post) == 1
+    assert get_created_comments('day', '2024-09-01', post) == 1
+    assert get_created_comments('hour', '2024-08-30T10') == 1
+    assert get_statistic_collection().find_one({'date': '2024-09-02'}).get('created_comments') == 1
+
+
+async def test_recompute_statistics_is_resumed_from_checkpoint(app, user, post):
+    insert_comment_created_at(post, user, '2024-08-14T10:00:00Z')
+    insert_comment_created_at(post, user, '2024-08-16T10:00:00Z')
+    get_statistics_recompute_collection().insert_one({'_id': CHECKPOINT_ID, 'date_from': '2024-08-14',
+                                                      'date_to': '2024-08-16', 'rollups': False,
+                                                      'include_today': False, 'processed_to': '2024-08-15'})
+
+    recompute_statistics(datetime(2024, 8, 14), datetime(2024, 8, 16))
+
+    assert not get_statistic_collection().find_one({'date': '2024-08-14'})
+    assert get_statistic_collection().find_one({'date': '2024-08-16'}).get('created_comments') == 1
+
+
+async def test_answer_to_comment_loads_post_and_comment_by_id(app, post, comment):
+    await answer_to_comment(post, comment.id)
+
+    answer = get_comment_collection().find_one({'answered_comment_id': comment.id})
+    assert answer
+    assert answer.get('post_author_answer')
+    assert answer.get('post_id') == post
+
+
+async def test_answer_to_deleted_comment_is_not_created(app, post, comment):
+    delete_comment_in_db(comment.id)
+
+    await answer_to_comment(post, comment.id)
+
+    assert not get_comment_collection().count_documents({})
+
+
+async def test_delete_post_comments_batch(app, post, post2, comment, comment2, comment_to_another_post):
     document_count = get_comment_collection().count_documents({})
     assert document_count == 3
 
-    delete_all_comments_related_to_post(post)
+    assert delete_post_comments_batch(post, batch_size=1) == 1
+    assert not get_comment_collection().find_one({'_id': min(comment.id, comment2.id)})
+
+    assert delete_post_comments_batch(post, batch_size=1) == 1
+    assert delete_post_comments_batch(post, batch_size=1) == 0
 
     document_count = get_comment_collection().count_documents({})
     assert document_count == 1
 
     assert get_comment_collection().find_one({'_id': comment_to_another_post.id})
 
+
+async def test_cached_statistics_are_cleared_when_statistics_version_is_increased(comments_statistics):
+    statistics = get_comment_statistics_for_certain_period('2024-08-16', '2024-08-16')
+    assert statistics.get('items')[0].get('2024-08-16').get('created_comments') == 12
+
+    # statistics are changed by another process
+    get_statistic_collection().update_one({'date': '2024-08-16'}, {'$set': {'created_comments': 5}})
+    statistics = get_comment_statistics_for_certain_period('2024-08-16', '2024-08-16')
+    assert statistics.get('items')[0].get('2024-08-16').get('created_comments') == 12
+
+    increase_statistics_version()
+    statistics = get_comment_statistics_for_certain_period('2024-08-16', '2024-08-16')
+    assert statistics.get('items')[0].get('2024-08-16').get('created_comments') == 5
@@ -0,0 +1,48 @@
+from unittest.mock import MagicMock
+
+import pytest
+from pymongo.errors import OperationFailure
+
+from app import indexes as indexes_module
+from app.database import get_collection_by_name, POST_DOC, STATISTICS_DOC
+from app.exceptions import IndexMigrationError
+from app.indexes import INDEXES, check_query_plans, sync_indexes
+
+
+async def test_sync_indexes_creates_declared_indexes(app):
+    for collection_name, indexes in INDEXES.items():
+        existing_indexes = get_collection_by_name(collection_name).index_information()
+        for index in indexes:
+            assert index.document.get('name') in existing_indexes
+
+
+async def test_service_queries_do_not_use_collection_scan(app):
+    assert not check_query_plans()
+
+
+async def test_sync_indexes_fails_with_migration_error_when_unique_index_has_duplicates(app, user):
+    posts_collection = get_collection_by_name(POST_DOC)
+    posts_collection.drop_indexes()
+    posts_collection.insert_many([{'user_id': user, 'title': 'title', 'text': 'text'} for _ in range(2)])
+
+    with pytest.raises(IndexMigrationError, match='title'):
+        sync_indexes()
+
+
+async def test_sync_indexes_keeps_conflicting_unique_index_when_collection_has_duplicates(app, monkeypatch):
+    statistics_collection = get_collection_by_name(STATISTICS_DOC)
+    statistics_collection.drop_indexes()
+    statistics_collection.insert_many([{'date': '2024-01-01', 'count': 1} for _ in range(2)])
+
+    def create_indexes(indexes):
+        raise OperationFailure('index options conflict', code=85)
+
+    monkeypatch.setattr(statistics_collection, 'create_indexes', create_indexes)
+    monkeypatch.setattr(indexes_module, 'INDEXES', {STATISTICS_DOC: INDEXES[STATISTICS_DOC]})
+    monkeypatch.setattr(indexes_module, 'get_collection_by_name', lambda collection_name: statistics_collection)
+    drop_index = MagicMock()
+    monkeypatch.setattr(statistics_collection, 'drop_index', drop_index)
+
+    with pytest.raises(IndexMigrationError, match='2024-01-01'):
+        sync_indexes()
+    drop_index.assert_not_called()
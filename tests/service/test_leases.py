@@ -0,0 +1,28 @@
+from datetime import datetime, timedelta
+
+from app.database import get_lease_collection
+from app.leases import acquire_lease, release_lease
+
+
+async def test_lease_is_held_by_single_owner(app):
+    assert acquire_lease('scheduler', 'worker-1', ttl_seconds=30)
+    assert not acquire_lease('scheduler', 'worker-2', ttl_seconds=30)
+    assert acquire_lease('scheduler', 'worker-1', ttl_seconds=30)
+
+
+async def test_expired_lease_is_taken_over(app):
+    assert acquire_lease('scheduler', 'worker-1', ttl_seconds=30)
+    get_lease_collection().update_one({'_id': 'scheduler'},
+                                      {'$set': {'expires_at': datetime.utcnow() - timedelta(seconds=1)}})
+
+    assert acquire_lease('scheduler', 'worker-2', ttl_seconds=30)
+    assert not acquire_lease('scheduler', 'worker-1', ttl_seconds=30)
+
+
+async def test_released_lease_can_be_acquired(app):
+    assert acquire_lease('scheduler', 'worker-1', ttl_seconds=30)
+    release_lease('scheduler', 'worker-2')
+    assert not acquire_lease('scheduler', 'worker-2', ttl_seconds=30)
+
+    release_lease('scheduler', 'worker-1')
+    assert acquire_lease('scheduler', 'worker-2', ttl_seconds=30)
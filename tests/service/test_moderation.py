@@ -0,0 +1,209 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import HTTPException
+
+from app.config import get_settings
+from app.settings.base import AIFailurePolicyTypes
+from app.vertex_ai_core import moderation
+from app.vertex_ai_core.exceptions import OffensiveLanguageError
+from app.vertex_ai_core.moderation import validate_texts_with_ai, ModerationBatcher, validate_text_with_ai
+from app.vertex_ai_core.prompts import get_batch_validation_prompt, clear_batch_response, \
+    parse_batch_validation_response, parse_batch_generation_response
+from app.vertex_ai_core.backends import LocalAIBackend
+
+
+async def test_get_batch_validation_prompt():
+    prompt = get_batch_validation_prompt([{'text': 'first comment'}, {'text': 'second comment'}])
+
+    assert "{'id': 0, 'data': {'text': 'first comment'}}" in prompt
+    assert "{'id': 1, 'data': {'text': 'second comment'}}" in prompt
+
+
+async def test_clear_batch_response():
+    response = '```json\n[{"id": 0, "result": true, "failed_fields": []}]\n```'
+
+    cleared_response = json.loads(clear_batch_response(response))
+    assert cleared_response == [{'id': 0, 'result': True, 'failed_fields': []}]
+
+
+async def test_parse_batch_validation_response_skips_invalid_items():
+    response = '[{"id": 1, "result": false, "failed_fields": ["text"]}, {"id": 7, "result": true}, {"id": 0}]'
+
+    results = parse_batch_validation_response(response, 2)
+    assert results == [None, {'result': False, 'failed_fields': ['text']}]
+
+
+async def test_parse_batch_generation_response_skips_invalid_items():
+    response = '```json\n[{"id": 1, "answer": "Thanks!"}, {"id": 0, "answer": ""}, {"id": 5, "answer": "x"}]\n```'
+
+    assert parse_batch_generation_response(response, 2) == [None, 'Thanks!']
+
+
+async def test_local_backend_validates_texts_using_lexicon():
+    backend = LocalAIBackend()
+
+    assert await backend.validate({'text': 'some comment'}) == {'result': True, 'failed_fields': []}
+    assert len(await backend.validate_batch([{'text': 'first'}, {'text': 'second'}])) == 2
+    assert await backend.generate_answer('post', 'comment')
+    assert len(await backend.generate_answers('post', ['first', 'second'])) == 2
+
+
+async def test_validate_texts_with_ai_uses_single_batch_request(monkeypatch):
+    batches = []
+
+    async def validate_batch(items):
+        batches.append(items)
+        return [{'result': 'offensive' not in item['text'], 'failed_fields': ['text']} for item in items]
+
+    monkeypatch.setattr(get_settings(), 'USE_AI_FOR_TEXT_VALIDATION', True)
+    monkeypatch.setattr(moderation, 'get_results_of_ai_batch_validation', validate_batch)
+
+    errors = await validate_texts_with_ai([{'text': 'first comment'}, {'text': 'offensive comment'}, {'text': 'ok'}])
+
+    assert len(batches) == 1
+    assert batches[0] == [{'text': 'first comment'}, {'text': 'offensive comment'}]
+    assert errors[0] is None
+    assert isinstance(errors[1], OffensiveLanguageError)
+    assert errors[2] is None
+
+
+async def test_moderation_batcher_flushes_batch_when_window_expires(monkeypatch):
+    batches = []
+
+    async def validate_batch(items):
+        batches.append(items)
+        return [{'result': True, 'failed_fields': []} for _ in items]
+
+    monkeypatch.setattr(moderation, 'get_results_of_ai_batch_validation', validate_batch)
+    batcher = ModerationBatcher(window_seconds=0.01, max_items=10)
+
+    results = await asyncio.wait_for(asyncio.gather(batcher.validate({'text': 'first'}),
+                                                    batcher.validate({'text': 'second'})), timeout=1)
+
+    assert batches == [[{'text': 'first'}, {'text': 'second'}]]
+    assert results == [{'result': True, 'failed_fields': []}] * 2
+
+
+async def test_moderation_batcher_flushes_batch_when_max_items_is_reached(monkeypatch):
+    batches = []
+
+    async def validate_batch(items):
+        batches.append(items)
+        return [{'result': True, 'failed_fields': []} for _ in items]
+
+    monkeypatch.setattr(moderation, 'get_results_of_ai_batch_validation', validate_batch)
+    batcher = ModerationBatcher(window_seconds=60, max_items=2)
+
+    await asyncio.wait_for(asyncio.gather(*(batcher.validate({'text': text}) for text in ('a', 'b', 'c', 'd'))),
+                           timeout=1)
+
+    assert batches == [[{'text': 'a'}, {'text': 'b'}], [{'text': 'c'}, {'text': 'd'}]]
+
+
+async def test_moderation_batcher_returns_result_of_every_item_to_its_request(monkeypatch):
+    async def validate_batch(items):
+        return [{'result': 'offensive' not in item['text'], 'failed_fields': [item['text']]} for item in items]
+
+    monkeypatch.setattr(moderation, 'get_results_of_ai_batch_validation', validate_batch)
+    batcher = ModerationBatcher(window_seconds=0.01, max_items=10)
+
+    results = await asyncio.gather(batcher.validate({'text': 'first'}), batcher.validate({'text': 'offensive'}),
+                                   batcher.validate({'text': 'third'}))
+
+    assert results == [{'result': True, 'failed_fields': ['first']},
+                       {'result': False, 'failed_fields': ['offensive']},
+                       {'result': True, 'failed_fields': ['third']}]
+
+
+async def test_moderation_batcher_validates_separately_items_not_answered_in_batch(monkeypatch):
+    validated_items = []
+
+    async def validate_batch(items):
+        return [None if item['text'] == 'skipped' else {'result': True, 'failed_fields': []} for item in items]
+
+    async def validate(data):
+        validated_items.append(data)
+        return {'result': False, 'failed_fields': ['text']}
+
+    monkeypatch.setattr(moderation, 'get_results_of_ai_batch_validation', validate_batch)
+    monkeypatch.setattr(moderation, 'get_result_of_ai_validation', validate)
+    batcher = ModerationBatcher(window_seconds=0.01, max_items=10)
+
+    results = await asyncio.gather(batcher.validate({'text': 'first'}), batcher.validate({'text': 'skipped'}))
+
+    assert validated_items == [{'text': 'skipped'}]
+    assert results == [{'result': True, 'failed_fields': []}, {'result': False, 'failed_fields': ['text']}]
+
+
+async def test_moderation_batcher_fails_every_request_when_batch_fails(monkeypatch):
+    async def validate_batch(items):
+        raise RuntimeError('model is unavailable')
+
+    monkeypatch.setattr(moderation, 'get_results_of_ai_batch_validation', validate_batch)
+    batcher = ModerationBatcher(window_seconds=0.01, max_items=10)
+
+    results = await asyncio.gather(batcher.validate({'text': 'first'}), batcher.validate({'text': 'second'}),
+                                   return_exceptions=True)
+
+    assert len(results) == 2
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+async def test_moderation_batcher_fails_waiting_requests_when_batch_task_fails(monkeypatch):
+    async def validate_batch(items):
+        return None
+
+    monkeypatch.setattr(moderation, 'get_results_of_ai_batch_validation', validate_batch)
+    batcher = ModerationBatcher(window_seconds=0.01, max_items=10)
+
+    with pytest.raises(TypeError):
+        await asyncio.wait_for(batcher.validate({'text': 'first'}), timeout=1)
+    assert not batcher._tasks
+
+
+async def test_moderation_batcher_validates_collected_batch_on_close(monkeypatch):
+    async def validate_batch(items):
+        return [{'result': True, 'failed_fields': []} for _ in items]
+
+    monkeypatch.setattr(moderation, 'get_results_of_ai_batch_validation', validate_batch)
+    batcher = ModerationBatcher(window_seconds=60, max_items=10)
+
+    request = asyncio.ensure_future(batcher.validate({'text': 'first'}))
+    await asyncio.sleep(0)
+    await batcher.close()
+
+    assert await asyncio.wait_for(request, timeout=1) == {'result': True, 'failed_fields': []}
+    assert not batcher._tasks
+
+
+@pytest.mark.parametrize('validation_result', [None, 'true', [True], {'result': 'yes'}])
+async def test_malformed_ai_validation_result_follows_failure_policy(validation_result, monkeypatch):
+    async def validate(data):
+        return validation_result
+
+    monkeypatch.setattr(get_settings(), 'USE_AI_FOR_TEXT_VALIDATION', True)
+    monkeypatch.setattr(moderation.moderation_batcher, 'validate', validate)
+
+    monkeypatch.setattr(get_settings(), 'AI_FAILURE_POLICY', AIFailurePolicyTypes.fail_closed)
+    with pytest.raises(HTTPException):
+        await validate_text_with_ai({'text': 'some comment'})
+
+    monkeypatch.setattr(get_settings(), 'AI_FAILURE_POLICY', AIFailurePolicyTypes.fail_open)
+    await validate_text_with_ai({'text': 'some comment'})
+
+
+async def test_malformed_ai_batch_validation_result_follows_failure_policy(monkeypatch):
+    async def validate_batch(items):
+        return ['true' for _ in items]
+
+    monkeypatch.setattr(get_settings(), 'USE_AI_FOR_TEXT_VALIDATION', True)
+    monkeypatch.setattr(moderation, 'get_results_of_ai_batch_validation', validate_batch)
+
+    monkeypatch.setattr(get_settings(), 'AI_FAILURE_POLICY', AIFailurePolicyTypes.fail_closed)
+    with pytest.raises(HTTPException):
+        await validate_texts_with_ai([{'text': 'first comment'}, {'text': 'second comment'}])
+
+    monkeypatch.setattr(get_settings(), 'AI_FAILURE_POLICY', AIFailurePolicyTypes.fail_open)
+    assert await validate_texts_with_ai([{'text': 'first comment'}, {'text': 'second comment'}]) == [None, None]
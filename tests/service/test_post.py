@@ -1,8 +1,16 @@
 import pytest
 
-from app.database import get_post_collection
-from app.post.service import find_post_by_id, create_post_in_db, update_post, delete_post_in_db, \
-    check_post_duplication_from_user
+from datetime import datetime
+
+from pymongo.errors import DuplicateKeyError
+
+from app.background_tasks import purge_deleted_posts
+from app.comments.service import update_comments_statistics
+from app.database import get_post_collection, get_comment_collection, get_reply_queue_collection, \
+    get_statistic_rollup_collection
+from app.post import repository
+from app.post.service import find_post_by_id, create_post_in_db, update_post, delete_post_in_db
+from app.replies.service import enqueue_reply
 from tests.conftest import POST_DATA
 
 
@@ -10,11 +18,11 @@ async def test_user_can_create_post_in_db(app, user):
     number_of_existing_posts = get_post_collection().count_documents({})
     assert not number_of_existing_posts
 
-    created_post_id = create_post_in_db(POST_DATA.copy(), user_id=user)
-    assert created_post_id
+    returned_post = create_post_in_db(POST_DATA.copy(), user_id=user)
+    assert returned_post.get('_id')
 
-    created_post = get_post_collection().find_one({'_id': created_post_id})
-    assert created_post
+    created_post = get_post_collection().find_one({'_id': returned_post.get('_id')})
+    assert created_post == returned_post
     assert created_post.get('text') == POST_DATA.get('text')
     assert created_post.get('user_id') == user
 
@@ -34,12 +42,15 @@ async def test_update_post(app, post):
 
     assert new_data.get('title') != old_post.get('title')
 
-    updated_post_id = update_post(post, new_data)
-    assert updated_post_id
-
-    updated_post = find_post_by_id(updated_post_id)
+    updated_post = update_post(post, new_data)
     assert updated_post.get('title') == new_data.get('title')
     assert updated_post.get('_id') == old_post.get('_id')
+    assert updated_post == find_post_by_id(post)
+
+
+async def test_update_post_of_another_user(app, post, user2):
+    assert update_post(post, {'title': 'changed'}, user_id=user2) is None
+    assert find_post_by_id(post).get('title') != 'changed'
 
 
 async def test_delete_post(app, post):
@@ -49,14 +60,35 @@ async def test_delete_post(app, post):
     result = delete_post_in_db(post)
     assert result
 
-    existing_posts_count = get_post_collection().count_documents({})
-    assert not existing_posts_count
+    assert not find_post_by_id(post)
+    assert not delete_post_in_db(post)
+
 
+async def test_purge_deleted_posts(app, post, post2, comment, comment_to_another_post):
+    enqueue_reply(post, comment.id, datetime.utcnow())
+    update_comments_statistics(increase_created_comments=True, post_id=post)
+    delete_post_in_db(post)
 
-async def test_check_post_duplication_from_user(app, post):
-    post_data = find_post_by_id(post)
-    assert post_data
+    await purge_deleted_posts()
 
-    assert check_post_duplication_from_user(post_data.get('title'), post_data.get('user_id'))
-    assert not check_post_duplication_from_user('new_title', post_data.get('user_id'))
+    assert not get_post_collection().find_one({'_id': post})
+    assert not get_comment_collection().find_one({'_id': comment.id})
+    assert not get_reply_queue_collection().count_documents({})
+    assert not get_statistic_rollup_collection().count_documents({'post_id': post})
+    assert get_statistic_rollup_collection().count_documents({'post_id': None})
 
+    assert get_post_collection().find_one({'_id': post2})
+    assert get_comment_collection().find_one({'_id': comment_to_another_post.id})
+
+
+async def test_user_cant_create_posts_with_the_same_title(app, user, user2, post):
+    with pytest.raises(DuplicateKeyError):
+        create_post_in_db(POST_DATA.copy(), user_id=user)
+
+    assert create_post_in_db(POST_DATA.copy(), user_id=user2)
+
+
+async def test_find_post_by_id_in_repository(app, post):
+    found_post = await repository.find_post_by_id(post)
+    assert found_post
+    assert found_post.get('_id') == post
@@ -0,0 +1,41 @@
+import pytest
+
+from app.config import get_settings
+from app.vertex_ai_core.prefilter import AhoCorasickMatcher, ModerationPrefilter, PrefilterVerdict
+
+
+async def test_matcher_finds_all_patterns():
+    matcher = AhoCorasickMatcher(['he', 'she', 'his', 'hers'])
+
+    found_patterns = sorted(matcher.find_all('ushers'))
+    assert found_patterns == [(1, 'she'), (2, 'he'), (2, 'hers')]
+
+
+async def test_matcher_finds_only_separate_words():
+    matcher = AhoCorasickMatcher(['ass', 'bad word'])
+
+    assert matcher.contains_word('you are an ass!')
+    assert matcher.contains_word('this is a bad word')
+    assert not matcher.contains_word('first class passenger')
+
+
+async def test_prefilter_verdicts():
+    prefilter = ModerationPrefilter(blocked_words=['Idiot'], allowed_texts=['Nice post!'], short_text_length=3)
+
+    assert prefilter.check({'title': 'Post', 'text': 'you are  IDIOT'}) == (PrefilterVerdict.block, ['text'])
+    assert prefilter.check({'text': 'nice   post!'}) == (PrefilterVerdict.allow, [])
+    assert prefilter.check({'text': 'ok'}) == (PrefilterVerdict.allow, [])
+    assert prefilter.check({'text': 'some longer comment'}) == (PrefilterVerdict.ask_model, [])
+
+
+async def test_prefilter_blocks_short_blocked_words():
+    prefilter = ModerationPrefilter(blocked_words=['bad'], allowed_texts=[], short_text_length=3)
+
+    assert prefilter.check({'text': 'Bad'}) == (PrefilterVerdict.block, ['text'])
+
+
+async def test_prefilter_asks_model_about_texts_of_minimal_length_by_default():
+    prefilter = ModerationPrefilter(blocked_words=[], allowed_texts=[],
+                                    short_text_length=get_settings().MODERATION_SHORT_TEXT_LENGTH)
+
+    assert prefilter.check({'text': 'abc'}) == (PrefilterVerdict.ask_model, [])
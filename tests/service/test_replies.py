@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta
+
+from app import background_tasks
+from app.background_tasks import process_reply_queue
+from app.database import get_comment_collection, get_reply_queue_collection
+from app.replies.service import enqueue_reply, claim_due_replies
+
+
+async def test_enqueue_reply_adds_comment_once(app, post, comment):
+    enqueue_reply(post, comment.id, datetime.utcnow())
+    enqueue_reply(post, comment.id, datetime.utcnow())
+
+    assert get_reply_queue_collection().count_documents({}) == 1
+
+
+async def test_claimed_replies_are_not_claimed_again(app, post, comment, comment2):
+    enqueue_reply(post, comment.id, datetime.utcnow() - timedelta(minutes=1))
+    enqueue_reply(post, comment2.id, datetime.utcnow() + timedelta(minutes=10))
+
+    replies = claim_due_replies(limit=10, claim_timeout_seconds=60)
+    assert [reply['_id'] for reply in replies] == [comment.id]
+
+    assert not claim_due_replies(limit=10, claim_timeout_seconds=60)
+
+
+async def test_process_reply_queue_answers_due_comments(app, post, comment, comment2):
+    enqueue_reply(post, comment.id, datetime.utcnow() - timedelta(minutes=1))
+    enqueue_reply(post, comment2.id, datetime.utcnow() - timedelta(minutes=1))
+
+    await process_reply_queue()
+
+    answers = list(get_comment_collection().find({'post_author_answer': True}))
+    assert {answer.get('answered_comment_id') for answer in answers} == {comment.id, comment2.id}
+    assert not get_reply_queue_collection().count_documents({})
+
+
+async def test_not_generated_answers_are_returned_to_queue(app, post, comment, monkeypatch):
+    async def generate_nothing(post_data, comments):
+        return [None] * len(comments)
+
+    monkeypatch.setattr(background_tasks, 'generate_answers_to_user_comments_as_author_of_post', generate_nothing)
+    enqueue_reply(post, comment.id, datetime.utcnow() - timedelta(minutes=1))
+
+    await process_reply_queue()
+
+    assert not get_comment_collection().count_documents({'post_author_answer': True})
+    reply = get_reply_queue_collection().find_one({'_id': comment.id})
+    assert reply.get('attempts') == 1
+    assert reply.get('run_at') > datetime.utcnow()
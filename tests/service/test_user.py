@@ -9,14 +9,14 @@ async def test_create_user(app):
     number_of_existing_users = get_user_collection().count_documents({})
     assert not number_of_existing_users
 
-    created_user_id = create_user(USER_DATA)
+    created_user = create_user(USER_DATA)
     number_of_existing_users = get_user_collection().count_documents({})
 
-    assert created_user_id
+    assert created_user.get('_id')
     assert number_of_existing_users
 
-    created_user_data = get_user_collection().find_one({'_id': created_user_id})
-    assert created_user_data
+    created_user_data = get_user_collection().find_one({'_id': created_user.get('_id')})
+    assert created_user_data == created_user
     assert created_user_data.get('email') == USER_DATA.get('email')
 
 
@@ -31,10 +31,9 @@ async def test_update_user(app, user):
     new_data = {'automatic_response_enabled': True}
     assert user_data.get('automatic_response_enabled') != new_data.get('automatic_response_enabled')
 
-    updated_user_id = update_user(user, new_data)
-    assert updated_user_id == user
-
-    updated_user_data = find_user_by_id(updated_user_id)
+    updated_user_data = update_user(user, new_data)
+    assert updated_user_data.get('_id') == user
+    assert updated_user_data == find_user_by_id(user)
 
     assert updated_user_data
     assert updated_user_data.get('automatic_response_enabled') == new_data.get('automatic_response_enabled')
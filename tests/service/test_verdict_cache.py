@@ -0,0 +1,42 @@
+import pytest
+
+from app.database import get_moderation_verdict_collection
+from app.vertex_ai_core.verdict_cache import get_cached_verdict, get_cached_verdicts, cache_verdict, get_verdict_key, \
+    local_verdict_cache
+
+VERDICT = {'result': True, 'failed_fields': []}
+
+
+async def test_verdict_key_ignores_case_and_whitespaces():
+    assert get_verdict_key({'text': 'Nice  post!'}) == get_verdict_key({'text': ' nice post! '})
+    assert get_verdict_key({'text': 'nice post!'}) != get_verdict_key({'title': 'nice post!'})
+
+
+async def test_cached_verdict_found_in_memory(app):
+    data = {'text': 'thanks'}
+    assert get_cached_verdict(data) is None
+
+    cache_verdict(data, VERDICT)
+
+    assert get_cached_verdict({'text': 'Thanks'}) == VERDICT
+
+
+async def test_cached_verdict_found_in_database(app):
+    data = {'text': '+1'}
+    cache_verdict(data, VERDICT)
+    local_verdict_cache.clear()
+
+    assert get_moderation_verdict_collection().count_documents({}) == 1
+    assert get_cached_verdict(data) == VERDICT
+
+
+async def test_cached_verdicts_found_in_memory_and_database(app):
+    cache_verdict({'text': 'first'}, VERDICT)
+    cache_verdict({'text': 'second'}, {'result': False, 'failed_fields': ['text']})
+    local_verdict_cache.clear()
+    cache_verdict({'text': 'third'}, VERDICT)
+
+    verdicts = get_cached_verdicts([{'text': 'first'}, {'text': 'missing'}, {'text': 'Second'}, {'text': 'third'}])
+
+    assert verdicts == [VERDICT, None, {'result': False, 'failed_fields': ['text']}, VERDICT]
+    assert get_verdict_key({'text': 'second'}) in local_verdict_cache